@@ -0,0 +1,158 @@
+### --- Classificação dos recursos a partir de outro script ou notebook --- ###
+
+### --- 1. Diretórios dos módulos --- ###
+import os
+import sys
+
+# Os módulos do algoritmo são importados pelo nome (ver tasks.py). As bibliotecas pesadas (pandas,
+# prefect, basedosdados, folium) são importadas apenas quando a classificação é executada.
+DIRETORIO_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+for diretorio in ['', 'queries', 'data_processing', 'dataviz']:
+    if os.path.join(DIRETORIO_SCRIPTS, diretorio).rstrip(os.sep) not in sys.path:
+        sys.path.append(os.path.join(DIRETORIO_SCRIPTS, diretorio).rstrip(os.sep))
+
+
+### --- 2. Configuração --- ###
+
+# Configuração padrão da classificação. Cada opção corresponde a uma flag de execução (ver run.py).
+# Todas as opções são aplicadas a cada classificação: as opções não informadas voltam ao valor padrão,
+# mesmo que tenham sido alteradas em uma classificação anterior no mesmo processo.
+CONFIGURACAO_PADRAO = {
+    'backend': 'bigquery',                        # 'bigquery' ou 'duckdb' (ver query_backends.py)
+    'diretorio_local': '../data/local',           # tabelas em parquet do backend duckdb
+    'cota_cache_gb': 5,                           # espaço máximo das consultas guardadas
+    'atualizar_cache': False,                     # ignora o cache e consulta novamente o Big Query
+    'max_consultas_simultaneas': 4,               # consultas executadas ao mesmo tempo
+    'particoes': None,                            # partições da amostra por data (padrão: núcleos do processador)
+    'tabelas_intermediarias': False,              # grava as tabelas intermediárias em data/treated
+    'formato_tabelas_intermediarias': 'parquet',  # 'parquet', 'csv' ou 'xlsx'
+    'diretorio_log': './log',                     # diretório do arquivo de log (None: apenas no console)
+    'nao_interativo': False,                      # não pergunta ao usuário (ver unattended_mode.py)
+    'orcamento_gb': 10.0,                         # GB lidos liberados no modo não interativo
+    'reprocessamento': None,                      # comando no terminal ou função que executa o DBT reprocessado
+    'arquivo_sinal_reprocessamento': None,        # arquivo atualizado quando o reprocessamento termina
+    'checkpoints_etapas': True,                   # retoma a execução a partir das etapas guardadas
+    'atualizar_etapas': False,                    # executa novamente todas as etapas
+    'diretorio_metricas': './log',                # diretório do arquivo de métricas (None: apenas o resumo no log)
+}
+
+
+def classification_config(configuracao: dict = None) -> dict:
+    """
+    Completa a configuração informada com os valores de CONFIGURACAO_PADRAO.
+
+    Exemplos:
+    >>> classification_config({'backend': 'duckdb'})['particoes']
+    """
+    configuracao = dict(configuracao or {})
+
+    desconhecidas = sorted(set(configuracao) - set(CONFIGURACAO_PADRAO))
+    if desconhecidas:
+        raise ValueError(f'Opções de configuração desconhecidas: {", ".join(desconhecidas)}. '
+                         f'Opções: {", ".join(CONFIGURACAO_PADRAO)}.')
+
+    configuracao = {**CONFIGURACAO_PADRAO, **configuracao}
+    if configuracao['particoes'] is not None and configuracao['particoes'] < 1:
+        raise ValueError('A quantidade de partições deve ser maior ou igual a 1.')
+    if configuracao['orcamento_gb'] is not None and configuracao['orcamento_gb'] < 0:
+        raise ValueError('O orçamento de GB lidos deve ser maior ou igual a 0.')
+
+    return configuracao
+
+
+def apply_configuration(configuracao: dict) -> None:
+    """
+    Aplica todas as opções da configuração (completa, ver classification_config) aos módulos do
+    algoritmo e remove os dados carregados em uma classificação anterior no mesmo processo (ver
+    reset_registry), para que mudanças de backend, de diretório local ou da amostra não reaproveitem
+    dados de outra execução.
+
+    Exemplos:
+    >>> apply_configuration(classification_config({'backend': 'duckdb'}))
+    """
+    from utils import configure_log_file
+    from cache_files import configure_query_cache
+    from query_backends import configure_query_backend
+    from slice_store import reset_registry
+    from fetch_scheduler import configure_fetch_scheduler
+    from debug_artifacts import configure_debug_artifacts
+    from unattended_mode import configure_unattended_mode
+    from stage_checkpoints import configure_stage_checkpoints
+
+    reset_registry()
+
+    configure_log_file(configuracao['diretorio_log'])
+    configure_query_cache(cota_gb=configuracao['cota_cache_gb'], atualizar=configuracao['atualizar_cache'])
+    configure_query_backend(backend=configuracao['backend'], diretorio_local=configuracao['diretorio_local'])
+    configure_fetch_scheduler(max_concorrencia=configuracao['max_consultas_simultaneas'])
+    configure_debug_artifacts(ativo=configuracao['tabelas_intermediarias'],
+                              formato=configuracao['formato_tabelas_intermediarias'])
+    configure_unattended_mode(ativo=configuracao['nao_interativo'], orcamento_gb=configuracao['orcamento_gb'],
+                              reprocessamento=configuracao['reprocessamento'],
+                              arquivo_sinal=configuracao['arquivo_sinal_reprocessamento'])
+    # Etapas guardadas com dados antigos não são lidas quando as consultas são refeitas
+    configure_stage_checkpoints(ativo=configuracao['checkpoints_etapas'],
+                                atualizar=configuracao['atualizar_etapas'] or configuracao['atualizar_cache'])
+
+
+### --- 3. Classificar a amostra --- ###
+
+def classify(amostra, configuracao: dict = None):
+    """
+    Classifica os recursos da amostra, executando o fluxo completo do algoritmo (ver flows.py). Os
+    arquivos de saída (tabela final, relatório e mapas) são gravados em data/output, relativos ao
+    diretório scripts, que deve ser o diretório de trabalho.
+
+    Parâmetros:
+    amostra (dataframe): Recursos a serem classificados, com as colunas do arquivo de input (ver
+    import_sample). O dataframe informado não é alterado.
+    configuracao (dict): Opções da classificação, as mesmas de CONFIGURACAO_PADRAO. As opções não
+    informadas usam o valor padrão (e não o valor de uma classificação anterior).
+
+    Retorna:
+    dataframe: A tabela final, com o status de cada recurso.
+
+    Exemplos:
+    >>> classify(amostra, {'backend': 'duckdb', 'particoes': 4})
+    """
+    configuracao = classification_config(configuracao)
+
+    from utils import log_info
+    from run_metrics import configure_run_metrics, metrics_summary
+    from slice_store import reset_registry
+    from fetch_scheduler import wait_fetches
+
+    apply_configuration(configuracao)
+
+    # As credenciais do Big Query são carregadas apenas quando as consultas são feitas no Big Query
+    if configuracao['backend'] == 'bigquery':
+        import set_credentials
+
+    from prefect.executors import LocalDaskExecutor
+    from flows import flow, tabela_final
+    from tasks import create_directories
+
+    create_directories()
+    log_info('Dependências carregadas com sucesso.')
+
+    # As partições da amostra são classificadas ao mesmo tempo, em threads do mesmo processo, para que
+    # compartilhem os dados já carregados na execução (ver slice_store.py)
+    particoes = configuracao['particoes'] or os.cpu_count() or 1
+    configure_run_metrics(configuracao['diretorio_metricas'])
+    try:
+        estado = flow.run(parameters={'amostra': amostra, 'particoes': particoes},
+                          executor=LocalDaskExecutor(scheduler='threads', num_workers=particoes))
+
+        # Resumo do tempo, da memória e das linhas de cada etapa (também quando a execução falha)
+        log_info(f'Métricas da execução por etapa:\n{metrics_summary().to_string()}')
+
+        if not estado.is_successful():
+            raise RuntimeError(f'A classificação dos recursos falhou: {estado.message}')
+
+        return estado.result[tabela_final].result
+    finally:
+        # A tabela final já está pronta: os dados carregados na execução (inclusive os das buscas
+        # antecipadas ainda em andamento) são liberados, também quando a classificação falha
+        wait_fetches()
+        reset_registry()
@@ -0,0 +1,263 @@
+### --- Leitura e escrita do cache das consultas --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+from utils import *
+from treat_data import *
+from query_backends import *
+
+
+### --- 2. Esquemas --- ###
+
+DIRETORIO_CACHE = '../data/cache'
+DIRETORIO_CONSULTAS = os.path.join(DIRETORIO_CACHE, 'consultas')
+
+# Tipos das colunas de cada tabela guardada no cache. No parquet, as colunas de texto (ids e serviços)
+# são gravadas com codificação de dicionário e as datas como timestamp.
+ESQUEMAS_CACHE = {
+    'viagem_completa': TIPOS_VIAGENS,
+    'viagem_conformidade': TIPOS_VIAGENS,
+    'dados_gps': TIPOS_GPS,
+    'dados_gps_shape': TIPOS_SHAPES,
+    'viagem_planejada': {**TIPOS_SERVICOS, **TIPOS_SHAPES},
+}
+
+# Trava do índice das consultas guardadas, que pode ser alterado por consultas simultâneas (ver fetch_scheduler.py)
+TRAVA_CACHE = threading.Lock()
+
+# Configuração do cache das consultas, alterada pelas flags de execução (ver tasks.py)
+CONFIGURACAO_CACHE = {
+    'cota_bytes': 5 * 1024 ** 3,  # espaço máximo em disco ocupado pelas consultas guardadas
+    'atualizar': False,           # ignora as consultas guardadas e consulta novamente o Big Query
+}
+
+
+### --- 3. Dados compartilhados entre as etapas da execução --- ###
+
+def cache_path(nome: str, formato: str = 'parquet') -> str:
+    """
+    Retorna o caminho do arquivo de cache de uma tabela.
+
+    Exemplos:
+    >>> cache_path('dados_gps_shape')
+    '../data/cache/dados_gps_shape.parquet'
+    """
+    return os.path.join(DIRETORIO_CACHE, f'{nome}.{formato}')
+
+
+def write_cache(dados: pd.DataFrame, nome: str) -> pd.DataFrame:
+    """
+    Grava uma tabela no cache em parquet (comprimido com zstd), com as colunas convertidas para os tipos
+    do esquema da tabela. É usada para passar os shapes da execução atual para a geração dos mapas
+    (automate_map). Os sinais de GPS são passados por data e veículo (ver gps_store.py).
+
+    Parâmetros:
+    dados (dataframe): Tabela retornada pela consulta.
+    nome (str): Nome da tabela, uma das chaves de ESQUEMAS_CACHE.
+
+    Retorna:
+    dataframe: A tabela com as colunas nos tipos do esquema.
+
+    Exemplos:
+    >>> dados_shape = write_cache(dados_shape, 'dados_gps_shape')
+    """
+    dados = cast_columns(dados, ESQUEMAS_CACHE[nome])
+    dados.to_parquet(cache_path(nome), index=False, compression='zstd', use_dictionary=True)
+
+    return dados
+
+
+def read_cache(nome: str) -> pd.DataFrame:
+    """
+    Lê uma tabela do cache. Caso exista apenas o cache antigo em csv, ele é lido e convertido para os
+    tipos do esquema da tabela.
+
+    Parâmetros:
+    nome (str): Nome da tabela, uma das chaves de ESQUEMAS_CACHE.
+
+    Retorna:
+    dataframe: A tabela com as colunas nos tipos do esquema.
+
+    Exemplos:
+    >>> dados_shape = read_cache('dados_gps_shape')
+    """
+    if os.path.exists(cache_path(nome)):
+        return pd.read_parquet(cache_path(nome))
+
+    log_info(f'Cache em parquet não encontrado para {nome}. Lendo o cache em csv.')
+    dados = pd.read_csv(cache_path(nome, formato='csv'))
+
+    return cast_columns(dados, ESQUEMAS_CACHE[nome])
+
+
+### --- 4. Cache das consultas --- ###
+
+def configure_query_cache(cota_gb: float = None, atualizar: bool = None) -> None:
+    """
+    Altera a configuração do cache das consultas.
+
+    Parâmetros:
+    cota_gb (float): Espaço máximo em disco, em GB, ocupado pelas consultas guardadas.
+    atualizar (bool): Se True, as consultas são sempre refeitas no Big Query (e o cache é regravado).
+
+    Exemplos:
+    >>> configure_query_cache(cota_gb=2, atualizar=True)
+    """
+    if cota_gb is not None:
+        CONFIGURACAO_CACHE['cota_bytes'] = int(cota_gb * 1024 ** 3)
+    if atualizar is not None:
+        CONFIGURACAO_CACHE['atualizar'] = atualizar
+
+
+def normalize_sql_values(valores: str) -> list:
+    """
+    Converte uma lista de valores no formato do filtro SQL (como retornado por query_values) em uma
+    lista ordenada e sem repetições, para que a ordem dos valores não altere a chave do cache.
+
+    Exemplos:
+    >>> normalize_sql_values("'2022-11-21','2022-11-20','2022-11-21'")
+    ['2022-11-20', '2022-11-21']
+    """
+    return sorted({valor.strip().strip("'") for valor in str(valores).split(',') if valor.strip()})
+
+
+def query_cache_key(consulta: str, parametros: dict) -> str:
+    """
+    Calcula a chave do cache de uma consulta a partir do hash dos seus parâmetros normalizados.
+    """
+    texto = json.dumps({'consulta': consulta, **parametros}, sort_keys=True, default=str)
+
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:32]
+
+
+def read_cache_index() -> dict:
+    """
+    Lê o índice das consultas guardadas, com o arquivo, o tamanho e o último acesso de cada uma.
+    """
+    caminho = os.path.join(DIRETORIO_CONSULTAS, 'indice.json')
+    if not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def write_cache_index(indice: dict) -> None:
+    """
+    Grava o índice das consultas guardadas.
+    """
+    os.makedirs(DIRETORIO_CONSULTAS, exist_ok=True)
+    with open(os.path.join(DIRETORIO_CONSULTAS, 'indice.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(indice, arquivo, ensure_ascii=False, indent=4)
+
+
+def evict_query_cache(indice: dict, manter: str = None) -> dict:
+    """
+    Remove as consultas usadas há mais tempo até que o espaço ocupado caiba na cota configurada.
+
+    Parâmetros:
+    indice (dict): Índice das consultas guardadas.
+    manter (str): Chave que não deve ser removida (a consulta que acabou de ser gravada).
+
+    Retorna:
+    dict: O índice sem as consultas removidas.
+    """
+    total = sum(entrada['tamanho'] for entrada in indice.values())
+
+    for chave in sorted(indice, key=lambda chave: indice[chave]['ultimo_acesso']):
+        if total <= CONFIGURACAO_CACHE['cota_bytes']:
+            break
+        if chave == manter:
+            continue
+
+        caminho = os.path.join(DIRETORIO_CONSULTAS, indice[chave]['arquivo'])
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        total -= indice[chave]['tamanho']
+        log_info(f"Cache: consulta {indice[chave]['consulta']} ({chave}) removida para liberar espaço.")
+        del indice[chave]
+
+    return indice
+
+
+def cached_query(consulta: str, parametros):
+    """
+    Decorador que guarda em disco o resultado de uma função de consulta ao Big Query, identificado pelo
+    hash dos parâmetros normalizados da consulta. Chamadas com os mesmos parâmetros leem o resultado
+    guardado, sem consultar novamente o Big Query. As consultas usadas há mais tempo são removidas
+    quando o espaço ocupado passa da cota (ver configure_query_cache).
+
+    Parâmetros:
+    consulta (str): Nome da consulta. Também define o esquema da tabela, caso exista em ESQUEMAS_CACHE.
+    parametros (function): Recebe os argumentos da função de consulta e retorna um dict com os
+    parâmetros normalizados, ou None quando o resultado não deve ser guardado.
+
+    Retorna:
+    function: A função de consulta com cache. A função original fica disponível em __wrapped__ e
+    is_cached(*args, **kwargs) informa se a consulta já está guardada.
+
+    Exemplos:
+    >>> @cached_query('viagem_planejada', planned_trips_query_parameters)
+    ... def query_planned_trips(data_servico_df, include_shape_direction=False, geometry_data=False):
+    """
+    def decorador(funcao):
+
+        def chave_consulta(*args, **kwargs):
+            parametros_normalizados = parametros(*args, **kwargs)
+            if parametros_normalizados is None:
+                return None
+            # Os resultados de um backend local (ver query_backends.py) não se misturam com os de produção
+            # nem com os de outros diretórios locais
+            if backend_identifier() is not None:
+                parametros_normalizados = {**parametros_normalizados, 'backend': backend_identifier()}
+            return query_cache_key(consulta, parametros_normalizados)
+
+        def is_cached(*args, **kwargs) -> bool:
+            chave = chave_consulta(*args, **kwargs)
+            if chave is None or CONFIGURACAO_CACHE['atualizar']:
+                return False
+            entrada = read_cache_index().get(chave)
+            return entrada is not None and os.path.exists(os.path.join(DIRETORIO_CONSULTAS, entrada['arquivo']))
+
+        @functools.wraps(funcao)
+        def funcao_com_cache(*args, **kwargs):
+            chave = chave_consulta(*args, **kwargs)
+            if chave is None:
+                return funcao(*args, **kwargs)
+
+            with TRAVA_CACHE:
+                if is_cached(*args, **kwargs):
+                    log_info(f'Cache: consulta {consulta} encontrada ({chave}).')
+                    indice = read_cache_index()
+                    dados = pd.read_parquet(os.path.join(DIRETORIO_CONSULTAS, indice[chave]['arquivo']))
+                    indice[chave]['ultimo_acesso'] = time.time()
+                    write_cache_index(indice)
+                    return dados
+
+            log_info(f'Cache: consulta {consulta} não encontrada ({chave}). Consultando o Big Query.')
+            dados = funcao(*args, **kwargs)
+            dados = cast_columns(dados, ESQUEMAS_CACHE.get(consulta, {}))
+
+            with TRAVA_CACHE:
+                os.makedirs(DIRETORIO_CONSULTAS, exist_ok=True)
+                arquivo = f'{consulta}_{chave}.parquet'
+                caminho = os.path.join(DIRETORIO_CONSULTAS, arquivo)
+                dados.to_parquet(caminho, index=False, compression='zstd', use_dictionary=True)
+
+                indice = read_cache_index()
+                indice[chave] = {'consulta': consulta, 'arquivo': arquivo, 'tamanho': os.path.getsize(caminho),
+                                 'ultimo_acesso': time.time()}
+                write_cache_index(evict_query_cache(indice, manter=chave))
+
+            return dados
+
+        funcao_com_cache.is_cached = is_cached
+        return funcao_com_cache
+
+    return decorador
@@ -1,22 +1,48 @@
 ### --- 1. Carregar bibliotecas --- ###
-import argparse
-from geopy.distance import geodesic
 import numpy as np
 import pandas as pd
-import re
 from utils import *
 from treat_data import *
+from cache_files import *
 from queries_functions import *
+from interval_search import *
+from geo_distance import *
+from radius_events import *
+from gps_store import *
+from debug_artifacts import *
+from run_metrics import *
 
-parser = argparse.ArgumentParser(description="Execute o script run.py com opções.")
-
-# permite usar o cache para não baixar novamente os dados da última consulta no big query
-parser.add_argument('--cache', action='store_true', help="Ative o cache")
-args = parser.parse_args()
-cache = "on" if args.cache else "off"
 
 ### --- 2. Função de verificação de viagens sobrepostas --- ###
 
+def inverted_overlaps(df: pd.DataFrame, invertidas: np.ndarray, validas: np.ndarray) -> np.ndarray:
+    """
+    Compara as viagens com chegada anterior à partida com as demais viagens do mesmo veículo. Duas viagens
+    são sobrepostas quando têm a mesma partida ou quando uma parte antes da chegada da outra e chega depois
+    da partida da outra (a mesma regra de remove_overlapping_trips, sem considerar a chegada no dia seguinte).
+
+    Parâmetros:
+    df (dataframe): Amostra, com as colunas id_veiculo, datetime_partida e datetime_chegada.
+    invertidas (array): Posições das viagens com chegada anterior à partida.
+    validas (array): Posições de todas as viagens com partida e chegada.
+
+    Retorna:
+    array: Posições das viagens duplicadas (a que aparece depois na amostra, em cada par sobreposto).
+    """
+    viagens = pd.DataFrame({'posicao': validas,
+                            'id_veiculo': df['id_veiculo'].to_numpy()[validas],
+                            'partida': df['datetime_partida'].to_numpy()[validas],
+                            'chegada': df['datetime_chegada'].to_numpy()[validas]})
+    pares = viagens[viagens['posicao'].isin(invertidas)].merge(viagens, on='id_veiculo', suffixes=('', '_outra'))
+    pares = pares[pares['posicao'] != pares['posicao_outra']]
+
+    sobrepostas = ((pares['partida'] == pares['partida_outra']) |
+                   ((pares['partida_outra'] < pares['chegada']) & (pares['chegada_outra'] > pares['partida'])))
+    pares = pares[sobrepostas]
+
+    return np.unique(np.maximum(pares['posicao'], pares['posicao_outra']).to_numpy())
+
+
 def remove_overlapping_trips(df: pd.DataFrame) -> pd.DataFrame:
     
     """
@@ -34,10 +60,14 @@ def remove_overlapping_trips(df: pd.DataFrame) -> pd.DataFrame:
     
     Notas:
     Caso o mesmo veículo inicie uma viagem no mesmo minuto do término da viagem anterior, não é considerada sobreposição de viagem.
+    Viagens com o mesmo horário de partida são sempre consideradas sobrepostas. Em cada par de viagens sobrepostas,
+    a viagem que aparece primeiro na amostra é mantida e a outra é classificada como duplicada.
+    Viagens com chegada anterior à partida (hora_fim menor que hora_inicio) são comparadas com as demais pela mesma regra,
+    sem considerar a chegada no dia seguinte.
     """
-    
+
     df_processed = df.copy()
-    
+
     # Converter as colunas para o tipo datetime
     df_processed['datetime_partida'] = pd.to_datetime(df_processed['datetime_partida'])
     df_processed['datetime_chegada'] = pd.to_datetime(df_processed['datetime_chegada'])
@@ -45,28 +75,38 @@ def remove_overlapping_trips(df: pd.DataFrame) -> pd.DataFrame:
     df_processed['servico'] = df_processed['servico'].astype(str)
     df_processed['status'] = np.nan
 
-    # Verificação de sobreposição
-    for index, row in df_processed.iterrows():
-        mask = (
-            (df_processed['id_veiculo'] == row['id_veiculo']) & 
-            (df_processed['datetime_partida'] <= row['datetime_chegada']) & 
-            (df_processed['datetime_chegada'] >= row['datetime_partida']) &
-            (df_processed.index != index)
-        )
-    
-        overlapping_rows = df_processed[mask]
-    
-        if overlapping_rows.shape[0] > 0:
-            for overlapping_index in overlapping_rows.index:
-                if df_processed.at[overlapping_index, 'datetime_partida'] == row['datetime_partida']:
-                    if overlapping_index > index:
-                        df_processed.at[overlapping_index, 'status'] = 'Viagem duplicada na amostra'
-                elif df_processed.at[overlapping_index, 'datetime_partida'] == row['datetime_chegada']:
-                    df_processed.at[index, 'status'] = np.nan
-                elif df_processed.at[overlapping_index, 'datetime_partida'] < row['datetime_chegada'] and df_processed.at[overlapping_index, 'datetime_chegada'] > row['datetime_partida']:
-                    if overlapping_index > index:
-                        df_processed.at[overlapping_index, 'status'] = 'Viagem duplicada na amostra'
-    
+    # Verificação de sobreposição: as viagens são ordenadas por veículo e partida, e cada viagem
+    # é comparada apenas com o bloco de viagens do mesmo veículo que partem durante a sua duração
+    validas = np.flatnonzero((df_processed['datetime_partida'].notna() & df_processed['datetime_chegada'].notna()).to_numpy())
+    invertidas = validas[(df_processed['datetime_chegada'].to_numpy()[validas] <
+                          df_processed['datetime_partida'].to_numpy()[validas])]
+    validas = np.setdiff1d(validas, invertidas)
+
+    partida = df_processed['datetime_partida'].to_numpy()[validas]
+    chegada = df_processed['datetime_chegada'].to_numpy()[validas]
+    veiculo = pd.factorize(df_processed['id_veiculo'].to_numpy()[validas])[0]
+
+    ordem = np.lexsort((validas, partida, veiculo))
+    veiculo, partida, chegada, posicao = veiculo[ordem], partida[ordem], chegada[ordem], validas[ordem]
+
+    # Bloco de cada viagem: viagens do mesmo veículo com partida no intervalo [partida, chegada)
+    inicio = group_searchsorted(veiculo, partida, veiculo, partida, side='left')
+    fim = np.maximum(group_searchsorted(veiculo, partida, veiculo, chegada, side='left'),
+                     group_searchsorted(veiculo, partida, veiculo, partida, side='right'))
+
+    # Uma viagem é duplicada se alguma viagem sobreposta (dentro do seu bloco ou cujo bloco
+    # a contém) aparece antes dela na amostra
+    primeira_sobreposta = np.minimum(range_min(posicao, inicio, fim),
+                                     range_min_cover(len(posicao), inicio, fim, posicao))
+
+    duplicadas = posicao[primeira_sobreposta < posicao]
+
+    # Viagens com chegada anterior à partida (raras) são comparadas par a par com as viagens do mesmo veículo
+    if len(invertidas):
+        duplicadas = np.union1d(duplicadas, inverted_overlaps(df_processed, invertidas, np.union1d(validas, invertidas)))
+
+    df_processed.loc[df_processed.index[duplicadas], 'status'] = 'Viagem duplicada na amostra'
+
     log_info('Verificação de dados inconsistentes na amostra finalizada com sucesso.')
                
     return df_processed
@@ -74,6 +114,66 @@ def remove_overlapping_trips(df: pd.DataFrame) -> pd.DataFrame:
 
 ### --- 3. Função de classificação de viagens --- ###
 
+def match_trips_in_window(amostra: pd.DataFrame, viagens: pd.DataFrame) -> pd.DataFrame:
+    """
+    Faz o join entre os recursos e as viagens do mesmo veículo cujo datetime_partida está dentro da janela
+    de + ou - 10 minutos (ou + ou - 5 minutos para recursos com duração menor do que 10 minutos) da partida
+    do recurso. As viagens de cada veículo são ordenadas e a janela é localizada por busca binária, de modo
+    que apenas os pares dentro da janela são gerados. Para cada recurso, é mantida apenas a viagem mais próxima.
+
+    Parâmetros:
+    amostra (dataframe): Recursos com as colunas id_veiculo, datetime_partida e datetime_chegada.
+    viagens (dataframe): Viagens completas ou conformidade com as colunas id_veiculo e datetime_partida.
+
+    Retorna:
+    dataframe: Um dataframe com as colunas da amostra e das viagens, com os sufixos "_amostra" e "_apurado",
+    e a coluna intervalo com a margem (em minutos) usada em cada recurso.
+
+    Exemplos:
+    >>> match_trips_in_window(amostra, viagem_completa)
+    """
+    partida_amostra = amostra['datetime_partida'].to_numpy()
+    partida_viagem = viagens['datetime_partida'].to_numpy()
+
+    # Caso a viagem seja muito curta e dure menos de 10 minutos, a margem será de 5 minutos, e não 10 minutos
+    duracao = amostra['datetime_chegada'].to_numpy() - partida_amostra
+    intervalo = np.where(duracao < np.timedelta64(10, 'm'), 5, 10)
+    margem = intervalo.astype('timedelta64[m]')
+
+    veiculos = pd.factorize(np.concatenate([amostra['id_veiculo'].to_numpy(dtype=object),
+                                            viagens['id_veiculo'].to_numpy(dtype=object)]))[0]
+    veiculo_amostra, veiculo_viagem = veiculos[:len(amostra)], veiculos[len(amostra):]
+
+    validas_amostra = np.flatnonzero(~np.isnat(partida_amostra))
+    validas_viagem = np.flatnonzero(~np.isnat(partida_viagem))
+
+    posicao_amostra, posicao_viagem = window_pairs(veiculo_viagem[validas_viagem],
+                                                   partida_viagem[validas_viagem],
+                                                   veiculo_amostra[validas_amostra],
+                                                   partida_amostra[validas_amostra] - margem[validas_amostra],
+                                                   partida_amostra[validas_amostra] + margem[validas_amostra])
+    posicao_amostra = validas_amostra[posicao_amostra]
+    posicao_viagem = validas_viagem[posicao_viagem]
+
+    # Manter a viagem mais próxima de cada recurso (em caso de empate, a viagem que partiu primeiro)
+    diferenca_tempo = np.abs(partida_viagem[posicao_viagem] - partida_amostra[posicao_amostra])
+    ordem = np.lexsort((partida_viagem[posicao_viagem], diferenca_tempo, posicao_amostra))
+    posicao_amostra, posicao_viagem = posicao_amostra[ordem], posicao_viagem[ordem]
+
+    mais_proxima = np.r_[True, posicao_amostra[1:] != posicao_amostra[:-1]][:len(posicao_amostra)]
+    posicao_amostra, posicao_viagem = posicao_amostra[mais_proxima], posicao_viagem[mais_proxima]
+
+    tabela_comparativa = pd.merge(amostra.iloc[posicao_amostra].reset_index(drop=True),
+                                  viagens.iloc[posicao_viagem].reset_index(drop=True),
+                                  left_index=True, right_index=True,
+                                  suffixes=('_amostra', '_apurado'))
+
+    tabela_comparativa['intervalo'] = intervalo[posicao_amostra]
+
+    return tabela_comparativa
+
+
+@measured()
 def check_trips(amostra: pd.DataFrame, query_trip_table: pd.DataFrame, status: str) -> pd.DataFrame:
         
     """
@@ -119,32 +219,9 @@ def check_trips(amostra: pd.DataFrame, query_trip_table: pd.DataFrame, status: s
     # Selecione as colunas do DataFrame
     amostra_nan = amostra_nan.iloc[:, start_col:end_col + 1]
 
-    # Adicionar uma chave temporária
-    amostra_nan['tmp_key'] = amostra_nan['id_veiculo']
-    query_trip_table['tmp_key'] = query_trip_table['id_veiculo']
-
-    # Fazer o merge usando a chave temporária
-    tabela_comparativa = pd.merge(amostra_nan, query_trip_table, 
-                                  on='tmp_key', 
-                                  suffixes=('_amostra', '_apurado')) 
-    
-    # Definir o intervalo do join:
-    # caso a viagem seja muito curta e dure menos de 10 minutos, o join será feito com uma margem de 5 minutos, e não 10 minutos
-    condition = (tabela_comparativa['datetime_chegada_amostra'] - tabela_comparativa['datetime_partida_amostra'] < pd.Timedelta(minutes=10))
-    tabela_comparativa['intervalo'] = np.where(condition, 5, 10)
-    
-    condition = (tabela_comparativa['datetime_partida_apurado'] >= 
-                (tabela_comparativa['datetime_partida_amostra'] - 
-                pd.to_timedelta(tabela_comparativa['intervalo'], unit="m"))) & \
-                (tabela_comparativa['datetime_partida_apurado'] <= 
-                (tabela_comparativa['datetime_partida_amostra'] + 
-                pd.to_timedelta(tabela_comparativa['intervalo'], unit="m")))
+    # Fazer o join apenas entre cada recurso e a viagem mais próxima dentro da sua janela de partida
+    tabela_comparativa = match_trips_in_window(amostra_nan, query_trip_table)
 
-    tabela_comparativa = tabela_comparativa[condition]  
-     
-    # Remover a chave temporária e outras colunas desnecessárias
-    tabela_comparativa.drop(columns=['tmp_key'], inplace=True)
-    
     # Atualizar a coluna 'status' baseada nas condições
     condition = (tabela_comparativa['id_veiculo_amostra'] == tabela_comparativa['id_veiculo_apurado']) & \
             (tabela_comparativa['servico_amostra'] == tabela_comparativa['servico_apurado'])
@@ -158,25 +235,10 @@ def check_trips(amostra: pd.DataFrame, query_trip_table: pd.DataFrame, status: s
         
         
     # Verificar se existem casos duplicados após o merge e removê-los:
-    
-    # Caso 1 - Se as colunas 'id_veiculo_amostra','datetime_partida_amostra' estão duplicadas, significa que significa que 
-    # o mesmo recurso foi comparado com mais de uma viagem. Abaixo, será mantida apenas a viagem mais próxima do recurso, de 
-    # acordo com a comparação entre datetime_partida_amostra do recurso e datetime_partida_apurado da viagem.
-    
-    colunas_amostra = ['id_veiculo_amostra','datetime_partida_amostra']    
-        
-    tabela_comparativa['diferenca_tempo'] = (tabela_comparativa['datetime_partida_apurado'] - tabela_comparativa['datetime_partida_amostra']).abs()
 
-    # 2. Ordenar pelo id_veiculo_amostra, datetime_partida_amostra e diferenca_tempo
-    tabela_comparativa = tabela_comparativa.sort_values(by=['id_veiculo_amostra', 'datetime_partida_amostra', 'diferenca_tempo'])
+    # Caso 1 - O mesmo recurso comparado com mais de uma viagem já é resolvido em match_trips_in_window,
+    # que mantém apenas a viagem mais próxima do recurso.
 
-    # 3. Remover duplicatas mantendo a primeira (menor diferença de tempo)
-    tabela_comparativa = tabela_comparativa.drop_duplicates(subset=colunas_amostra, keep='first')
-
-    # Remover a coluna de diferença de tempo, se não for mais necessária
-    tabela_comparativa = tabela_comparativa.drop(columns='diferenca_tempo')
-        
-    
     # Caso 2 - Se as colunas 'id_veiculo_apurado','datetime_partida_apurado' estão duplicadas, significa que 
     # dois recursos diferentes foram comparados com a mesma viagem. Neste caso, não é possível descartar a linha 
     # inteira, como foi feito no caso anterior. A solução foi transformar em NA as colunas apuradas do recurso
@@ -226,11 +288,9 @@ def check_trips(amostra: pd.DataFrame, query_trip_table: pd.DataFrame, status: s
         'datetime_chegada': 'datetime_chegada_amostra'
     }
     
-    amostra_not_nan = amostra_not_nan.rename(columns=new_column_names)  
+    amostra_not_nan = amostra_not_nan.rename(columns=new_column_names)
 
-    amostra_nan.drop(columns=['tmp_key'], inplace=True)
-    
-    amostra_nan = amostra_nan.rename(columns=new_column_names) 
+    amostra_nan = amostra_nan.rename(columns=new_column_names)
      
     # excluir da amostra_nan aquelas linhas que o status era nan e foram classificadas em tabela_comparativa
     amostra_nan['unique_key'] = amostra_nan['id_veiculo_amostra'].astype(str) + '_' + amostra_nan['datetime_partida_amostra'].astype(str)
@@ -256,54 +316,114 @@ def check_trips(amostra: pd.DataFrame, query_trip_table: pd.DataFrame, status: s
 
 ### --- 4. Função de classificação de dados de GPS --- ###
 
-def check_gps(row, df_check):
+@measured()
+def check_gps(viagens: pd.DataFrame, dados_gps: pd.DataFrame) -> pd.DataFrame:
     """
-    Verifica se o veículo teve sinal de GPS no momento da viagem e retorna o status informando
+    Verifica se o veículo teve sinal de GPS no momento de cada viagem e retorna o status informando
     se ele operou no serviço correto ou se não houve sinal de GPS no momento da viagem.
-        
+
+    Os sinais de GPS são ordenados uma única vez por veículo e horário, e o trecho de sinais de cada
+    viagem (entre datetime_partida_amostra e datetime_chegada_amostra) é localizado por busca binária.
+
     Parâmetros:
-    row: Linha do dataframe da amostra com as viagens não identificadas.
-    df_check (dataframe): Dataframe contendo os dados de GPS.   
+    viagens (dataframe): Dataframe da amostra com as viagens não identificadas.
+    dados_gps (dataframe): Dataframe contendo os dados de GPS.
 
-    """     
-    
-    # Filtrar df_check pelo id_veiculo e pelo intervalo
-    filtered_df = df_check[
-        (df_check['id_veiculo'] == row['id_veiculo_amostra']) & 
-        (df_check['timestamp_gps'] >= row['datetime_partida_amostra']) & 
-        (df_check['timestamp_gps'] <= row['datetime_chegada_amostra'])
-    ]
-    
-    # Identificar serviços
-    unique_servicos = filtered_df['servico'].unique()
-    servico_apurado = ', '.join(unique_servicos)
+    Retorna:
+    dataframe: Um dataframe com o mesmo índice de viagens e as colunas status e servico_apurado
+    (tupla com os serviços encontrados nos sinais de GPS).
 
-    # if not filtered_df.empty and np.isnan(row['status']):
-    #     if all(filtered_df['servico'] == row['servico_amostra']):
-    #         return ("Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra", servico_apurado)
-    #     else:
-    #         return ("Sinal de GPS encontrado para o veículo operando em serviço diferente da amostra", servico_apurado)
-        
-        
-    # else:
-    #     return ("Sinal de GPS não encontrado para o veículo no horário da viagem", np.nan)
+    Exemplos:
+    >>> check_gps(viagens_gps_classificadas_nan, dados_gps)
+    """
+    partida = viagens['datetime_partida_amostra'].to_numpy(dtype='datetime64[ns]')
+    chegada = viagens['datetime_chegada_amostra'].to_numpy(dtype='datetime64[ns]')
+    timestamp_gps = dados_gps['timestamp_gps'].to_numpy(dtype='datetime64[ns]')
+
+    veiculos = pd.factorize(np.concatenate([viagens['id_veiculo_amostra'].to_numpy(dtype=object),
+                                            dados_gps['id_veiculo'].to_numpy(dtype=object)]))[0]
+    veiculo_viagem, veiculo_gps = veiculos[:len(viagens)], veiculos[len(viagens):]
+
+    # Ordenar os sinais por veículo e horário e localizar o trecho de cada viagem
+    ordem = np.lexsort((np.arange(len(dados_gps)), timestamp_gps, veiculo_gps))
+    veiculo_gps, timestamp_gps = veiculo_gps[ordem], timestamp_gps[ordem]
+    servico_gps = dados_gps['servico'].to_numpy(dtype=object)[ordem]
+
+    inicio = group_searchsorted(veiculo_gps, timestamp_gps, veiculo_viagem, partida, side='left')
+    fim = group_searchsorted(veiculo_gps, timestamp_gps, veiculo_viagem, chegada, side='right')
+    quantidade = np.where(np.isnat(partida) | np.isnat(chegada), 0, np.maximum(fim - inicio, 0))
+
+    # Pares (viagem, sinal de GPS) dentro do trecho de cada viagem
+    posicao_viagem = np.repeat(np.arange(len(viagens)), quantidade)
+    posicao_gps = inicio[posicao_viagem] + np.arange(len(posicao_viagem)) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+
+    servico_amostra = viagens['servico_amostra'].to_numpy(dtype=object)
+    servico_diferente = servico_gps[posicao_gps] != servico_amostra[posicao_viagem]
+
+    # Caso a data seja anterior a 16-11-2022, o servico foi reprocessado, ou seja, não faz sentido a categoria
+    # de que o veículo operou em serviço diferente da amostra
+    antes_reprocessamento = timestamp_gps[posicao_gps] < np.datetime64('2022-11-16')
+
+    n_diferente = np.bincount(posicao_viagem, weights=servico_diferente, minlength=len(viagens))
+    n_diferente_reprocessado = np.bincount(posicao_viagem, weights=servico_diferente & antes_reprocessamento,
+                                           minlength=len(viagens))
+
+    status = np.select(
+        [quantidade == 0, n_diferente == 0, n_diferente_reprocessado > 0],
+        ["Sinal de GPS não encontrado para o veículo no horário da viagem",
+         "Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra",
+         "Pós-reprocessamento: Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra"],
+        default="Sinal de GPS encontrado para o veículo operando em serviço diferente da amostra"
+    )
+
+    # Identificar serviços, na ordem em que aparecem nos sinais de GPS
+    servicos = pd.DataFrame({'viagem': posicao_viagem, 'servico': servico_gps[posicao_gps]}).drop_duplicates()
+    servicos = servicos.groupby('viagem', sort=False)['servico'].agg(tuple)
+
+    servico_apurado = np.full(len(viagens), np.nan, dtype=object)
+    servico_apurado[servicos.index.to_numpy()] = servicos.to_numpy()
+
+    return pd.DataFrame({'status': status, 'servico_apurado': servico_apurado}, index=viagens.index)
+
+
+
+
+def remove_sample_service(servico_apurado: pd.Series, servico_amostra: pd.Series) -> pd.Series:
+    """
+    Quando houver sinal de GPS para um serviço além do serviço da amostra, mantém em servico_apurado
+    apenas os serviços diferentes da amostra (para realizar o reprocessamento de forma correta).
+
+    Os serviços são comparados como elementos de um conjunto, e não como trechos de texto, de modo que
+    o serviço "10" da amostra não altera o serviço "410" encontrado no GPS.
+
+    Parâmetros:
+    servico_apurado (series): Tuplas de serviços, como retornado por check_gps, ou um único serviço.
+    servico_amostra (series): Serviço da amostra de cada viagem.
+
+    Retorna:
+    series: Tuplas de serviços, com o mesmo índice de servico_apurado. Viagens sem serviço apurado ou sem
+    serviço da amostra recebem NaN.
+
+    Exemplos:
+    >>> remove_sample_service(pd.Series([('10', '410')]), pd.Series(['10']))
+    0    (410,)
+    dtype: object
+    """
+    # Uma linha por viagem e serviço apurado
+    servicos = pd.Series(servico_apurado.to_numpy(), index=np.arange(len(servico_apurado))).explode().dropna()
+    amostra = servico_amostra.astype(str).to_numpy()[servicos.index]
+    servicos = servicos.astype(str)
+
+    # O serviço da amostra é removido apenas quando existe outro serviço apurado para a viagem
+    igual = servicos.to_numpy() == amostra
+    n_diferentes = pd.Series(~igual, index=servicos.index).groupby(level=0).transform('sum').to_numpy()
+    servicos = servicos[~igual | (n_diferentes == 0)]
 
+    resultado = servicos.groupby(level=0, sort=False).agg(tuple).reindex(np.arange(len(servico_apurado)))
+    resultado = resultado.where(servico_amostra.notna().to_numpy())
+    resultado.index = servico_apurado.index
 
-    if not filtered_df.empty and np.isnan(row['status']):
-    # Verifica se todos os serviços no filtered_df são iguais ao serviço da amostra
-        if all(filtered_df['servico'] == row['servico_amostra']):
-            return ("Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra", servico_apurado)
-        # Caso a data seja anterior a 16-11-2022, o servico foi reprocessado, ou seja, não faz sentido a categoria
-        # de que o veículo operou em serviço diferente da amostra. Por isto foi criada a categoria ""Pós-reprocessamento: Sinal de GPS 
-        # encontrado para o veículo operando no mesmo serviço da amostra"
-        # para indicar que mesmo após o reprocessamento, a viagem não foi identificada.
-        elif any((filtered_df['servico'] != row['servico_amostra']) & 
-                (filtered_df['timestamp_gps'].dt.date < pd.to_datetime('2022-11-16').date())):
-            return ("Pós-reprocessamento: Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra", servico_apurado)
-        else:
-            return ("Sinal de GPS encontrado para o veículo operando em serviço diferente da amostra", servico_apurado)
-    else:
-        return ("Sinal de GPS não encontrado para o veículo no horário da viagem", np.nan)
+    return resultado
 
 
 
@@ -337,49 +457,49 @@ def check_circular_trip(viagens_circulares_sem_status, viagem_completa, viagem_c
     viagem_conformidade['datetime_chegada'] = pd.to_datetime(viagem_conformidade['datetime_chegada'])        
     
     
-    for index, row in viagens_circulares_sem_status.iterrows():
-        # Primeira verificação com viagem_completa
-        mask_completa = (
-            (viagem_completa['id_veiculo'] == row['id_veiculo_amostra']) &
-            (viagem_completa['data'] == row['data']) & 
-            (viagem_completa['datetime_partida'] <= row['datetime_partida_amostra']) & 
-            (viagem_completa['datetime_chegada'] >= row['datetime_partida_amostra'])
-        )
-
-        # Se existir uma linha correspondente, atualize o status e copie os valores, depois continue para a próxima iteração
-        if viagem_completa[mask_completa].shape[0] > 0:
-            viagens_circulares_sem_status.loc[index, 'status'] = "Viagem identificada e já paga"
-            matching_row = viagem_completa[mask_completa].iloc[0]
-            viagens_circulares_sem_status.loc[index, ['data_apurado', 'id_veiculo_apurado', 'servico_apurado', 
-                                            'sentido_apurado', 'datetime_partida_apurado', 
-                                            'datetime_chegada_apurado']] = matching_row[['data', 'id_veiculo', 
-                                                                                        'servico', 'sentido', 
-                                                                                        'datetime_partida', 
-                                                                                        'datetime_chegada']].values
-            
-            
+    # Códigos de veículo e dia comuns à amostra e às duas tabelas de viagens
+    chaves_amostra = viagens_circulares_sem_status[['id_veiculo_amostra', 'data']].astype(str)
+    chaves_amostra.columns = ['id_veiculo', 'data']
+    tabelas = [viagem_completa, viagem_conformidade]
+    chaves = pd.concat([chaves_amostra] + [tabela[['id_veiculo', 'data']].astype(str) for tabela in tabelas],
+                       ignore_index=True)
+    grupos = chaves.groupby(['id_veiculo', 'data'], sort=False).ngroup().to_numpy()
+    grupo_amostra, grupos = grupos[:len(chaves_amostra)], grupos[len(chaves_amostra):]
+
+    partida_amostra = viagens_circulares_sem_status['datetime_partida_amostra'].to_numpy(dtype='datetime64[ns]')
+    pendente = ~np.isnat(partida_amostra)
+
+    colunas_apurado = ['data_apurado', 'id_veiculo_apurado', 'servico_apurado', 'sentido_apurado',
+                       'datetime_partida_apurado', 'datetime_chegada_apurado']
+
+    # Primeira verificação com viagem_completa e, para as viagens não encontradas, com viagem_conformidade
+    for tabela, status in [(viagem_completa, "Viagem identificada e já paga"),
+                           (viagem_conformidade, "Viagem indeferida - Não atingiu % de GPS ou trajeto correto")]:
+        grupo_tabela, grupos = grupos[:len(tabela)], grupos[len(tabela):]
+
+        partida = tabela['datetime_partida'].to_numpy(dtype='datetime64[ns]')
+        chegada = tabela['datetime_chegada'].to_numpy(dtype='datetime64[ns]')
+        validas = np.flatnonzero(~np.isnat(partida) & ~np.isnat(chegada))
+        buscadas = np.flatnonzero(pendente)
+
+        posicao = first_containing_interval(grupo_tabela[validas], partida[validas], chegada[validas],
+                                            grupo_amostra[buscadas], partida_amostra[buscadas])
+        encontrada = posicao >= 0
+        buscadas, posicao = buscadas[encontrada], validas[posicao[encontrada]]
+
+        if len(buscadas) == 0:
             continue
-        
-        # Segunda verificação com viagem_conformidade se a primeira falhar
-        mask_conformidade = (
-            (viagem_conformidade['id_veiculo'] == row['id_veiculo_amostra']) &
-            (viagem_conformidade['data'] == row['data']) & 
-            (viagem_conformidade['datetime_partida'] <= row['datetime_partida_amostra']) & 
-            (viagem_conformidade['datetime_chegada'] >= row['datetime_partida_amostra'])
-        )
-        
-        # Se existir uma linha correspondente, atualize o status e copie os valores
-        if viagem_conformidade[mask_conformidade].shape[0] > 0:
-            viagens_circulares_sem_status.loc[index, 'status'] = "Viagem indeferida - Não atingiu % de GPS ou trajeto correto"
-            matching_row = viagem_conformidade[mask_conformidade].iloc[0]
-            viagens_circulares_sem_status.loc[index, ['data_apurado', 'id_veiculo_apurado', 'servico_apurado', 
-                                            'sentido_apurado', 'datetime_partida_apurado', 
-                                            'datetime_chegada_apurado']] = matching_row[['data', 'id_veiculo', 
-                                                                                        'servico', 'sentido', 
-                                                                                        'datetime_partida', 
-                                                                                        'datetime_chegada']].values
-            
-            
+
+        # A tabela pode vir com a coluna servico_informado, ainda não renomeada por check_trips
+        coluna_servico = [col for col in tabela.columns if col.startswith('servico')][0]
+        colunas_tabela = ['data', 'id_veiculo', coluna_servico, 'sentido', 'datetime_partida', 'datetime_chegada']
+
+        indices = viagens_circulares_sem_status.index[buscadas]
+        viagens_circulares_sem_status.loc[indices, 'status'] = status
+        viagens_circulares_sem_status.loc[indices, colunas_apurado] = tabela[colunas_tabela].iloc[posicao].to_numpy()
+
+        pendente[buscadas] = False
+
     return viagens_circulares_sem_status
 
 
@@ -387,8 +507,21 @@ def check_circular_trip(viagens_circulares_sem_status, viagem_completa, viagem_c
 
 ### --- 6. Função de classificação de sinais de GPS no raio de 500m dos pontos inicial e final da viagem --- ###
 
-def check_start_end_gps(viagens_gps_classificadas: pd.DataFrame) -> pd.DataFrame:
+@measured()
+def check_start_end_gps(viagens_gps_classificadas: pd.DataFrame, metodo_distancia: str = 'elipsoidal',
+                        tolerancia_raio: float = 0) -> pd.DataFrame:
+    """
+    Verifica se as viagens com sinal de GPS no mesmo serviço da amostra tiveram sinais dentro do raio de 500m
+    dos pontos inicial e final do trajeto.
 
+    Parâmetros:
+    viagens_gps_classificadas (dataframe): Dataframe com as viagens classificadas pela etapa de GPS.
+    metodo_distancia (str): Método de cálculo da distância, 'elipsoidal' ou 'haversine' (ver geo_distance.py).
+    tolerancia_raio (float): Margem, em metros, somada ao raio de 500m.
+
+    Retorna:
+    dataframe: Um dataframe com a coluna status atualizada para as viagens fora do raio.
+    """
 
     log_info('Iniciando a verificação de sinais de GPS dentro do raio dos pontos inicial e final.')
     
@@ -401,40 +534,21 @@ def check_start_end_gps(viagens_gps_classificadas: pd.DataFrame) -> pd.DataFrame
     viagens_com_gps = viagens_gps_classificadas[viagens_gps_classificadas['status'].isin(status_checks)]
     viagens_ja_classificadas = viagens_gps_classificadas[~viagens_gps_classificadas['status'].isin(status_checks)]
 
-    if args.cache:
-        dados_shape = pd.read_csv('../data/cache/dados_gps_shape.csv')
-        
-    else:
-        dados_shape = query_planned_trips(viagens_com_gps,
-                                        include_shape_direction = False,
-                                        geometry_data = True)
-        
-        dados_shape.to_csv('../data/cache/dados_gps_shape.csv', index=False)
+    # Os shapes ficam no registro da execução e são reaproveitados na geração dos mapas (automate_map)
+    dados_shape = fetch_shapes(service_day_pairs(viagens_com_gps))
             
-    dados_shape['servico'] = dados_shape['servico'].astype(str)
+    dados_shape = treat_shapes(dados_shape)
         
-    # Acessar e tratar dados de GPS
-    filtro_gps = viagens_com_gps[['id_veiculo_amostra','data','datetime_partida_amostra']].drop_duplicates(subset=['id_veiculo_amostra', 'data', 'datetime_partida_amostra'])  
-    dados_gps = pd.read_csv('../data/cache/dados_gps.csv')
-    dados_gps = treat_gps(dados_gps)
-
+    # Ler os sinais de GPS apenas dos dias e veículos das viagens que serão classificadas
+    dados_gps = read_gps_store(vehicle_day_pairs(viagens_com_gps))
     dados_gps['data'] = dados_gps['timestamp_gps'].dt.date.astype(str)
-    dados_gps['id_veiculo'] = dados_gps['id_veiculo'].astype(str)
-    filtro_gps['data'] = filtro_gps['data'].astype(str)
-    filtro_gps['id_veiculo_amostra'] = filtro_gps['id_veiculo_amostra'].astype(str)
-
-    # filtra sinais de GPS para os dias e veículos das viagens que serão classificadas
-    dados_gps = dados_gps.merge(filtro_gps, 
-                                left_on=['data','id_veiculo'], 
-                                right_on=['data','id_veiculo_amostra'], 
-                                how='inner')
                 
             
     # Acessar e tratar dados do shape/viagem_planejada para os dias e viagens que serão classificadas
     filtro_shape = viagens_com_gps[['servico_amostra','data']].drop_duplicates(subset=['servico_amostra', 
                                                                                     'data']) 
 
-    filtro_shape.to_excel('./../data/treated/dados_shape.xlsx')
+    write_debug_artifact('dados_shape', filtro_shape)
 
     dados_shape['data'] = dados_shape['data'].astype(str)
     dados_shape['servico'] = dados_shape['servico'].astype(str)
@@ -449,195 +563,79 @@ def check_start_end_gps(viagens_gps_classificadas: pd.DataFrame) -> pd.DataFrame
                                 how='inner')
     
     
-    # Juntar os shapes com os respectivos sinais de GPS  
-    merged_data = pd.merge(dados_shape, 
-                        dados_gps, on=['data', 'servico'], how='inner')     
-    
-    
-    # converter formato dos pontos
-    def point_to_tuple(point_string):
-        # Extrair os valores numéricos
-        coords = re.findall(r"[-+]?\d*\.\d+|\d+", point_string)
-        # Retorna as coordenadas como uma tupla de floats
-        return (float(coords[1]), float(coords[0]))  # conversão para (lat, lon)
-
-    # Converter dados para formato espacial
-    merged_data['end_pt'] = merged_data['end_pt'].apply(point_to_tuple)
-    merged_data['start_pt'] = merged_data['start_pt'].apply(point_to_tuple)    
-    merged_data['posicao_veiculo_geo'] = merged_data['posicao_veiculo_geo'].apply(point_to_tuple)
-
-    # Função para verificar se as coordenadas estão dentro do raio de 500m
-    def is_within_radius(point1, point2, radius):
-        distance = geodesic(point1, point2).meters
-        return 1 if distance <= radius else 0
-
-    # Criar colunas que indicam se o sinal de GPS está dentro do raio de 500m
+    # Verificar, um grupo (data, servico) por vez, quais sinais de GPS estão dentro do raio de 500m
+    # dos pontos inicial e final de cada shape do serviço
     log_info('Realizando operações espaciais. Por favor, aguarde.')
-    merged_data['check_start_pt'] = merged_data.apply(lambda row: is_within_radius(row['start_pt'], row['posicao_veiculo_geo'], 500), axis=1)
-    merged_data['check_end_pt'] = merged_data.apply(lambda row: is_within_radius(row['end_pt'], row['posicao_veiculo_geo'], 500), axis=1)     
-        
-        
-    # Identificar a quais viagens pertencem os dados de GPS capturados
-    # Dados capturados no raio de 500m do ponto de partida:
-    partida = []  
-    
-    for index, row in viagens_com_gps.iterrows():
-        # Criar uma coluna temporária para marcar as linhas que satisfazem as condições
-        merged_data['temp_key'] = (
-            (merged_data['id_veiculo'] == row['id_veiculo_amostra']) &
-            (merged_data['timestamp_gps'] > row['datetime_partida_amostra']) &
-            (merged_data['timestamp_gps'] < (row['datetime_partida_amostra'] + pd.Timedelta(minutes=5)))
-        )
-        
-        # Filtrar os dados
-        filtered_data = merged_data[merged_data['temp_key']].copy()
-        
-        # Adicionar a coluna datetime_partida_amostra
-        filtered_data['datetime_partida_amostra'] = row['datetime_partida_amostra']
-        
-        # Remover a coluna temporária
-        filtered_data.drop(columns=['temp_key'], inplace=True)
-        
-        # Agregar dados
-        aggregated_data = filtered_data.groupby(['id_veiculo', 'datetime_partida_amostra']).agg({  
-            'check_start_pt': 'sum',
-            'check_end_pt': 'sum',
-            'timestamp_gps': 'mean'
-        }).reset_index()
-    
-        partida.append(aggregated_data)
-
-
-    # Concatenar ao final do loop
-    df_partida = pd.concat(partida) 
-
-    df_partida = df_partida.rename(columns={
-    'check_start_pt': 'check_start_pt_partida',
-    'check_end_pt': 'check_end_pt_partida',
-    'timestamp_gps': 'timestamp_gps_partida'
-    })
-
-
-    # Dados capturados no raio de 500m do ponto de chegada: 
-    
-    chegada = []
-
-    for index, row in viagens_com_gps.iterrows():
-        mask = (
-            (merged_data['id_veiculo'] == row['id_veiculo_amostra']) &
-            (merged_data['timestamp_gps'] < row['datetime_chegada_amostra']) &
-            (merged_data['timestamp_gps'] > (row['datetime_chegada_amostra'] - pd.Timedelta(minutes=5)))
-        )        
-        filtered_data = merged_data[mask]
-        
-        # Adicionar a coluna datetime_chegada_amostra
-        filtered_data['datetime_chegada_amostra'] = row['datetime_chegada_amostra']
-        chegada.append(filtered_data)
-
-    df_chegada = pd.concat(chegada)
-
-    # Agregar dados
-    df_chegada = df_chegada.groupby(['id_veiculo', 'datetime_chegada_amostra']).agg({ 
-        'check_start_pt': 'sum',
-        'check_end_pt': 'sum',
-        'timestamp_gps': 'mean'
-    }).reset_index()
-
-    df_chegada = df_chegada.rename(columns={
-        'check_start_pt': 'check_start_pt_chegada',
-        'check_end_pt': 'check_end_pt_chegada',
-        'timestamp_gps': 'timestamp_gps_chegada'
-    })
-
-    
-    
-    df_chegada['data'] = df_chegada['timestamp_gps_chegada'].dt.date.astype(str)
-    df_partida['data'] = df_partida['timestamp_gps_partida'].dt.date.astype(str)
-    viagens_com_gps['data'] = viagens_com_gps['data'].astype(str) 
-
-    merged_partida = pd.merge(viagens_com_gps, df_partida,
-                            left_on=['data','id_veiculo_amostra','datetime_partida_amostra'],
-                            right_on=['data','id_veiculo','datetime_partida_amostra'],                             
-                            how='left')
-    
-    
-    merged_partida.to_excel('./../data/treated/merged_partida.xlsx')
-
-
-    merged_chegada = pd.merge(merged_partida, df_chegada, 
-                            left_on=['data','id_veiculo_amostra','datetime_chegada_amostra'], 
-                            right_on=['data','id_veiculo','datetime_chegada_amostra'],                             
-                            how='left')
-    
-    merged_chegada.to_excel('./../data/treated/merged_chegada.xlsx')
-
-    # Remover dados que não são das viagens
-    mask_partida = (merged_chegada['timestamp_gps_partida'] >= merged_chegada['datetime_partida_amostra']) & \
-                (merged_chegada['timestamp_gps_partida'] <= merged_chegada['datetime_chegada_amostra'])
-
-    mask_chegada = (merged_chegada['timestamp_gps_chegada'] >= merged_chegada['datetime_partida_amostra']) & \
-                    (merged_chegada['timestamp_gps_chegada'] <= merged_chegada['datetime_chegada_amostra'])
-
-    # Aplique as máscaras para definir valores vazios (NA) onde as condições não são atendidas
-    columns_partida = ['id_veiculo_x', 'check_start_pt_partida', 'check_end_pt_partida', 'timestamp_gps_partida']
-    columns_chegada = ['id_veiculo_y', 'check_start_pt_chegada', 'check_end_pt_chegada', 'timestamp_gps_chegada']
-
-    merged_chegada.loc[~mask_partida, columns_partida] = np.nan
-    merged_chegada.loc[~mask_chegada, columns_chegada] = np.nan
-
-    # checar se a viagem teve sinais dentro de 500m do ponto inicial e final
-    condition = (
-    ((merged_chegada['check_start_pt_partida'] == 0) | merged_chegada['check_start_pt_partida'].isna()) |
-    ((merged_chegada['check_start_pt_chegada'] == 0) | merged_chegada['check_start_pt_chegada'].isna()) |
-    ((merged_chegada['check_end_pt_partida'] == 0) | merged_chegada['check_end_pt_partida'].isna()) |
-    ((merged_chegada['check_end_pt_chegada'] == 0) | merged_chegada['check_end_pt_chegada'].isna())
+    sinais_no_raio = radius_checks(dados_shape, dados_gps, raio=500,
+                                   tolerancia=tolerancia_raio, metodo=metodo_distancia)
+
+
+    # Identificar, em uma única passagem pelos sinais de GPS de cada veículo, o primeiro sinal (entrada) e o
+    # último sinal (saída) dentro do raio de 500m dos pontos inicial e final de cada shape durante a viagem
+    viagens_com_gps = viagens_com_gps.reset_index(drop=True)
+    viagens_com_gps['data'] = viagens_com_gps['data'].astype(str)
+    viagens_com_gps['id_veiculo_amostra'] = viagens_com_gps['id_veiculo_amostra'].astype(str)
+    viagens_com_gps['servico_amostra'] = viagens_com_gps['servico_amostra'].astype(str)
+
+    eventos = detect_radius_events(viagens_com_gps, sinais_no_raio)
+    write_debug_artifact('eventos_raio', eventos)
+
+    viagens_com_gps = viagens_com_gps.join(summarize_radius_events(eventos))
+
+    # checar se a viagem teve sinais dentro de 500m do ponto inicial e final nos 5 primeiros minutos
+    # e nos 5 últimos minutos da viagem
+    janela = pd.Timedelta(minutes=5)
+    condition = ~(
+        (viagens_com_gps['entrada_raio_ponto_inicial'] < viagens_com_gps['datetime_partida_amostra'] + janela) &
+        (viagens_com_gps['entrada_raio_ponto_final'] < viagens_com_gps['datetime_partida_amostra'] + janela) &
+        (viagens_com_gps['saida_raio_ponto_inicial'] > viagens_com_gps['datetime_chegada_amostra'] - janela) &
+        (viagens_com_gps['saida_raio_ponto_final'] > viagens_com_gps['datetime_chegada_amostra'] - janela)
     )
 
     # Atualizar a coluna 'status' com base na condição
-    merged_chegada.loc[condition, 'status'] = "O veículo não passou no raio de 500m do ponto de partida/final do trajeto"
+    viagens_com_gps.loc[condition, 'status'] = "O veículo não passou no raio de 500m do ponto de partida/final do trajeto"
 
-    merged_chegada.to_excel('./../data/treated/teste_inicio_fim.xlsx')
+    write_debug_artifact('teste_inicio_fim', viagens_com_gps)
 
-    start_idx = merged_chegada.columns.get_loc('id_veiculo_x')
-    # Exclua todas as colunas a partir desse índice
-    merged_chegada.drop(merged_chegada.columns[start_idx:], axis=1, inplace=True)
-
-    viagens_gps_classificadas = pd.concat([viagens_ja_classificadas, merged_chegada], ignore_index=True)
+    viagens_gps_classificadas = pd.concat([viagens_ja_classificadas, viagens_com_gps], ignore_index=True)
     print(viagens_gps_classificadas)
     
     log_info('Verificação de proximidade dos sinais de GPS com ponto inicial e final finalizada.')
     
     viagens_gps_classificadas = viagens_gps_classificadas.drop_duplicates()
-    viagens_gps_classificadas.to_excel('./../data/treated/gps_classificado_inicio_fim.xlsx', index = False)
+    write_debug_artifact('gps_classificado_inicio_fim', viagens_gps_classificadas)
     
     return viagens_gps_classificadas
 
 
 ### --- 7. Função que classifica os status de forma mais simples --- ###
 
+# Status simplificados e os status detalhados (observacao) que pertencem a cada um
+STATUS_SIMPLIFICADOS = {
+    'Viagem identificada e já paga': ['Viagem identificada e já paga', 'Viagem identificada e já paga para serviço diferente da amostra'],
+    'Viagem deferida após o reprocessamento':['Viagem deferida com novo serviço'],
+    'Viagem indeferida': ['Viagem indeferida - Não atingiu % de GPS ou trajeto correto após o reprocessamento',
+                          'Viagem indeferida - Não atingiu % de GPS ou trajeto correto para serviço diferente da amostra',
+                          'Viagem indeferida - Não atingiu % de GPS ou trajeto correto',
+                          'Viagem duplicada na amostra',
+                          'Serviço não planejado para o dia',
+                          'O veículo não passou no raio de 500m do ponto de partida/final do trajeto',
+                          'Sinal de GPS encontrado para o veículo operando em serviço diferente da amostra',
+                          'Sinal de GPS não encontrado para o veículo no horário da viagem'],
+    'Viagem não classificada pelo algoritmo': ['Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra',
+                                               'Pós-reprocessamento: Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra'
+                                               ]
+}
+
+# Mapeamento inverso, do status detalhado para o status simplificado
+STATUS_SIMPLIFICADO_POR_OBSERVACAO = {value: key for key, values in STATUS_SIMPLIFICADOS.items() for value in values}
+
 
 def simplified_status(dataframe: pd.DataFrame) -> pd.DataFrame:
     dataframe.rename(columns={'status': 'observacao'}, inplace=True)
-    
-    # Criar a nova coluna "observacoes"
-    status_mapping = {
-        'Viagem identificada e já paga': ['Viagem identificada e já paga', 'Viagem identificada e já paga para serviço diferente da amostra'],
-        'Viagem deferida após o reprocessamento':['Viagem deferida com novo serviço'],
-        'Viagem indeferida': ['Viagem indeferida - Não atingiu % de GPS ou trajeto correto após o reprocessamento',
-                              'Viagem indeferida - Não atingiu % de GPS ou trajeto correto para serviço diferente da amostra',
-                              'Viagem indeferida - Não atingiu % de GPS ou trajeto correto',
-                              'Viagem duplicada na amostra',
-                              'Serviço não planejado para o dia',
-                              'O veículo não passou no raio de 500m do ponto de partida/final do trajeto',
-                              'Sinal de GPS encontrado para o veículo operando em serviço diferente da amostra',
-                              'Sinal de GPS não encontrado para o veículo no horário da viagem'],
-        'Viagem não classificada pelo algoritmo': ['Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra',
-                                                   'Pós-reprocessamento: Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra'
-                                                   ]
-    }
 
     # Criar a coluna status nova (com categorias simplificadas)
-    dataframe['status'] = dataframe['observacao'].map({value: key for key, values in status_mapping.items() for value in values})
+    dataframe['status'] = dataframe['observacao'].map(STATUS_SIMPLIFICADO_POR_OBSERVACAO)
     
     # Reordenar as colunas da tabela
     cols = list(dataframe.columns)
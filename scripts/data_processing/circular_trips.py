@@ -1,18 +1,13 @@
 
-import argparse
 import numpy as np
 import pandas as pd
 
 from utils import *
 from categorize_trips import *
 from queries_functions import *
+from cache_files import *
+from debug_artifacts import *
 
-parser = argparse.ArgumentParser(description="Execute o script run.py com opções.")
-
-# permite usar o cache para não baixar novamente os dados da última consulta no big query
-parser.add_argument('--cache', action='store_true', help="Ative o cache")
-args = parser.parse_args()
-cache = "on" if args.cache else "off"
 
 
 
@@ -22,19 +17,13 @@ def circular_trips(dados: pd.DataFrame,
     """
     Esta função executa todo o processo de identificação de meias viagens circulares e faz a sua classificação,
     """
-    # este dataframe inalterado será retornado caso não sejam encontradas viagens circulares
-    dados_original = dados.copy()    
     
     ### --- 6.1 Identificar se a linha é circular --- ###  
 
     log_info('Verificando se existem linhas circulares.')
 
     # verifica os serviços e as datas presentes na amostra
-    if args.cache:
-        tipo_servico = pd.read_csv('../data/cache/tipo_servico.csv')   
-    else:        
-        tipo_servico = query_planned_trips(dados, include_shape_direction = True)
-        tipo_servico.to_csv('../data/cache/tipo_servico.csv', index = False)
+    tipo_servico = fetch_service_types(service_day_pairs(dados))
 
     tipo_servico['circular_dividida'] = np.where(
         (tipo_servico['sentido'] == 'C') & (tipo_servico['sentido_shape'] != 'C'), 
@@ -77,7 +66,7 @@ def circular_trips(dados: pd.DataFrame,
     ]
     
     print(df_circular_na)
-    df_circular_na.to_excel('../data/treated/viagens_circulares_tratar.xlsx')
+    write_debug_artifact('viagens_circulares_tratar', df_circular_na)
     
     # Criando o DataFrame df_demais_casos
     df_demais_casos = dados.drop(df_circular_na.index)
@@ -85,18 +74,19 @@ def circular_trips(dados: pd.DataFrame,
 
     if not df_circular_na.empty:
         # Código a ser executado caso df_circular não esteja vazio
-        log_info('Foram identificadas viagens circulares divididas em shapes de ida e volta e podem ser visualizadas em "/data/treated/viagem_conformidade_classificada_circular.xlsx"')
+        log_info('Foram identificadas viagens circulares divididas em shapes de ida e volta (com --debug-artifacts, podem ser visualizadas em "/data/treated/viagem_conformidade_classificada_circular")')
         
         # Esta função classifica as meia viagens circulares que não foram identificadas nos passos anteriores
         df_circular_na = check_circular_trip(df_circular_na, viagem_completa, viagem_conformidade)
                                     
-        dados = pd.concat([df_circular_na, df_demais_casos], ignore_index=True)  
+        # As viagens voltam à ordem da amostra
+        dados = pd.concat([df_circular_na, df_demais_casos]).sort_index().reset_index(drop=True)
         
-        dados.to_excel('../data/treated/viagem_conformidade_classificada_circular.xlsx', index = False)
-  
-        return dados    
+        write_debug_artifact('viagem_conformidade_classificada_circular', dados)
 
     else:
         log_info('Não existem viagens circulares divididas em shapes de ida e volta.')
-        
-        return dados_original
+
+    # Nos dois casos, a tabela tem o status dos serviços não planejados e as mesmas colunas e tipos: o
+    # resultado de cada viagem não depende das outras datas da partição (ver flows.py)
+    return dados
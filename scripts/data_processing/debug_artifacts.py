@@ -0,0 +1,153 @@
+### --- Tabelas intermediárias para depuração --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import logging
+import os
+import queue
+import threading
+import time
+import pandas as pd
+import prefect
+from utils import *
+
+
+### --- 2. Configuração --- ###
+
+# As tabelas intermediárias das etapas (viagens classificadas em cada etapa, eventos de raio etc.) são
+# gravadas em data/treated apenas quando ativadas pelas flags de execução (ver tasks.py)
+CONFIGURACAO_DEPURACAO = {
+    'ativo': False,                   # grava as tabelas intermediárias
+    'formato': 'parquet',             # 'parquet', 'csv' ou 'xlsx'
+    'diretorio': '../data/treated',
+    'tempo_maximo_espera_s': 600,     # tempo máximo de espera pela gravação no fim da execução
+}
+
+# Tabelas aguardando gravação e a thread que as grava, criada na primeira tabela enviada
+FILA_DEPURACAO = queue.Queue()
+ESCRITOR_DEPURACAO = {'thread': None}
+TRAVA_ESCRITOR = threading.Lock()
+
+
+def configure_debug_artifacts(ativo: bool = None, formato: str = None) -> None:
+    """
+    Ativa ou desativa a gravação das tabelas intermediárias e altera o formato dos arquivos.
+
+    Exemplos:
+    >>> configure_debug_artifacts(ativo=True, formato='csv')
+    """
+    if ativo is not None:
+        CONFIGURACAO_DEPURACAO['ativo'] = ativo
+    if formato is not None:
+        if formato not in ESCRITORES_DEPURACAO:
+            raise ValueError(f'Formato {formato} não existe. Opções: {", ".join(ESCRITORES_DEPURACAO)}.')
+        CONFIGURACAO_DEPURACAO['formato'] = formato
+
+
+### --- 3. Gravar as tabelas --- ###
+
+def prepare_debug_artifact(dados: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas que não podem ser gravadas diretamente: as tuplas de serviços apurados viram
+    texto, como na tabela final (ver format_services).
+    """
+    if 'servico_apurado' in dados.columns:
+        dados['servico_apurado'] = format_services(dados['servico_apurado'])
+
+    return dados
+
+
+def write_parquet_artifact(dados: pd.DataFrame, caminho: str) -> None:
+    """
+    Grava a tabela em parquet. Colunas de texto com valores de outros tipos (por exemplo, textos e números
+    na mesma coluna) são gravadas como texto.
+    """
+    import pyarrow as pa
+
+    try:
+        dados.to_parquet(caminho)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        for coluna in dados.columns[dados.dtypes == object]:
+            dados[coluna] = dados[coluna].astype(str).where(dados[coluna].notna())
+        dados.to_parquet(caminho)
+
+
+ESCRITORES_DEPURACAO = {
+    'parquet': write_parquet_artifact,
+    'csv': lambda dados, caminho: dados.to_csv(caminho, index=False),
+    'xlsx': lambda dados, caminho: dados.to_excel(caminho, index=False),
+}
+
+
+def debug_writer_loop() -> None:
+    """
+    Grava, uma por vez, as tabelas enviadas por write_debug_artifact. Uma falha na gravação é registrada
+    no log e não interrompe a gravação das tabelas seguintes nem a execução.
+    """
+    # A thread de gravação não tem o contexto do Prefect: o log é feito diretamente no logger "prefect"
+    logger = logging.getLogger('prefect')
+
+    while True:
+        nome, formato, dados = FILA_DEPURACAO.get()
+        try:
+            caminho = os.path.join(CONFIGURACAO_DEPURACAO['diretorio'], f'{nome}.{formato}')
+            ESCRITORES_DEPURACAO[formato](prepare_debug_artifact(dados), caminho)
+        except Exception as erro:
+            try:
+                logger.warning(f'\nNão foi possível gravar a tabela intermediária {nome} ({erro}).')
+            except Exception:
+                pass
+        finally:
+            FILA_DEPURACAO.task_done()
+
+
+def write_debug_artifact(nome: str, dados: pd.DataFrame) -> None:
+    """
+    Grava uma tabela intermediária em data/treated, quando a gravação está ativada (--debug-artifacts).
+    A tabela é copiada e gravada em segundo plano, sem bloquear a etapa seguinte. Com a gravação
+    desativada, não faz nada. Nas etapas executadas por partição da amostra (ver flows.py), o número da
+    partição é incluído no nome do arquivo.
+
+    Parâmetros:
+    nome (str): Nome do arquivo, sem extensão.
+    dados (dataframe): Tabela a ser gravada.
+
+    Exemplos:
+    >>> write_debug_artifact('viagem_completa_classificada', viagem_completa_classificada)
+    """
+    if not CONFIGURACAO_DEPURACAO['ativo']:
+        return
+
+    if prefect.context.get('map_index') is not None:
+        nome = f"{nome}_particao_{prefect.context.get('map_index')}"
+
+    with TRAVA_ESCRITOR:
+        if ESCRITOR_DEPURACAO['thread'] is None or not ESCRITOR_DEPURACAO['thread'].is_alive():
+            os.makedirs(CONFIGURACAO_DEPURACAO['diretorio'], exist_ok=True)
+            ESCRITOR_DEPURACAO['thread'] = threading.Thread(target=debug_writer_loop, name='depuracao', daemon=True)
+            ESCRITOR_DEPURACAO['thread'].start()
+
+    FILA_DEPURACAO.put((nome, CONFIGURACAO_DEPURACAO['formato'], dados.copy()))
+
+
+def wait_debug_artifacts() -> None:
+    """
+    Espera a gravação de todas as tabelas intermediárias enviadas. Deve ser chamada no fim da execução.
+    A espera termina, com as tabelas restantes registradas no log, se a thread de gravação parar ou se
+    a gravação passar do tempo máximo configurado.
+
+    Exemplos:
+    >>> wait_debug_artifacts()
+    """
+    escritor = ESCRITOR_DEPURACAO['thread']
+    if escritor is None:
+        return
+
+    limite = time.time() + CONFIGURACAO_DEPURACAO['tempo_maximo_espera_s']
+    with FILA_DEPURACAO.all_tasks_done:
+        while FILA_DEPURACAO.unfinished_tasks:
+            if not escritor.is_alive() or time.time() > limite:
+                log_info(f'{FILA_DEPURACAO.unfinished_tasks} tabela(s) intermediária(s) não gravada(s): '
+                         f'a gravação foi interrompida ou passou de '
+                         f'{CONFIGURACAO_DEPURACAO["tempo_maximo_espera_s"]} segundos.')
+                return
+            FILA_DEPURACAO.all_tasks_done.wait(timeout=1)
@@ -0,0 +1,102 @@
+### --- Buscas antecipadas e simultâneas das tabelas consultadas --- ###
+
+### --- 1. Importar bibliotecas --- ###
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import prefect
+from utils import *
+
+
+### --- 2. Configuração --- ###
+
+# Configuração das buscas, alterada pelas flags de execução (ver tasks.py)
+CONFIGURACAO_BUSCAS = {
+    'max_concorrencia': 4,  # quantidade máxima de consultas executadas ao mesmo tempo
+}
+
+# Executor das buscas, criado na primeira busca agendada, e as buscas ainda não terminadas
+EXECUTOR_BUSCAS = {'executor': None}
+BUSCAS_PENDENTES = set()
+TRAVA_BUSCAS = threading.Lock()
+
+
+def configure_fetch_scheduler(max_concorrencia: int = None) -> None:
+    """
+    Altera a quantidade máxima de consultas executadas ao mesmo tempo. As buscas agendadas depois da
+    alteração usam um novo executor, e as buscas em andamento terminam no executor anterior.
+
+    Exemplos:
+    >>> configure_fetch_scheduler(max_concorrencia=2)
+    """
+    if max_concorrencia is not None:
+        if max_concorrencia < 1:
+            raise ValueError('A quantidade máxima de consultas simultâneas deve ser maior ou igual a 1.')
+        if max_concorrencia != CONFIGURACAO_BUSCAS['max_concorrencia'] and EXECUTOR_BUSCAS['executor'] is not None:
+            EXECUTOR_BUSCAS['executor'].shutdown(wait=False)
+            EXECUTOR_BUSCAS['executor'] = None
+        CONFIGURACAO_BUSCAS['max_concorrencia'] = max_concorrencia
+
+
+### --- 3. Agendar as buscas --- ###
+
+def schedule_fetch(nome: str, buscar, *args, **kwargs):
+    """
+    Inicia uma busca em segundo plano, sem esperar pelo resultado. As buscas independentes entre si
+    rodam ao mesmo tempo, até o limite configurado. Os dados buscados ficam no registro da execução (ver
+    registered_dataset em slice_store.py): as etapas seguintes, ao pedirem a mesma tabela, esperam a
+    busca em andamento e reaproveitam o resultado.
+
+    Parâmetros:
+    nome (str): Nome da busca, usado no log.
+    buscar (function): Função de busca, como fetch_viagem_completa.
+    *args, **kwargs: Argumentos da função de busca.
+
+    Retorna:
+    Future: A busca agendada.
+
+    Exemplos:
+    >>> schedule_fetch('viagem_completa', fetch_viagem_completa, pares_amostra)
+    """
+    if EXECUTOR_BUSCAS['executor'] is None:
+        EXECUTOR_BUSCAS['executor'] = ThreadPoolExecutor(max_workers=CONFIGURACAO_BUSCAS['max_concorrencia'],
+                                                         thread_name_prefix='busca')
+
+    # O contexto do Prefect (logger, partição da amostra) é de cada thread: a busca roda com o contexto
+    # da etapa que a agendou
+    contexto = prefect.context.to_dict()
+
+    def buscar_com_contexto():
+        with prefect.context(**contexto):
+            return buscar(*args, **kwargs)
+
+    def registrar_falha(busca):
+        with TRAVA_BUSCAS:
+            BUSCAS_PENDENTES.discard(busca)
+        if busca.exception() is not None:
+            with prefect.context(**contexto):
+                log_info(f'A busca antecipada de {nome} falhou ({busca.exception()}). '
+                         f'Os dados serão consultados novamente na etapa que os utiliza.')
+
+    busca = EXECUTOR_BUSCAS['executor'].submit(buscar_com_contexto)
+    with TRAVA_BUSCAS:
+        BUSCAS_PENDENTES.add(busca)
+    busca.add_done_callback(registrar_falha)
+    log_info(f'Busca antecipada de {nome} iniciada.')
+
+    return busca
+
+
+def wait_fetches() -> None:
+    """
+    Espera o fim das buscas agendadas ainda em andamento, inclusive as que nenhuma etapa chegou a usar
+    (por exemplo, quando a execução falha). Deve ser chamada no fim da classificação, antes de remover
+    os dados carregados (ver classify.py), para que uma busca terminada depois não os registre novamente.
+    As falhas das buscas já são registradas no log e não são levantadas.
+
+    Exemplos:
+    >>> wait_fetches()
+    """
+    with TRAVA_BUSCAS:
+        pendentes = list(BUSCAS_PENDENTES)
+
+    wait(pendentes)
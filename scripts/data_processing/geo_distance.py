@@ -0,0 +1,157 @@
+### --- Funções de distância entre pontos geográficos --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import numpy as np
+
+
+### --- 2. Constantes --- ###
+
+# Raio médio da Terra (IUGG), em metros, usado pela fórmula de haversine
+RAIO_MEDIO_TERRA = 6371008.8
+
+# Elipsoide WGS-84, o mesmo usado por padrão no geopy.distance.geodesic
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+METODOS_DISTANCIA = ['haversine', 'elipsoidal']
+
+
+### --- 3. Fórmulas de distância --- ###
+
+def haversine_distance(lat1, lon1, lat2, lon2, raio_terra: float = RAIO_MEDIO_TERRA) -> np.ndarray:
+    """
+    Calcula a distância, em metros, entre pares de pontos considerando a Terra uma esfera.
+
+    Parâmetros:
+    lat1, lon1 (array): Latitude e longitude, em graus, dos primeiros pontos.
+    lat2, lon2 (array): Latitude e longitude, em graus, dos segundos pontos.
+    raio_terra (float): Raio da esfera, em metros.
+
+    Retorna:
+    array: Distância em metros de cada par de pontos.
+
+    Notas:
+    Na latitude do Rio de Janeiro (~22,9° S), o erro em relação ao geopy.distance.geodesic é de no
+    máximo 0,42% da distância (cerca de 2,1 m a 500 m), sendo maior para deslocamentos no sentido
+    norte-sul e menor no sentido leste-oeste.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * raio_terra * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def ellipsoidal_distance(lat1, lon1, lat2, lon2, max_iteracoes: int = 200, tolerancia: float = 1e-12) -> np.ndarray:
+    """
+    Calcula a distância, em metros, entre pares de pontos sobre o elipsoide WGS-84, pela fórmula
+    inversa de Vincenty, avaliada para todos os pares ao mesmo tempo.
+
+    Parâmetros:
+    lat1, lon1 (array): Latitude e longitude, em graus, dos primeiros pontos.
+    lat2, lon2 (array): Latitude e longitude, em graus, dos segundos pontos.
+    max_iteracoes (int): Número máximo de iterações da fórmula.
+    tolerancia (float): Critério de convergência da longitude auxiliar, em radianos.
+
+    Retorna:
+    array: Distância em metros de cada par de pontos.
+
+    Notas:
+    Na região do Rio de Janeiro, a diferença em relação ao geopy.distance.geodesic é menor do que
+    1 mm. A fórmula pode não convergir apenas para pontos quase antípodas, que não ocorrem nos dados.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+
+    f = WGS84_F
+    L = lon2 - lon1
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lamb = L.copy()
+    pendente = np.ones(L.shape, dtype=bool)
+
+    for _ in range(max_iteracoes):
+        sin_lamb, cos_lamb = np.sin(lamb), np.cos(lamb)
+        sin_sigma = np.hypot(cosU2 * sin_lamb, cosU1 * sinU2 - sinU1 * cosU2 * cos_lamb)
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lamb
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+
+        # Pontos coincidentes têm sin_sigma igual a zero
+        sin_alpha = np.divide(cosU1 * cosU2 * sin_lamb, sin_sigma,
+                              out=np.zeros_like(sin_sigma), where=sin_sigma > 0)
+        cos2_alpha = 1 - sin_alpha ** 2
+
+        # Pontos sobre a linha do equador têm cos2_alpha igual a zero
+        cos_2sigma_m = np.where(cos2_alpha > 0,
+                                cos_sigma - np.divide(2 * sinU1 * sinU2, cos2_alpha,
+                                                      out=np.zeros_like(cos2_alpha), where=cos2_alpha > 0),
+                                0.0)
+
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lamb_anterior = lamb
+        lamb = np.where(pendente,
+                        L + (1 - C) * f * sin_alpha * (sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))),
+                        lamb)
+
+        pendente = np.abs(lamb - lamb_anterior) > tolerancia
+        if not pendente.any():
+            break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+                                   B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+
+    return WGS84_B * A * (sigma - delta_sigma)
+
+
+def distance(lat1, lon1, lat2, lon2, metodo: str = 'elipsoidal') -> np.ndarray:
+    """
+    Calcula a distância, em metros, entre pares de pontos usando o método escolhido.
+
+    Parâmetros:
+    lat1, lon1 (array): Latitude e longitude, em graus, dos primeiros pontos.
+    lat2, lon2 (array): Latitude e longitude, em graus, dos segundos pontos.
+    metodo (str): 'elipsoidal' (Vincenty, WGS-84) ou 'haversine' (esfera, mais rápido e menos exato).
+
+    Retorna:
+    array: Distância em metros de cada par de pontos.
+
+    Exemplos:
+    >>> distance(dados_gps['latitude'], dados_gps['longitude'], -22.9, -43.2, metodo='haversine')
+    """
+    if metodo == 'haversine':
+        return haversine_distance(lat1, lon1, lat2, lon2)
+    elif metodo == 'elipsoidal':
+        return ellipsoidal_distance(lat1, lon1, lat2, lon2)
+    else:
+        raise ValueError(f"Método de distância inválido: {metodo}. Use um dos métodos: {METODOS_DISTANCIA}")
+
+
+### --- 4. Verificação de raio --- ###
+
+def within_radius(lat1, lon1, lat2, lon2, raio: float = 500, tolerancia: float = 0,
+                  metodo: str = 'elipsoidal') -> np.ndarray:
+    """
+    Verifica se os pares de pontos estão a até raio + tolerancia metros de distância.
+
+    Parâmetros:
+    lat1, lon1 (array): Latitude e longitude, em graus, dos primeiros pontos.
+    lat2, lon2 (array): Latitude e longitude, em graus, dos segundos pontos.
+    raio (float): Raio, em metros.
+    tolerancia (float): Margem, em metros, somada ao raio. Com o método 'haversine', uma tolerância de
+    0,42% do raio (2,1 m para 500 m) garante que nenhum ponto dentro do raio elipsoidal seja descartado.
+    metodo (str): 'elipsoidal' ou 'haversine'.
+
+    Retorna:
+    array: 1 para os pares dentro do raio e 0 caso contrário.
+
+    Exemplos:
+    >>> within_radius(lat_ponto_inicial, lon_ponto_inicial, lat_gps, lon_gps, raio=500, tolerancia=2.1, metodo='haversine')
+    """
+    return (distance(lat1, lon1, lat2, lon2, metodo=metodo) <= raio + tolerancia).astype(int)
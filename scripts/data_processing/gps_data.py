@@ -1,4 +1,4 @@
-import argparse
+import numpy as np
 import pandas as pd
 import sys
 
@@ -6,104 +6,188 @@ from utils import *
 from queries_functions import *
 from categorize_trips import *
 from treat_data import *
+from cache_files import *
+from slice_store import *
+from interval_search import *
+from gps_store import *
+from debug_artifacts import *
+from unattended_mode import *
 
-parser = argparse.ArgumentParser(description="Execute o script run.py com opções.")
 
-# permite usar o cache para não baixar novamente os dados da última consulta no big query
-parser.add_argument('--cache', action='store_true', help="Ative o cache")
-args = parser.parse_args()
-cache = "on" if args.cache else "off"
 
+def clip_gps_to_trips(dados_gps: pd.DataFrame, viagens: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mantém apenas os sinais de GPS emitidos durante alguma viagem da amostra, do mesmo veículo e data
+    (entre a partida e a chegada, inclusive). Os sinais são guardados por dia inteiro (ver slice_store.py).
 
-def gps_data(todas_as_viagens: pd.DataFrame) -> pd.DataFrame:
-    
+    Parâmetros:
+    dados_gps (dataframe): Sinais de GPS com as colunas data, id_veiculo e timestamp_gps.
+    viagens (dataframe): Viagens da amostra.
+
+    Retorna:
+    dataframe: Os sinais de GPS das viagens, ordenados por timestamp_gps.
+
+    Exemplos:
+    >>> clip_gps_to_trips(fetch_gps(vehicle_day_pairs(linhas_nan)), linhas_nan)
     """
-    Esta função realiza o acesso, o tratamento e a classificação dos dados de GPS.   
+    if dados_gps.empty:
+        return dados_gps
+
+    # Código de cada par (data, id_veiculo), para as viagens e para os sinais
+    pares = pd.MultiIndex.from_frame(vehicle_day_pairs(viagens))
+    grupos_viagens = pares.get_indexer(pd.MultiIndex.from_arrays([pd.to_datetime(viagens['data']).dt.strftime('%Y-%m-%d'),
+                                                                  viagens['id_veiculo_amostra'].astype(str)]))
+    grupos_gps = pares.get_indexer(pd.MultiIndex.from_arrays([dados_gps['data'], dados_gps['id_veiculo']]))
+
+    partida = viagens['datetime_partida_amostra'].to_numpy()
+    chegada = viagens['datetime_chegada_amostra'].to_numpy()
+    validas = np.flatnonzero((grupos_viagens >= 0) & ~np.isnat(partida) & ~np.isnat(chegada))
+
+    _, posicao_gps = window_pairs(grupos_gps, dados_gps['timestamp_gps'].to_numpy(), grupos_viagens[validas],
+                                  partida[validas], chegada[validas])
+
+    return dados_gps.iloc[np.unique(posicao_gps)].sort_values(by='timestamp_gps').reset_index(drop=True)
+
+
+def confirm_gps_query(pares_faltantes: pd.DataFrame) -> bool:
+    """
+    Confirma se a query dos dados de GPS deve ser feita, pela estimativa dos bytes lidos (apenas quando
+    faltarem dados no cache e a consulta for feita no Big Query). No modo não interativo, a consulta é
+    liberada pelo orçamento da execução, sem perguntar ao usuário (ver unattended_mode.py).
+
+    Parâmetros:
+    pares_faltantes (dataframe): Pares (data, id_veiculo) que não estão guardados localmente.
+
+    Retorna:
+    bool: True se a consulta pode ser feita, False caso contrário.
+
+    Exemplos:
+    >>> confirm_gps_query(missing_slices('dados_gps', pares_nan))
+    """
+    if pares_faltantes.empty or CONFIGURACAO_BACKEND['backend'] != 'bigquery':
+        return True
+
+    if not confirm_query_cost('dados de GPS', estimate_gps_bytes(pares_faltantes)):
+        return False
+
+    log_info('Continuando a execução...')
+    return True
+
+
+def load_trip_gps(todas_as_viagens: pd.DataFrame):
     """
+    Acessa e trata os sinais de GPS das viagens ainda sem status e os guarda para as etapas seguintes
+    (ver gps_store.py). Também é usada para guardar novamente os sinais quando a etapa de GPS é lida
+    do checkpoint (ver stage_checkpoints.py).
+
+    Parâmetros:
+    todas_as_viagens (dataframe): Viagens classificadas nas etapas anteriores.
+
+    Retorna:
+    dataframe: Os sinais de GPS tratados, ou None caso a consulta não seja liberada.
 
+    Exemplos:
+    >>> dados_gps = load_trip_gps(viagens_circulares_classificadas)
+    """
     linhas_nan = todas_as_viagens[pd.isna(todas_as_viagens['status'])]
 
-    datas_unicas = len(linhas_nan['data'].drop_duplicates())
-    estimativa_custo = (datas_unicas * 400) / 1000 
+    # Apenas os pares (data, veículo) ainda não guardados localmente são consultados
+    pares_nan = vehicle_day_pairs(linhas_nan)
+    pares_faltantes = missing_slices('dados_gps', pares_nan)
+
+    if not confirm_gps_query(pares_faltantes):
+        return None
 
-    proceed = False
+    ### --- 7.1 Acessar os sinais de GPS --- ###
+    dados_gps = fetch_gps(pares_nan)
+    dados_gps = clip_gps_to_trips(dados_gps, linhas_nan)
+
+    log_info('Acesso aos sinais de GPS concluído com sucesso.')
     
-    # Confirmar se a query dos dados de GPS deve ser feita
-    if not args.cache:
-        response = ""
-        while response not in ['y', 'n']:
-            response = input(f"Estimativa de consumo de {estimativa_custo} GB para consulta de dados de GPS. Deseja continuar? (y/n): ").lower()
-        if response == 'y':
-            print("Continuando a execução...")
-            proceed = True
-    else:
-        proceed = True
+    ### --- 7.2 Tratar os sinais de GPS --- ###
+    dados_gps = treat_gps(dados_gps)
+    log_info('Tratamento de dados de GPS concluído com sucesso.')
 
-    if proceed: # Executar caso o comando contenha a flag "cache" ou a resposta seja y
-        
-        ### --- 7.1 Acessar os sinais de GPS --- ###
-        if args.cache:
-            dados_gps = pd.read_csv('../data/cache/dados_gps.csv') 
-        
-        else:
-            dados_gps = query_gps(linhas_nan)
-            dados_gps.to_csv('../data/cache/dados_gps.csv', index = False)
+    # Os sinais de GPS da execução ficam disponíveis para as etapas seguintes, por data e veículo
+    write_gps_store(dados_gps)
 
-        log_info('Acesso aos sinais de GPS concluído com sucesso.')
-        
-        ### --- 7.2 Tratar os sinais de GPS --- ###
-        dados_gps = treat_gps(dados_gps)
-        log_info('Tratamento de dados de GPS concluído com sucesso.')
+    return dados_gps
 
 
+def prefetch_trip_gps(todas_as_viagens: pd.DataFrame) -> bool:
+    """
+    Confirma e faz, de uma só vez para todas as partições da amostra, a consulta dos sinais de GPS das
+    viagens ainda sem status que não estão guardados localmente. A pergunta sobre o consumo estimado é
+    feita uma única vez na execução, e as etapas de GPS de cada partição (load_trip_gps) leem os sinais
+    guardados, sem nova consulta.
+
+    Parâmetros:
+    todas_as_viagens (dataframe): Viagens de todas as partições, classificadas nas etapas anteriores.
+
+    Retorna:
+    bool: True se os sinais estão guardados, False caso a consulta não seja liberada.
+
+    Exemplos:
+    >>> prefetch_trip_gps(pd.concat(viagens_circulares_classificadas))
+    """
+    linhas_nan = todas_as_viagens[pd.isna(todas_as_viagens['status'])]
+    pares_faltantes = missing_slices('dados_gps', vehicle_day_pairs(linhas_nan))
+
+    if pares_faltantes.empty:
+        return True
+
+    if not confirm_gps_query(pares_faltantes):
+        return False
+
+    # Os sinais são apenas guardados: cada partição lê os seus na etapa de GPS
+    update_slices('dados_gps', pares_faltantes, query_gps)
+
+    return True
+
+
+def stop_refused_gps_query():
+    """
+    Interrompe a execução quando a consulta dos dados de GPS não é liberada: por exceder o orçamento
+    da execução, no modo não interativo, ou pela resposta do usuário.
+    """
+    if CONFIGURACAO_NAO_INTERATIVO['ativo']:  # caso a estimativa exceda o orçamento da execução
+        raise RuntimeError('A consulta dos dados de GPS excede o orçamento de GB lidos da execução.')
+
+    # caso a resposta seja n na pergunta "Deseja continuar? (y/n):"
+    log_info('Execução do algoritmo finalizada pelo usuário.')
+    sys.exit()
+
+
+def gps_data(todas_as_viagens: pd.DataFrame) -> pd.DataFrame:
+    
+    """
+    Esta função realiza o acesso, o tratamento e a classificação dos dados de GPS.   
+    """
+
+    dados_gps = load_trip_gps(todas_as_viagens)
+
+    if dados_gps is not None: # Executar caso a consulta esteja no cache ou a resposta seja y
+
         ### --- 7.3 Comparar amostra com os sinais de GPS --- ###
         viagens_gps_classificadas_nan = todas_as_viagens[todas_as_viagens['status'].isna()]
         viagens_gps_classificadas_not_nan = todas_as_viagens[todas_as_viagens['status'].notna()]    
 
-        # Aplicar a função quando o status da viagem for nan
-        results = viagens_gps_classificadas_nan.apply(lambda row: check_gps(row, dados_gps), axis=1)
-        viagens_gps_classificadas_nan['status'] = results.apply(lambda x: x[0])
-        viagens_gps_classificadas_nan['servico_apurado'] = results.apply(lambda x: x[1])
+        # Classificar de uma só vez as viagens com status nan
+        results = check_gps(viagens_gps_classificadas_nan, dados_gps)
+        viagens_gps_classificadas_nan['status'] = results['status']
+        viagens_gps_classificadas_nan['servico_apurado'] = results['servico_apurado']
 
         # Juntar tabela com status nan e status não nan
         viagens_gps_classificadas = pd.concat([viagens_gps_classificadas_nan, viagens_gps_classificadas_not_nan], ignore_index=True)
 
         # Quando houver sinal de GPS para um serviço além do serviço da amostra, deixar apenas o
         # serviço diferente da amostra em serviço apurado (para realizar o reprocessamento de forma correta)
-        
-        def remover_valor(row): 
-            if pd.isna(row['servico_apurado']) or pd.isna(row['servico_amostra']):
-                return ""
-            elif str(row['servico_amostra']) != str(row['servico_apurado']):
-                valor_a_remover = str(row['servico_amostra']) 
-
-                # Divide o servico_apurado em partes, separadas por ','
-                partes = row['servico_apurado'].split(',')
-
-                # Remove o valor a ser removido de cada parte, verificando condições
-                partes_modificadas = [p.strip().replace(valor_a_remover, '') 
-                                    if (
-                                        p.strip()[0].isdigit() or 
-                                        p.strip() == valor_a_remover
-                                    ) else p.strip() 
-                                    for p in partes]
-
-                # Junta as partes modificadas de volta em uma string e retorna
-                # Garantindo que não há espaços e vírgulas extras
-                resultado = ', '.join([p for p in partes_modificadas if p]).strip()
-                
-                # Removendo possíveis vírgulas extras no final
-                return resultado.rstrip(', ')
-            else:
-                return row['servico_apurado']
-    
-
-        viagens_gps_classificadas['servico_apurado'] = viagens_gps_classificadas.apply(remover_valor, axis=1)
+        viagens_gps_classificadas['servico_apurado'] = remove_sample_service(viagens_gps_classificadas['servico_apurado'],
+                                                                             viagens_gps_classificadas['servico_amostra'])
 
-        viagens_gps_classificadas.to_excel('../data/treated/viagens_gps_classificadas.xlsx', index = False)
+        write_debug_artifact('viagens_gps_classificadas', viagens_gps_classificadas)
         
         return viagens_gps_classificadas 
 
-    else: # caso a resposta seja n na pergunta "Deseja continuar? (y/n):"
-        log_info('Execução do algoritmo finalizada pelo usuário.')
-        sys.exit()
\ No newline at end of file
+    else:
+        stop_refused_gps_query()
\ No newline at end of file
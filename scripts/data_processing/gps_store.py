@@ -0,0 +1,109 @@
+### --- Sinais de GPS da execução, particionados por data e veículo --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+from utils import *
+from treat_data import *
+from cache_files import *
+
+
+### --- 2. Configuração --- ###
+
+# Os sinais de GPS da execução ficam em um arquivo Arrow por data, ordenados por veículo e horário,
+# e o índice de cada data guarda o intervalo de linhas de cada veículo no arquivo. Os arquivos não são
+# comprimidos, para que possam ser lidos por mapeamento de memória, sem cópia.
+DIRETORIO_GPS = os.path.join(DIRETORIO_CACHE, 'gps')
+
+
+def gps_partition_path(data: str) -> str:
+    return os.path.join(DIRETORIO_GPS, f'{data}.arrow')
+
+
+def gps_index_path(data: str) -> str:
+    return os.path.join(DIRETORIO_GPS, f'{data}.json')
+
+
+def clear_gps_store() -> None:
+    """
+    Remove os sinais de GPS da execução anterior. Deve ser chamada no início da execução.
+    """
+    shutil.rmtree(DIRETORIO_GPS, ignore_errors=True)
+    os.makedirs(DIRETORIO_GPS, exist_ok=True)
+
+
+### --- 3. Gravar os sinais de GPS --- ###
+
+def write_gps_store(dados_gps: pd.DataFrame) -> None:
+    """
+    Grava os sinais de GPS da execução (já tratados por treat_gps), substituindo os sinais guardados das
+    mesmas datas. É usada para passar os sinais de GPS para as etapas seguintes (check_start_end_gps e
+    automate_map). As partições da amostra (ver flows.py) têm datas diferentes e gravam arquivos diferentes.
+
+    Parâmetros:
+    dados_gps (dataframe): Sinais de GPS, com as colunas data, id_veiculo e timestamp_gps.
+
+    Exemplos:
+    >>> write_gps_store(dados_gps)
+    """
+    os.makedirs(DIRETORIO_GPS, exist_ok=True)
+
+    dados_gps = cast_columns(dados_gps, TIPOS_GPS).sort_values(['data', 'id_veiculo', 'timestamp_gps'],
+                                                               kind='stable')
+    for data, sinais in dados_gps.groupby('data', sort=False):
+        sinais = sinais.reset_index(drop=True)
+        tabela = pa.Table.from_pandas(sinais, preserve_index=False)
+
+        with pa.OSFile(gps_partition_path(data), 'wb') as arquivo:
+            with pa.ipc.new_file(arquivo, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+
+        # Intervalo [inicio, fim) das linhas de cada veículo no arquivo da data
+        veiculos = sinais['id_veiculo']
+        inicio = veiculos.drop_duplicates(keep='first')
+        fim = veiculos.drop_duplicates(keep='last')
+        indice = {veiculo: [int(i), int(f) + 1] for veiculo, i, f in zip(inicio, inicio.index, fim.index)}
+
+        with open(gps_index_path(data), 'w', encoding='utf-8') as arquivo:
+            json.dump(indice, arquivo)
+
+
+### --- 4. Ler os sinais de GPS --- ###
+
+def read_gps_store(pares: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lê os sinais de GPS da execução apenas para os pares (data, id_veiculo) informados. Os arquivos
+    são mapeados em memória e apenas as linhas dos veículos pedidos são convertidas em dataframe.
+
+    Parâmetros:
+    pares (dataframe): Pares necessários, como retornado por vehicle_day_pairs.
+
+    Retorna:
+    dataframe: Os sinais de GPS dos pares, ordenados por data, veículo e horário.
+
+    Exemplos:
+    >>> read_gps_store(vehicle_day_pairs(viagens_com_gps))
+    """
+    partes = []
+    for data, veiculos in pares.groupby('data', sort=True)['id_veiculo']:
+        if not os.path.exists(gps_index_path(data)):
+            continue
+
+        with open(gps_index_path(data), encoding='utf-8') as arquivo:
+            indice = json.load(arquivo)
+
+        intervalos = [indice[veiculo] for veiculo in sorted(set(veiculos)) if veiculo in indice]
+        if not intervalos:
+            continue
+
+        tabela = pa.ipc.open_file(pa.memory_map(gps_partition_path(data), 'r')).read_all()
+        partes.extend([tabela.slice(inicio, fim - inicio) for inicio, fim in intervalos])
+
+    if not partes:
+        return pd.DataFrame({coluna: pd.Series(dtype=object if tipo == 'str' else tipo)
+                             for coluna, tipo in TIPOS_GPS.items()})
+
+    return pa.concat_tables(partes).to_pandas()
@@ -1,19 +1,212 @@
+### --- Importação da amostra --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import codecs
 import os
 import pandas as pd
 from utils import *
 
-def import_sample() -> pd.DataFrame:
 
-    dir_path = './../data/raw'
-    files = [f for f in os.listdir(dir_path) if f.endswith('.xlsx')]
+### --- 2. Configuração --- ###
+
+DIRETORIO_AMOSTRA = './../data/raw'
+
+# Quantidade de linhas lidas de cada vez. Os arquivos csv e parquet são lidos em blocos, que são
+# convertidos para os tipos da amostra antes de serem concatenados.
+LINHAS_POR_BLOCO = 100_000
+
+# Tipo de cada coluna da amostra ('str' mantém os valores vazios como nulos e 'Int64' mantém os inteiros
+# com valores vazios). As demais colunas do arquivo são mantidas como foram lidas.
+TIPOS_AMOSTRA = {'data': 'datetime64[ns]', 'hora_inicio': 'str', 'hora_fim': 'str', 'servico': 'str',
+                 'sentido': 'str', 'id_veiculo': 'str', 'flag_reprocessamento': 'Int64', 'protocolo': 'str'}
+
+# Codificações aceitas nos arquivos csv, na ordem em que são tentadas. Os arquivos exportados pelo Excel
+# em português (separados por ponto e vírgula) costumam ser gravados em cp1252.
+CODIFICACOES_CSV = ['utf-8-sig', 'cp1252', 'latin-1']
+
+
+def parse_sample_dates(datas: pd.Series) -> pd.Series:
+    """
+    Converte a coluna data da amostra. Os textos são lidos no formato ISO ('AAAA-MM-DD', com ou sem hora)
+    ou no formato do Excel em português ('DD/MM/AAAA'), nunca com o mês antes do dia. Datas já convertidas
+    na leitura (xlsx e parquet) são mantidas.
+
+    Parâmetros:
+    datas (series): Coluna data de um bloco da amostra.
+
+    Retorna:
+    series: As datas convertidas. Valores vazios viram NaT.
+
+    Exemplos:
+    >>> parse_sample_dates(pd.Series(['2022-11-10', '13/11/2022'])).dt.strftime('%Y-%m-%d').tolist()
+    ['2022-11-10', '2022-11-13']
+    """
+    if pd.api.types.is_datetime64_any_dtype(datas):
+        return datas
+
+    eh_texto = datas.map(lambda valor: isinstance(valor, str))
+    texto = datas.where(eh_texto).str.strip()
+    iso = texto.str.match(r'^\d{4}-\d{2}-\d{2}([ T].*)?$', na=False)
+    dia_mes_ano = texto.str.match(r'^\d{1,2}/\d{1,2}/\d{4}$', na=False)
+
+    # Valores que não são texto (datas do xlsx ou do parquet) são convertidos diretamente
+    convertidas = pd.to_datetime(datas.where(~eh_texto), errors='coerce')
+    convertidas[iso] = pd.to_datetime(texto[iso], errors='coerce')
+    convertidas[dia_mes_ano] = pd.to_datetime(texto[dia_mes_ano], format='%d/%m/%Y', errors='coerce')
+
+    # Textos vazios são datas vazias. As demais datas que não foram convertidas interrompem a importação.
+    preenchidas = datas.notna() & ~(eh_texto & (texto == ''))
+    invalidas = datas[preenchidas & convertidas.isna()]
+    if not invalidas.empty:
+        raise ValueError(f'{len(invalidas)} data(s) da amostra em formato não reconhecido (use AAAA-MM-DD ou '
+                         f'DD/MM/AAAA): {", ".join(map(str, invalidas.unique()[:5]))}.')
+
+    return convertidas
+
+
+def cast_sample_columns(bloco: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas de um bloco da amostra para os tipos de TIPOS_AMOSTRA.
+
+    Exemplos:
+    >>> cast_sample_columns(pd.DataFrame({'id_veiculo': [12345], 'data': ['2022-10-10']}))
+    """
+    for coluna, tipo in TIPOS_AMOSTRA.items():
+        if coluna not in bloco.columns:
+            continue
+
+        if tipo == 'str':
+            bloco[coluna] = bloco[coluna].astype(str).where(bloco[coluna].notna())
+        elif tipo == 'datetime64[ns]':
+            bloco[coluna] = parse_sample_dates(bloco[coluna])
+        else:
+            bloco[coluna] = pd.to_numeric(bloco[coluna]).astype(tipo)
+
+    return bloco
+
+
+### --- 3. Leitura dos arquivos em blocos --- ###
+
+def read_xlsx_file(caminho: str):
+    """
+    Lê a primeira aba de um arquivo xlsx com pd.read_excel, em um único bloco (a leitura linha a linha
+    do openpyxl é mais lenta que a do pd.read_excel). A primeira linha da aba é o cabeçalho. As colunas
+    de texto da amostra são lidas como texto, para que os veículos não virem decimais (12345.0) quando
+    há células vazias.
+    """
+    tipos = {coluna: str for coluna, tipo in TIPOS_AMOSTRA.items() if tipo == 'str'}
+
+    yield pd.read_excel(caminho, sheet_name=0, dtype=tipos)
+
+
+def csv_encoding(caminho: str) -> str:
+    """
+    Identifica a codificação de um arquivo csv: a primeira de CODIFICACOES_CSV que decodifica o arquivo
+    inteiro, lido em blocos.
+
+    Exemplos:
+    >>> csv_encoding('./../data/raw/amostra_excel.csv')
+    'cp1252'
+    """
+    for codificacao in CODIFICACOES_CSV:
+        decodificador = codecs.getincrementaldecoder(codificacao)()
+        try:
+            with open(caminho, 'rb') as arquivo:
+                for bloco in iter(lambda: arquivo.read(1024 ** 2), b''):
+                    decodificador.decode(bloco)
+                decodificador.decode(b'', final=True)
+            return codificacao
+        except UnicodeDecodeError:
+            continue
+
+    return CODIFICACOES_CSV[-1]
+
+
+def read_csv_chunks(caminho: str):
+    """
+    Lê um arquivo csv em blocos de LINHAS_POR_BLOCO linhas. As colunas de texto da amostra são lidas
+    como texto, para manter, por exemplo, os zeros à esquerda dos serviços. Arquivos que não estão em
+    UTF-8 são lidos em cp1252 (exportação do Excel em português).
+    """
+    tipos = {coluna: str for coluna, tipo in TIPOS_AMOSTRA.items() if tipo == 'str'}
+    codificacao = csv_encoding(caminho)
+
+    # O separador pode ser vírgula ou ponto e vírgula, identificado pelo cabeçalho
+    with open(caminho, encoding=codificacao) as arquivo:
+        cabecalho = arquivo.readline()
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+
+    yield from pd.read_csv(caminho, dtype=tipos, sep=separador, encoding=codificacao, chunksize=LINHAS_POR_BLOCO)
+
+
+def read_parquet_chunks(caminho: str):
+    """
+    Lê um arquivo parquet em blocos de LINHAS_POR_BLOCO linhas.
+    """
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(caminho)
+    for lote in arquivo.iter_batches(batch_size=LINHAS_POR_BLOCO):
+        yield lote.to_pandas()
+
+
+# Função de leitura de cada formato aceito
+LEITORES_AMOSTRA = {
+    '.xlsx': read_xlsx_file,
+    '.csv': read_csv_chunks,
+    '.parquet': read_parquet_chunks,
+}
+
+
+### --- 4. Importar a amostra --- ###
+
+def sample_files(dir_path: str = DIRETORIO_AMOSTRA) -> list:
+    """
+    Lista os arquivos da amostra, nos formatos de LEITORES_AMOSTRA, em ordem alfabética. Arquivos
+    temporários do Excel (iniciados por ~$) são ignorados.
+
+    Exemplos:
+    >>> sample_files()
+    ['amostra_1000_movidesk.xlsx']
+    """
+    return sorted([f for f in os.listdir(dir_path)
+                   if os.path.splitext(f)[1].lower() in LEITORES_AMOSTRA and not f.startswith('~$')])
+
+
+def import_sample(dir_path: str = DIRETORIO_AMOSTRA) -> pd.DataFrame:
+    """
+    Importa a amostra a partir de todos os arquivos xlsx, csv e parquet da pasta data/raw. Cada arquivo é
+    lido em blocos (os arquivos xlsx, de uma vez), com as colunas convertidas para os tipos de TIPOS_AMOSTRA,
+    e os blocos de todos os arquivos são concatenados em uma única amostra. A coluna arquivo_origem indica o arquivo de cada viagem.
+
+    Parâmetros:
+    dir_path (str): Pasta dos arquivos da amostra.
+
+    Retorna:
+    dataframe: A amostra, com as viagens na ordem dos arquivos (em ordem alfabética) e das linhas.
+
+    Exemplos:
+    >>> import_sample()
+    """
+    arquivos = sample_files(dir_path)
+
+    if not arquivos:
+        raise FileNotFoundError(f'Nenhum arquivo xlsx, csv ou parquet encontrado na pasta "{dir_path}".')
+
+    blocos = []
+    for arquivo in arquivos:
+        leitor = LEITORES_AMOSTRA[os.path.splitext(arquivo)[1].lower()]
+        linhas = 0
+
+        for bloco in leitor(os.path.join(dir_path, arquivo)):
+            bloco = cast_sample_columns(bloco)
+            bloco['arquivo_origem'] = arquivo
+            blocos.append(bloco)
+            linhas += len(bloco)
 
-    if len(files) == 1:
-        file_path = os.path.join(dir_path, files[0])
-        amostra = pd.read_excel(file_path)
-        log_info('Importação da amostra realizada com sucesso.')
+        log_info(f'Arquivo {arquivo} importado: {linhas} viagens.')
 
+    amostra = pd.concat(blocos, ignore_index=True)
+    log_info(f'Importação da amostra realizada com sucesso: {len(amostra)} viagens de {len(arquivos)} arquivo(s).')
 
-    else:
-        log_info('Nenhum arquivo encontrado ou existe mais de um arquivo no formato xlsx dentro da pasta "data/raw".')
-    
-    return amostra
\ No newline at end of file
+    return amostra
@@ -0,0 +1,204 @@
+### --- Funções de busca em intervalos ordenados --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import numpy as np
+
+
+### --- 2. Busca binária por grupo --- ###
+
+def group_searchsorted(ref_grupos: np.ndarray, ref_valores: np.ndarray,
+                       grupos: np.ndarray, valores: np.ndarray, side: str = 'left') -> np.ndarray:
+    """
+    Equivalente ao np.searchsorted, mas restrito ao grupo de cada valor buscado (por exemplo, o
+    id_veiculo). As referências devem estar ordenadas por grupo e, dentro do grupo, por valor.
+
+    Parâmetros:
+    ref_grupos (array): Códigos inteiros dos grupos das referências.
+    ref_valores (array): Valores ordenados das referências (inteiros ou datetime64).
+    grupos (array): Códigos inteiros dos grupos dos valores buscados.
+    valores (array): Valores buscados.
+    side (str): 'left' ou 'right', como no np.searchsorted.
+
+    Retorna:
+    array: Posições de inserção nas referências. Valores de grupos ausentes retornam a posição
+    em que o grupo estaria.
+
+    Exemplos:
+    >>> group_searchsorted(veiculos_viagem, partidas_viagem, veiculos_amostra, partidas_amostra)
+    """
+    ref_valores = np.asarray(ref_valores)
+    valores = np.asarray(valores)
+
+    # Os valores são substituídos pelo seu posto, para que a chave (grupo, valor) caiba em um inteiro
+    _, postos = np.unique(np.concatenate([ref_valores, valores]), return_inverse=True)
+    postos = postos.reshape(-1)
+    n_postos = np.int64(postos.max() + 1) if len(postos) else np.int64(1)
+
+    ref_chave = np.asarray(ref_grupos, dtype=np.int64) * n_postos + postos[:len(ref_valores)]
+    chave = np.asarray(grupos, dtype=np.int64) * n_postos + postos[len(ref_valores):]
+
+    return np.searchsorted(ref_chave, chave, side=side)
+
+
+### --- 3. Mínimo em intervalos de posições --- ###
+
+def range_min(valores: np.ndarray, inicio: np.ndarray, fim: np.ndarray) -> np.ndarray:
+    """
+    Calcula o mínimo de valores[inicio:fim] para cada par (inicio, fim) usando uma sparse table,
+    em O(n log n). Os intervalos devem ser não vazios.
+
+    Parâmetros:
+    valores (array): Valores inteiros.
+    inicio (array): Posições iniciais (inclusivas).
+    fim (array): Posições finais (exclusivas).
+
+    Retorna:
+    array: O mínimo de cada intervalo.
+    """
+    valores = np.asarray(valores, dtype=np.int64)
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fim = np.asarray(fim, dtype=np.int64)
+
+    resultado = np.empty(len(inicio), dtype=np.int64)
+    if len(inicio) == 0:
+        return resultado
+
+    nivel = np.floor(np.log2(fim - inicio)).astype(np.int64)
+    tabela = valores
+
+    for k in range(nivel.max() + 1):
+        if k > 0:
+            passo = 1 << (k - 1)
+            tabela = np.minimum(tabela[:-passo], tabela[passo:])
+
+        selecao = nivel == k
+        resultado[selecao] = np.minimum(tabela[inicio[selecao]],
+                                        tabela[fim[selecao] - (1 << k)])
+
+    return resultado
+
+
+def range_min_cover(n: int, inicio: np.ndarray, fim: np.ndarray, valores: np.ndarray) -> np.ndarray:
+    """
+    Operação inversa de range_min: para cada posição de 0 a n-1, calcula o mínimo dos valores
+    dos intervalos [inicio, fim) que cobrem a posição.
+
+    Parâmetros:
+    n (int): Quantidade de posições.
+    inicio (array): Posições iniciais (inclusivas).
+    fim (array): Posições finais (exclusivas).
+    valores (array): Valor inteiro associado a cada intervalo.
+
+    Retorna:
+    array: O mínimo por posição. Posições não cobertas recebem o maior int64.
+    """
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fim = np.asarray(fim, dtype=np.int64)
+    valores = np.asarray(valores, dtype=np.int64)
+    vazio = np.iinfo(np.int64).max
+
+    if len(inicio) == 0:
+        return np.full(n, vazio, dtype=np.int64)
+
+    nivel = np.floor(np.log2(fim - inicio)).astype(np.int64)
+    n_niveis = nivel.max() + 1
+
+    # Cada intervalo é decomposto em dois blocos de tamanho 2^k que se sobrepõem
+    tabelas = [np.full(n - (1 << k) + 1, vazio, dtype=np.int64) for k in range(n_niveis)]
+    for k in range(n_niveis):
+        selecao = nivel == k
+        np.minimum.at(tabelas[k], inicio[selecao], valores[selecao])
+        np.minimum.at(tabelas[k], fim[selecao] - (1 << k), valores[selecao])
+
+    # Propaga os blocos de cada nível para as duas metades do nível abaixo
+    for k in range(n_niveis - 1, 0, -1):
+        passo = 1 << (k - 1)
+        tamanho = len(tabelas[k])
+        tabelas[k - 1][:tamanho] = np.minimum(tabelas[k - 1][:tamanho], tabelas[k])
+        tabelas[k - 1][passo:passo + tamanho] = np.minimum(tabelas[k - 1][passo:passo + tamanho], tabelas[k])
+
+    return tabelas[0]
+
+
+### --- 4. Pares dentro de janelas --- ###
+
+def window_pairs(ref_grupos: np.ndarray, ref_valores: np.ndarray,
+                 grupos: np.ndarray, inicio: np.ndarray, fim: np.ndarray) -> tuple:
+    """
+    Encontra, para cada janela [inicio, fim] buscada, todas as referências do mesmo grupo cujo valor
+    está dentro da janela (limites inclusivos). O custo é proporcional à quantidade de pares
+    encontrados, e não ao produto entre buscas e referências.
+
+    Parâmetros:
+    ref_grupos (array): Códigos inteiros dos grupos das referências.
+    ref_valores (array): Valores das referências (não precisam estar ordenados).
+    grupos (array): Códigos inteiros dos grupos das janelas buscadas.
+    inicio (array): Limite inferior de cada janela.
+    fim (array): Limite superior de cada janela.
+
+    Retorna:
+    tuple: Dois arrays com as posições das janelas e das referências de cada par encontrado.
+
+    Exemplos:
+    >>> posicao_amostra, posicao_viagem = window_pairs(veiculos_viagem, partidas_viagem, veiculos_amostra, inicio, fim)
+    """
+    ref_grupos = np.asarray(ref_grupos, dtype=np.int64)
+    ref_valores = np.asarray(ref_valores)
+
+    ordem = np.lexsort((ref_valores, ref_grupos))
+    ref_grupos, ref_valores = ref_grupos[ordem], ref_valores[ordem]
+
+    primeiro = group_searchsorted(ref_grupos, ref_valores, grupos, inicio, side='left')
+    ultimo = group_searchsorted(ref_grupos, ref_valores, grupos, fim, side='right')
+    quantidade = np.maximum(ultimo - primeiro, 0)
+
+    posicao_busca = np.repeat(np.arange(len(quantidade)), quantidade)
+    deslocamento = np.arange(len(posicao_busca)) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+    posicao_ref = ordem[primeiro[posicao_busca] + deslocamento]
+
+    return posicao_busca, posicao_ref
+
+
+### --- 5. Intervalos que contêm um valor --- ###
+
+def first_containing_interval(ref_grupos: np.ndarray, ref_inicio: np.ndarray, ref_fim: np.ndarray,
+                              grupos: np.ndarray, valores: np.ndarray) -> np.ndarray:
+    """
+    Encontra, para cada valor buscado, o primeiro intervalo de referência (na ordem original) do mesmo
+    grupo que contém o valor, ou seja, com ref_inicio <= valor <= ref_fim.
+
+    Os intervalos são indexados pelo início, por grupo. Apenas os intervalos que começaram até a
+    duração máxima antes de cada valor são candidatos, o que mantém o custo proporcional à quantidade
+    de intervalos sobrepostos, e não ao tamanho do grupo.
+
+    Parâmetros:
+    ref_grupos (array): Códigos inteiros dos grupos dos intervalos (por exemplo, veículo e dia).
+    ref_inicio (array): Início de cada intervalo.
+    ref_fim (array): Fim de cada intervalo.
+    grupos (array): Códigos inteiros dos grupos dos valores buscados.
+    valores (array): Valores buscados.
+
+    Retorna:
+    array: A posição do intervalo encontrado para cada valor, ou -1 quando nenhum intervalo o contém.
+
+    Exemplos:
+    >>> first_containing_interval(grupos_viagem, partidas_viagem, chegadas_viagem, grupos_amostra, partidas_amostra)
+    """
+    ref_inicio = np.asarray(ref_inicio)
+    ref_fim = np.asarray(ref_fim)
+    valores = np.asarray(valores)
+
+    sem_intervalo = np.iinfo(np.int64).max
+    resultado = np.full(len(valores), sem_intervalo, dtype=np.int64)
+    if len(ref_inicio) == 0 or len(valores) == 0:
+        return np.full(len(valores), -1, dtype=np.int64)
+
+    duracao_maxima = (ref_fim - ref_inicio).max()
+    posicao_busca, posicao_ref = window_pairs(ref_grupos, ref_inicio, grupos, valores - duracao_maxima, valores)
+
+    # Entre os candidatos, manter os que terminam depois do valor e, destes, o primeiro na ordem original
+    contem = ref_fim[posicao_ref] >= valores[posicao_busca]
+    posicao_busca, posicao_ref = posicao_busca[contem], posicao_ref[contem]
+    np.minimum.at(resultado, posicao_busca, posicao_ref)
+
+    return np.where(resultado == sem_intervalo, -1, resultado)
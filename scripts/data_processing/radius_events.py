@@ -0,0 +1,158 @@
+### --- Detecção de entrada e saída dos raios dos pontos inicial e final do trajeto --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import numpy as np
+import pandas as pd
+from interval_search import *
+from geo_distance import *
+
+
+### --- 2. Sinais dentro do raio --- ###
+
+def radius_checks(dados_shape: pd.DataFrame, dados_gps: pd.DataFrame, raio: float = 500,
+                  tolerancia: float = 0, metodo: str = 'elipsoidal') -> pd.DataFrame:
+    """
+    Verifica quais sinais de GPS estão dentro do raio dos pontos inicial e final de cada shape do
+    serviço, processando um grupo (data, servico) por vez. Os shapes de cada grupo são separados uma
+    única vez e os sinais do grupo são comparados com todos eles de uma só vez, de modo que a memória
+    usada é limitada pelo maior grupo, e não pelo produto de todos os sinais por todos os shapes.
+
+    Parâmetros:
+    dados_shape (dataframe): Shapes tratados por treat_shapes, com as colunas data, servico, shape_id e as
+    coordenadas dos pontos inicial e final.
+    dados_gps (dataframe): Sinais de GPS tratados por treat_gps, com as colunas data, servico, id_veiculo,
+    timestamp_gps, longitude e latitude.
+    raio (float): Raio, em metros.
+    tolerancia (float): Margem, em metros, somada ao raio.
+    metodo (str): Método de cálculo da distância, 'elipsoidal' ou 'haversine'.
+
+    Retorna:
+    dataframe: Uma linha por sinal e shape em que o sinal está dentro de pelo menos um dos raios, com as
+    colunas id_veiculo, servico, data, shape_id, timestamp_gps, check_start_pt e check_end_pt.
+
+    Exemplos:
+    >>> radius_checks(dados_shape, dados_gps, raio=500, tolerancia=2.1, metodo='haversine')
+    """
+    colunas = ['id_veiculo', 'servico', 'data', 'shape_id', 'timestamp_gps', 'check_start_pt', 'check_end_pt']
+    shapes_por_grupo = dict(list(dados_shape.groupby(['data', 'servico'], sort=False)))
+
+    partes = []
+    for (data, servico), sinais in dados_gps.groupby(['data', 'servico'], sort=False):
+        shapes = shapes_por_grupo.get((data, servico))
+        if shapes is None:
+            continue
+
+        # Matriz sinais x shapes do grupo
+        latitude = sinais['latitude'].to_numpy(dtype=float)[:, None]
+        longitude = sinais['longitude'].to_numpy(dtype=float)[:, None]
+
+        check_inicio = within_radius(shapes['latitude_ponto_inicial'].to_numpy(dtype=float)[None, :],
+                                     shapes['longitude_ponto_inicial'].to_numpy(dtype=float)[None, :],
+                                     latitude, longitude, raio=raio, tolerancia=tolerancia, metodo=metodo)
+        check_fim = within_radius(shapes['latitude_ponto_final'].to_numpy(dtype=float)[None, :],
+                                  shapes['longitude_ponto_final'].to_numpy(dtype=float)[None, :],
+                                  latitude, longitude, raio=raio, tolerancia=tolerancia, metodo=metodo)
+
+        # Apenas os pares dentro de algum raio são mantidos
+        posicao_sinal, posicao_shape = np.nonzero(check_inicio | check_fim)
+
+        partes.append(pd.DataFrame({
+            'id_veiculo': sinais['id_veiculo'].to_numpy()[posicao_sinal],
+            'servico': servico,
+            'data': data,
+            'shape_id': shapes['shape_id'].to_numpy()[posicao_shape],
+            'timestamp_gps': sinais['timestamp_gps'].to_numpy()[posicao_sinal],
+            'check_start_pt': check_inicio[posicao_sinal, posicao_shape],
+            'check_end_pt': check_fim[posicao_sinal, posicao_shape],
+        }, columns=colunas))
+
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+
+    return pd.concat(partes, ignore_index=True)
+
+
+### --- 3. Eventos por viagem e shape --- ###
+
+def detect_radius_events(viagens: pd.DataFrame, sinais: pd.DataFrame) -> pd.DataFrame:
+    """
+    Identifica, para cada viagem e cada shape do seu serviço no dia, o primeiro sinal de GPS dentro do raio
+    (entrada) e o último sinal de GPS dentro do raio (saída) dos pontos inicial e final do shape, considerando
+    apenas os sinais entre a partida e a chegada da viagem (limites exclusivos).
+
+    Os sinais de cada veículo são ordenados uma única vez por horário e o trecho de cada viagem é localizado
+    por busca binária.
+
+    Parâmetros:
+    viagens (dataframe): Viagens com as colunas id_veiculo_amostra, servico_amostra, data,
+    datetime_partida_amostra e datetime_chegada_amostra. O índice identifica a viagem.
+    sinais (dataframe): Sinais de GPS combinados com os shapes, como retornado por radius_checks, com as
+    colunas id_veiculo, servico, data, shape_id, timestamp_gps, check_start_pt e check_end_pt (1 quando o
+    sinal está dentro do raio).
+
+    Retorna:
+    dataframe: Uma linha por viagem e shape, com a coluna viagem (índice da viagem), shape_id e as colunas
+    entrada_raio_ponto_inicial, saida_raio_ponto_inicial, entrada_raio_ponto_final e saida_raio_ponto_final.
+
+    Exemplos:
+    >>> detect_radius_events(viagens_com_gps, sinais_no_raio)
+    """
+    colunas_chave = ['id_veiculo', 'servico', 'data', 'shape_id']
+
+    # Cada viagem é comparada com todos os shapes do seu serviço no dia
+    viagem_shape = viagens[['id_veiculo_amostra', 'servico_amostra', 'data',
+                            'datetime_partida_amostra', 'datetime_chegada_amostra']].rename_axis('viagem').reset_index()
+    viagem_shape.columns = ['viagem', 'id_veiculo', 'servico', 'data', 'datetime_partida_amostra', 'datetime_chegada_amostra']
+    viagem_shape = viagem_shape.merge(sinais[['servico', 'data', 'shape_id']].drop_duplicates(),
+                                      on=['servico', 'data'], how='inner')
+
+    # Código único para cada combinação de veículo, serviço, dia e shape
+    chaves = pd.concat([viagem_shape[colunas_chave], sinais[colunas_chave]], ignore_index=True).astype(str)
+    grupos = chaves.groupby(colunas_chave, sort=False).ngroup().to_numpy()
+    grupo_viagem, grupo_sinal = grupos[:len(viagem_shape)], grupos[len(viagem_shape):]
+
+    partida = viagem_shape['datetime_partida_amostra'].to_numpy(dtype='datetime64[ns]')
+    chegada = viagem_shape['datetime_chegada_amostra'].to_numpy(dtype='datetime64[ns]')
+    timestamp_gps = sinais['timestamp_gps'].to_numpy(dtype='datetime64[ns]')
+
+    for ponto, coluna_check in [('ponto_inicial', 'check_start_pt'), ('ponto_final', 'check_end_pt')]:
+        dentro = np.flatnonzero(sinais[coluna_check].to_numpy() == 1)
+        ordem = dentro[np.lexsort((timestamp_gps[dentro], grupo_sinal[dentro]))]
+        ref_grupos, ref_timestamp = grupo_sinal[ordem], timestamp_gps[ordem]
+
+        primeiro = group_searchsorted(ref_grupos, ref_timestamp, grupo_viagem, partida, side='right')
+        ultimo = group_searchsorted(ref_grupos, ref_timestamp, grupo_viagem, chegada, side='left') - 1
+        encontrado = (ultimo >= primeiro) & ~np.isnat(partida) & ~np.isnat(chegada)
+
+        entrada = np.full(len(viagem_shape), np.datetime64('NaT'), dtype='datetime64[ns]')
+        saida = entrada.copy()
+        entrada[encontrado] = ref_timestamp[primeiro[encontrado]]
+        saida[encontrado] = ref_timestamp[ultimo[encontrado]]
+
+        viagem_shape[f'entrada_raio_{ponto}'] = entrada
+        viagem_shape[f'saida_raio_{ponto}'] = saida
+
+    return viagem_shape[['viagem', 'shape_id',
+                         'entrada_raio_ponto_inicial', 'saida_raio_ponto_inicial',
+                         'entrada_raio_ponto_final', 'saida_raio_ponto_final']]
+
+
+### --- 4. Eventos por viagem --- ###
+
+def summarize_radius_events(eventos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega os eventos de detect_radius_events por viagem, considerando todos os shapes do serviço:
+    a primeira entrada e a última saída de cada raio.
+
+    Parâmetros:
+    eventos (dataframe): Resultado de detect_radius_events.
+
+    Retorna:
+    dataframe: Um dataframe indexado pela viagem, com as colunas de entrada e saída de cada raio.
+    """
+    return eventos.groupby('viagem').agg(
+        entrada_raio_ponto_inicial=('entrada_raio_ponto_inicial', 'min'),
+        saida_raio_ponto_inicial=('saida_raio_ponto_inicial', 'max'),
+        entrada_raio_ponto_final=('entrada_raio_ponto_final', 'min'),
+        saida_raio_ponto_final=('saida_raio_ponto_final', 'max'),
+    )
@@ -1,4 +1,3 @@
-import argparse
 import numpy as np
 import pandas as pd
 from datetime import timedelta, datetime
@@ -7,12 +6,18 @@ from utils import *
 from categorize_trips import *
 from queries_functions import *
 from treat_data import *
+from cache_files import *
+from slice_store import *
+from debug_artifacts import *
+from unattended_mode import *
 
-parser = argparse.ArgumentParser(description="Execute o script run.py com opções.")
 
-parser.add_argument('--cache', action='store_true', help="Ative o cache")
-args = parser.parse_args()
-cache = "on" if args.cache else "off"
+# O reprocessamento pausa a execução para que o modelo seja executado no DBT com o arquivo reprocessar.csv.
+# Ele é feito uma única vez para todas as partições da amostra (ver run_reprocessed_trips em tasks.py).
+
+# Arquivo lido pelo modelo reprocessado no DBT. No modo não interativo, o DBT é executado pelo comando
+# configurado (ver unattended_mode.py).
+ARQUIVO_REPROCESSAMENTO = './../../queries-rj-smtr/data/reprocessar.csv'
 
 
 def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
@@ -27,15 +32,14 @@ def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
     if completas_na['flag_reprocessamento'].sum() > 0:
         log_info('Iniciando o reprocessamento de viagens.')       
         
-        id_veiculo = query_values(completas_na, 'id_veiculo_amostra')
-        data = query_values(completas_na, 'data')  
+        pares = vehicle_day_pairs(completas_na)
         
         
         dados['data'] = pd.to_datetime(dados['data'])
         data_limite = datetime.strptime('2022-11-16', '%Y-%m-%d')
 
         condicao = (
-        (dados['flag_reprocessamento'] == 1) & 
+        (dados['flag_reprocessamento'] == 1).fillna(False) & 
         (dados['data'] < data_limite) & 
         ~(dados['status'].isin([
             "Viagem identificada e já paga", 
@@ -45,7 +49,7 @@ def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
         )      
 
         linhas_condicao = dados[condicao]
-        linhas_condicao.to_excel('../data/treated/recursos_para_reprocessar.xlsx')
+        write_debug_artifact('recursos_para_reprocessar', linhas_condicao)
         
         demais_linhas = dados[~condicao]
         
@@ -53,7 +57,7 @@ def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
         if not linhas_condicao.empty:
             print("As seguintes viagens atenderam à condição de reprocessamento do serviço:", linhas_condicao)           
                     
-            linhas_condicao.to_csv('./../../queries-rj-smtr/data/reprocessar.csv', index = False)
+            linhas_condicao.to_csv(ARQUIVO_REPROCESSAMENTO, index = False)
             
             # Limpar os campos que serão reprocessados:
             columns_to_na = [
@@ -64,17 +68,12 @@ def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
             # Substituindo todos os valores nas colunas selecionadas por NaN
             linhas_condicao.loc[:, columns_to_na] = np.nan
             
-        input("Execução pausada. Execute o modelo no DBT e pressione enter para continuar...")        
+        wait_reprocessing(ARQUIVO_REPROCESSAMENTO)
 
         # Reprocessar 
 
         # Baixar e classificar viagens completas reprocessadas
-        if args.cache:
-            viagem_completa_reprocessada = pd.read_csv('../data/cache/viagem_completa_reprocessada.csv')   
-            
-        else:
-            viagem_completa_reprocessada = query_viagem_completa(data, id_veiculo, reprocessed=True)
-            viagem_completa_reprocessada.to_csv('../data/cache/viagem_completa_reprocessada.csv', index = False)
+        viagem_completa_reprocessada = query_viagem_completa(pares, reprocessed=True)
             
         viagem_completa_reprocessada = treat_trips(viagem_completa_reprocessada)
         
@@ -82,16 +81,11 @@ def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
         linhas_condicao = check_trips(linhas_condicao, viagem_completa_reprocessada,
                                     "Viagem deferida com novo serviço")
         
-        linhas_condicao.to_excel('../data/treated/viagem_completa_reprocessada.xlsx', index = False)
+        write_debug_artifact('viagem_completa_reprocessada', linhas_condicao)
 
         # Baixar e classificar viagens conformidade reprocessadas
         
-        if args.cache:
-            viagem_conformidade_reprocessada = pd.read_csv('../data/cache/viagem_conformidade_reprocessada.csv')   
-            
-        else:
-            viagem_conformidade_reprocessada = query_viagem_conformidade(data, id_veiculo, reprocessed=True)
-            viagem_conformidade_reprocessada.to_csv('../data/cache/viagem_conformidade_reprocessada.csv', index = False)
+        viagem_conformidade_reprocessada = query_viagem_conformidade(pares, reprocessed=True)
             
         viagem_conformidade_reprocessada = treat_trips(viagem_conformidade_reprocessada)
         
@@ -101,7 +95,7 @@ def reprocess_trips(dados: pd.DataFrame) -> pd.DataFrame:
         
         viagem_completa_reprocessada = pd.concat([linhas_condicao, demais_linhas], ignore_index=True)
         
-        viagem_completa_reprocessada.to_excel('../data/treated/viagem_completa_reprocessada.xlsx', index = False)
+        write_debug_artifact('viagem_completa_reprocessada', viagem_completa_reprocessada)
     
 
         return viagem_completa_reprocessada
@@ -0,0 +1,245 @@
+### --- Métricas de tempo, memória e linhas das etapas --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import functools
+import json
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+import prefect
+import psutil
+from utils import *
+
+
+### --- 2. Configuração --- ###
+
+# Cada etapa do fluxo (ver tasks.py), cada consulta e as funções de classificação mais pesadas registram
+# uma linha de métricas por chamada. As linhas da execução são gravadas em um arquivo JSON lines, criado
+# por configure_run_metrics (ver classify.py), e resumidas no log ao final da execução.
+CONFIGURACAO_METRICAS = {'arquivo': None}
+
+# Métricas das chamadas da execução atual. As partições da amostra (ver flows.py) registram ao mesmo tempo.
+REGISTROS_METRICAS = []
+TRAVA_METRICAS = threading.Lock()
+
+# Memória física (RSS) do processo durante as chamadas em andamento: para cada chamada, o maior valor
+# observado pela thread de amostragem, que mede o RSS a cada INTERVALO_MEMORIA_S segundos enquanto há
+# alguma chamada em andamento
+INTERVALO_MEMORIA_S = 0.05
+PICOS_EM_ANDAMENTO = {}
+CONTADOR_CHAMADAS = itertools.count()
+AMOSTRADOR_MEMORIA = {'thread': None}
+TRAVA_MEMORIA = threading.Condition()
+
+
+def configure_run_metrics(diretorio: str = './log') -> None:
+    """
+    Inicia as métricas de uma nova execução, gravadas em um novo arquivo no diretório informado. Com
+    diretorio=None, as métricas são apenas resumidas no log.
+
+    Exemplos:
+    >>> configure_run_metrics('./log')
+    """
+    with TRAVA_METRICAS:
+        REGISTROS_METRICAS.clear()
+        CONFIGURACAO_METRICAS['arquivo'] = None
+
+        if diretorio is not None:
+            os.makedirs(diretorio, exist_ok=True)
+            current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            CONFIGURACAO_METRICAS['arquivo'] = os.path.join(diretorio, f"metricas_{current_time}.jsonl")
+
+
+### --- 3. Medir as chamadas --- ###
+
+def current_rss_bytes() -> int:
+    """
+    Retorna o uso atual de memória física (RSS) do processo.
+    """
+    return psutil.Process().memory_info().rss
+
+
+def memory_sampler_loop() -> None:
+    """
+    Mede o RSS do processo enquanto há chamadas em andamento e atualiza o pico de cada uma. Sem
+    chamadas em andamento, a thread espera, sem medir.
+    """
+    processo = psutil.Process()
+    while True:
+        with TRAVA_MEMORIA:
+            while not PICOS_EM_ANDAMENTO:
+                TRAVA_MEMORIA.wait()
+
+            rss = processo.memory_info().rss
+            for chamada, pico in PICOS_EM_ANDAMENTO.items():
+                PICOS_EM_ANDAMENTO[chamada] = max(pico, rss)
+
+        time.sleep(INTERVALO_MEMORIA_S)
+
+
+def start_memory_sampling(rss_inicio: int) -> int:
+    """
+    Inicia a medição do pico de memória de uma chamada (e a thread de amostragem, na primeira chamada).
+
+    Parâmetros:
+    rss_inicio (int): RSS do processo no início da chamada.
+
+    Retorna:
+    int: Identificação da chamada, usada em stop_memory_sampling.
+    """
+    chamada = next(CONTADOR_CHAMADAS)
+    with TRAVA_MEMORIA:
+        PICOS_EM_ANDAMENTO[chamada] = rss_inicio
+        if AMOSTRADOR_MEMORIA['thread'] is None:
+            AMOSTRADOR_MEMORIA['thread'] = threading.Thread(target=memory_sampler_loop, name='memoria', daemon=True)
+            AMOSTRADOR_MEMORIA['thread'].start()
+        TRAVA_MEMORIA.notify_all()
+
+    return chamada
+
+
+def stop_memory_sampling(chamada: int, rss_fim: int) -> int:
+    """
+    Termina a medição de uma chamada.
+
+    Parâmetros:
+    chamada (int): Identificação da chamada, retornada por start_memory_sampling.
+    rss_fim (int): RSS do processo no fim da chamada.
+
+    Retorna:
+    int: O maior RSS do processo observado durante a chamada, incluindo o início e o fim.
+    """
+    with TRAVA_MEMORIA:
+        return max(PICOS_EM_ANDAMENTO.pop(chamada), rss_fim)
+
+
+def count_rows(valor):
+    """
+    Conta as linhas de um dataframe ou de uma lista de dataframes (por exemplo, as partições da amostra).
+    Retorna None para os demais valores.
+    """
+    if isinstance(valor, pd.DataFrame):
+        return len(valor)
+    if isinstance(valor, (list, tuple)) and valor and all(isinstance(item, pd.DataFrame) for item in valor):
+        return sum(len(item) for item in valor)
+
+    return None
+
+
+def record_metrics(registro: dict) -> None:
+    """
+    Guarda as métricas de uma chamada e as grava no arquivo de métricas da execução.
+    """
+    with TRAVA_METRICAS:
+        REGISTROS_METRICAS.append(registro)
+
+        if CONFIGURACAO_METRICAS['arquivo'] is not None:
+            with open(CONFIGURACAO_METRICAS['arquivo'], 'a', encoding='utf-8') as arquivo:
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+
+def measured(nome: str = None, medir_bytes: bool = False):
+    """
+    Decorador que registra, a cada chamada da função, o tempo decorrido, o tempo de CPU da thread, a
+    memória física (RSS) do processo no início e no fim da chamada e o pico observado durante a chamada,
+    as linhas dos dataframes recebidos e retornados e, opcionalmente, o tamanho em memória do dataframe
+    retornado (por exemplo, os dados trazidos por uma consulta). O RSS é do processo inteiro: com as
+    partições da amostra classificadas ao mesmo tempo, inclui a memória das outras etapas em andamento.
+    Em uma task do Prefect, deve ser aplicado abaixo do @task.
+
+    Parâmetros:
+    nome (str): Nome da etapa nas métricas. Por padrão, o nome da função.
+    medir_bytes (bool): Registra o tamanho em memória do dataframe retornado.
+
+    Retorna:
+    function: A função com as métricas.
+
+    Exemplos:
+    >>> @measured(medir_bytes=True)
+    ... def query_gps(pares):
+    """
+    def decorador(funcao):
+        etapa = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def funcao_medida(*args, **kwargs):
+            linhas_entrada = [count_rows(valor) for valor in list(args) + list(kwargs.values())]
+            registro = {
+                'etapa': etapa,
+                'particao': prefect.context.get('map_index'),
+                'inicio': datetime.now().isoformat(timespec='seconds'),
+                'linhas_entrada': sum(linhas for linhas in linhas_entrada if linhas is not None),
+            }
+
+            rss_inicio = current_rss_bytes()
+            chamada = start_memory_sampling(rss_inicio)
+
+            inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+            erro, saida = None, None
+            try:
+                saida = funcao(*args, **kwargs)
+                return saida
+            except BaseException as excecao:
+                erro = type(excecao).__name__
+                raise
+            finally:
+                registro['tempo_s'] = round(time.perf_counter() - inicio, 4)
+                registro['cpu_s'] = round(time.thread_time() - inicio_cpu, 4)
+                rss_fim = current_rss_bytes()
+                registro['rss_inicio_mb'] = round(rss_inicio / 1024 ** 2, 1)
+                registro['rss_fim_mb'] = round(rss_fim / 1024 ** 2, 1)
+                registro['pico_rss_mb'] = round(stop_memory_sampling(chamada, rss_fim) / 1024 ** 2, 1)
+                registro['linhas_saida'] = count_rows(saida)
+                if medir_bytes and isinstance(saida, pd.DataFrame):
+                    registro['bytes_saida'] = int(saida.memory_usage(index=True, deep=True).sum())
+                registro['erro'] = erro
+                record_metrics(registro)
+
+        return funcao_medida
+
+    return decorador
+
+
+### --- 4. Resumo da execução --- ###
+
+def metrics_summary() -> pd.DataFrame:
+    """
+    Resume as métricas da execução por etapa, da etapa com maior tempo total para a de menor.
+
+    Retorna:
+    dataframe: Chamadas, tempo total e máximo, tempo de CPU, pico de memória durante as chamadas,
+    maior aumento de memória em uma chamada, linhas recebidas e retornadas e bytes retornados de cada etapa.
+
+    Exemplos:
+    >>> log_info(metrics_summary().to_string())
+    """
+    with TRAVA_METRICAS:
+        registros = pd.DataFrame(REGISTROS_METRICAS)
+
+    if registros.empty:
+        return pd.DataFrame()
+
+    if 'bytes_saida' not in registros.columns:
+        registros['bytes_saida'] = None
+    registros['aumento_rss_mb'] = registros['rss_fim_mb'] - registros['rss_inicio_mb']
+
+    resumo = registros.groupby('etapa', sort=False).agg(
+        chamadas=('etapa', 'size'),
+        erros=('erro', 'count'),
+        tempo_total_s=('tempo_s', 'sum'),
+        tempo_max_s=('tempo_s', 'max'),
+        cpu_total_s=('cpu_s', 'sum'),
+        pico_rss_mb=('pico_rss_mb', 'max'),
+        aumento_rss_max_mb=('aumento_rss_mb', 'max'),
+        linhas_entrada=('linhas_entrada', 'sum'),
+        linhas_saida=('linhas_saida', 'sum'),
+        mb_saida=('bytes_saida', lambda valores: round(pd.to_numeric(valores).sum() / 1024 ** 2, 1)),
+    )
+
+    # Etapas que não retornam dataframe (por exemplo, a geração dos mapas) contam 0 linhas retornadas
+    resumo['linhas_saida'] = resumo['linhas_saida'].astype('int64')
+
+    return resumo.sort_values('tempo_total_s', ascending=False).round(3)
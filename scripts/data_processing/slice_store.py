@@ -0,0 +1,344 @@
+### --- Armazenamento local das consultas por dia e veículo --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from utils import *
+from treat_data import *
+from cache_files import *
+from query_backends import *
+
+
+### --- 2. Configuração --- ###
+
+DIRETORIO_FATIAS = os.path.join(DIRETORIO_CACHE, 'fatias')
+
+# Trava dos arquivos das fatias e dos manifestos, lidos e gravados por etapas que rodam ao mesmo tempo
+# (buscas antecipadas e partições da amostra, ver fetch_scheduler.py e flows.py)
+TRAVA_FATIAS = threading.RLock()
+
+# Pares (data, id_veiculo) de cada tabela já consultados novamente na execução atual, com a opção de
+# atualizar o cache (--refresh-cache): eles não são consultados outra vez por outras etapas
+FATIAS_ATUALIZADAS = {}
+
+
+def slice_directory(tabela: str) -> str:
+    """
+    Retorna o diretório das fatias de uma tabela. Os dados lidos de um backend local (ver
+    query_backends.py) ficam separados dos dados de produção e dos dados de outros diretórios locais.
+
+    Exemplos:
+    >>> slice_directory('dados_gps')
+    '../data/cache/fatias/dados_gps'
+    """
+    origem = backend_identifier()
+    if origem is None:
+        return os.path.join(DIRETORIO_FATIAS, tabela)
+
+    return os.path.join(DIRETORIO_FATIAS, origem, tabela)
+
+
+### --- 3. Manifesto das fatias guardadas --- ###
+
+def vehicle_day_pairs(dados: pd.DataFrame, coluna_veiculo: str = 'id_veiculo_amostra') -> pd.DataFrame:
+    """
+    Lista os pares (data, id_veiculo) únicos de um dataframe, no formato usado pelas fatias.
+
+    Parâmetros:
+    dados (dataframe): Dataframe com a coluna data e a coluna do veículo.
+    coluna_veiculo (str): Nome da coluna do veículo.
+
+    Retorna:
+    dataframe: Pares únicos, com as colunas data ('AAAA-MM-DD') e id_veiculo.
+
+    Exemplos:
+    >>> vehicle_day_pairs(amostra_tratada, 'id_veiculo')
+    """
+    pares = pd.DataFrame({'data': pd.to_datetime(dados['data']).dt.strftime('%Y-%m-%d').to_numpy(),
+                          'id_veiculo': dados[coluna_veiculo].astype(str).to_numpy()})
+
+    return pares.dropna().drop_duplicates().reset_index(drop=True)
+
+
+def read_manifest(tabela: str) -> dict:
+    """
+    Lê o manifesto de uma tabela: para cada data, os veículos cujas fatias já foram consultadas
+    (inclusive as fatias sem nenhuma linha).
+    """
+    caminho = os.path.join(slice_directory(tabela), 'manifesto.json')
+    if not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, encoding='utf-8') as arquivo:
+        return {data: set(veiculos) for data, veiculos in json.load(arquivo).items()}
+
+
+def write_manifest(tabela: str, manifesto: dict) -> None:
+    """
+    Grava o manifesto de uma tabela.
+    """
+    os.makedirs(slice_directory(tabela), exist_ok=True)
+    with open(os.path.join(slice_directory(tabela), 'manifesto.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump({data: sorted(veiculos) for data, veiculos in manifesto.items()}, arquivo, indent=4)
+
+
+def missing_slices(tabela: str, pares: pd.DataFrame) -> pd.DataFrame:
+    """
+    Identifica os pares (data, id_veiculo) que ainda não estão guardados. Com a opção de atualizar o
+    cache (--refresh-cache), são faltantes todos os pares ainda não consultados na execução atual.
+
+    Parâmetros:
+    tabela (str): Nome da tabela.
+    pares (dataframe): Pares necessários, como retornado por vehicle_day_pairs.
+
+    Retorna:
+    dataframe: Os pares que precisam ser consultados.
+
+    Exemplos:
+    >>> missing_slices('dados_gps', vehicle_day_pairs(linhas_nan))
+    """
+    with TRAVA_FATIAS:
+        if CONFIGURACAO_CACHE['atualizar']:
+            atualizadas = FATIAS_ATUALIZADAS.get(tabela, set())
+            guardado = [par in atualizadas for par in zip(pares['data'], pares['id_veiculo'])]
+            return pares[~np.array(guardado, dtype=bool)].reset_index(drop=True)
+
+        manifesto = read_manifest(tabela)
+    guardado = [veiculo in manifesto.get(data, ()) for data, veiculo in zip(pares['data'], pares['id_veiculo'])]
+
+    return pares[~np.array(guardado, dtype=bool)].reset_index(drop=True)
+
+
+### --- 4. Leitura e escrita das fatias --- ###
+
+def slice_path(tabela: str, data: str) -> str:
+    return os.path.join(slice_directory(tabela), f'{data}.parquet')
+
+
+def store_slices(tabela: str, dados: pd.DataFrame, pares: pd.DataFrame) -> None:
+    """
+    Guarda o resultado de uma consulta, substituindo as fatias consultadas, e registra no manifesto
+    todos os pares consultados (mesmo os que não retornaram linhas).
+
+    Parâmetros:
+    tabela (str): Nome da tabela, uma das chaves de ESQUEMAS_CACHE.
+    dados (dataframe): Resultado da consulta, com as colunas data e id_veiculo.
+    pares (dataframe): Pares (data, id_veiculo) cobertos pela consulta.
+    """
+    dados = cast_columns(dados, ESQUEMAS_CACHE[tabela])
+    novos_por_data = dict(list(dados.groupby('data', sort=False)))
+
+    with TRAVA_FATIAS:
+        manifesto = read_manifest(tabela)
+        os.makedirs(slice_directory(tabela), exist_ok=True)
+
+        for data, veiculos in pares.groupby('data', sort=False)['id_veiculo']:
+            veiculos = set(veiculos)
+            caminho = slice_path(tabela, data)
+
+            partes = []
+            if os.path.exists(caminho):
+                existentes = pd.read_parquet(caminho)
+                partes.append(existentes[~existentes['id_veiculo'].isin(veiculos)])
+            if data in novos_por_data:
+                partes.append(novos_por_data[data])
+
+            if partes:
+                pd.concat(partes, ignore_index=True).to_parquet(caminho, index=False, compression='zstd',
+                                                                use_dictionary=True)
+
+            manifesto[data] = manifesto.get(data, set()) | veiculos
+
+        write_manifest(tabela, manifesto)
+        FATIAS_ATUALIZADAS.setdefault(tabela, set()).update(zip(pares['data'], pares['id_veiculo']))
+
+
+def load_slices(tabela: str, pares: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lê as fatias guardadas para os pares (data, id_veiculo) informados. Cada arquivo diário é lido
+    apenas para os veículos pedidos.
+
+    Parâmetros:
+    tabela (str): Nome da tabela.
+    pares (dataframe): Pares necessários, como retornado por vehicle_day_pairs.
+
+    Retorna:
+    dataframe: As linhas guardadas para os pares.
+    """
+    partes = []
+    with TRAVA_FATIAS:
+        for data, veiculos in pares.groupby('data', sort=False)['id_veiculo']:
+            if os.path.exists(slice_path(tabela, data)):
+                partes.append(pd.read_parquet(slice_path(tabela, data),
+                                              filters=[('id_veiculo', 'in', sorted(set(veiculos)))]))
+
+    if not partes:
+        return pd.DataFrame(columns=list(ESQUEMAS_CACHE[tabela]))
+
+    return pd.concat(partes, ignore_index=True)
+
+
+def update_slices(tabela: str, pares: pd.DataFrame, consulta) -> pd.DataFrame:
+    """
+    Consulta e guarda as fatias dos pares (data, id_veiculo) que ainda não estão guardadas, sem ler as
+    fatias guardadas.
+
+    Parâmetros:
+    tabela (str): Nome da tabela, uma das chaves de ESQUEMAS_CACHE.
+    pares (dataframe): Pares necessários, como retornado por vehicle_day_pairs.
+    consulta (function): Recebe os pares faltantes e retorna os dados desses pares, com as colunas
+    data e id_veiculo.
+
+    Retorna:
+    dataframe: Os pares consultados.
+
+    Exemplos:
+    >>> update_slices('dados_gps', vehicle_day_pairs(linhas_nan), query_gps)
+    """
+    faltantes = missing_slices(tabela, pares)
+    log_info(f'Cache: {len(pares) - len(faltantes)} de {len(pares)} pares (data, veículo) de {tabela} '
+             f'encontrados localmente.')
+
+    if not faltantes.empty:
+        store_slices(tabela, consulta(faltantes), faltantes)
+
+    return faltantes
+
+
+def fetch_slices(tabela: str, pares: pd.DataFrame, consulta) -> pd.DataFrame:
+    """
+    Retorna os dados de uma tabela para os pares (data, id_veiculo) informados, consultando no Big Query
+    apenas as fatias que ainda não estão guardadas localmente.
+
+    Parâmetros:
+    tabela (str): Nome da tabela, uma das chaves de ESQUEMAS_CACHE.
+    pares (dataframe): Pares necessários, como retornado por vehicle_day_pairs.
+    consulta (function): Recebe os pares faltantes e retorna os dados desses pares, com as colunas
+    data e id_veiculo.
+
+    Retorna:
+    dataframe: Os dados da tabela para os pares informados.
+
+    Exemplos:
+    >>> fetch_slices('dados_gps', vehicle_day_pairs(linhas_nan), query_gps)
+    """
+    update_slices(tabela, pares, consulta)
+
+    return load_slices(tabela, pares)
+
+
+### --- 5. Dados já carregados na execução --- ###
+
+# Tabelas já carregadas na execução atual, compartilhadas entre as tasks do fluxo (que rodam no mesmo
+# processo) e as buscas antecipadas (ver fetch_scheduler.py). Para cada tabela, guarda os dados, as
+# chaves, como os pares (data, id_veiculo), que eles cobrem e as chaves com busca em andamento.
+REGISTRO_DADOS = {}
+
+# Uma trava por tabela, para que buscas simultâneas da mesma tabela não consultem as mesmas chaves.
+# Buscas de chaves diferentes da mesma tabela (por exemplo, de partições diferentes da amostra) rodam
+# ao mesmo tempo.
+TRAVAS_REGISTRO = {}
+TRAVA_TRAVAS = threading.Lock()
+
+
+def reset_registry() -> None:
+    """
+    Remove as tabelas carregadas e as travas de uma execução anterior no mesmo processo. É chamada no
+    início de cada classificação (ver classify.py).
+    """
+    with TRAVA_TRAVAS:
+        REGISTRO_DADOS.clear()
+        TRAVAS_REGISTRO.clear()
+
+    with TRAVA_FATIAS:
+        FATIAS_ATUALIZADAS.clear()
+
+
+def service_day_pairs(dados: pd.DataFrame, coluna_servico: str = 'servico_amostra') -> pd.DataFrame:
+    """
+    Lista os pares (data, servico) únicos de um dataframe, no formato usado pelas consultas de viagens planejadas.
+
+    Exemplos:
+    >>> service_day_pairs(amostra_tratada, 'servico')
+    """
+    pares = pd.DataFrame({'data': pd.to_datetime(dados['data']).dt.strftime('%Y-%m-%d').to_numpy(),
+                          'servico': dados[coluna_servico].astype(str).to_numpy()})
+
+    return pares.dropna().drop_duplicates().reset_index(drop=True)
+
+
+def select_pairs(dados: pd.DataFrame, pares: pd.DataFrame) -> pd.DataFrame:
+    """
+    Seleciona as linhas de um dataframe cujas chaves (as colunas de pares) estão entre as chaves informadas.
+    """
+    if dados.empty:
+        return dados.reset_index(drop=True)
+
+    chaves = pd.MultiIndex.from_frame(dados[list(pares.columns)])
+    selecionadas = chaves.isin(pd.MultiIndex.from_frame(pares))
+
+    return dados[selecionadas].reset_index(drop=True)
+
+
+def registered_dataset(tabela: str, pares: pd.DataFrame, buscar) -> pd.DataFrame:
+    """
+    Retorna os dados de uma tabela para as chaves informadas, reaproveitando os dados já carregados
+    por outras etapas da execução. Apenas as chaves que ainda não foram carregadas são buscadas (no
+    armazenamento local ou no Big Query, ver fetch_slices).
+
+    Parâmetros:
+    tabela (str): Nome da tabela.
+    pares (dataframe): Chaves necessárias, como retornado por vehicle_day_pairs ou service_day_pairs.
+    buscar (function): Recebe as chaves faltantes e retorna os dados dessas chaves, com as mesmas colunas.
+
+    Retorna:
+    dataframe: Uma cópia dos dados da tabela para as chaves informadas.
+
+    Exemplos:
+    >>> registered_dataset('viagem_completa', pares,
+    ...                    lambda faltantes: fetch_slices('viagem_completa', faltantes, query_viagem_completa))
+    """
+    with TRAVA_TRAVAS:
+        trava = TRAVAS_REGISTRO.setdefault(tabela, threading.Condition())
+
+    with trava:
+        registro = REGISTRO_DADOS.setdefault(tabela, {'dados': None, 'pares': set(), 'em_andamento': set()})
+        buscou = False
+
+        while True:
+            # Chaves que ainda não foram carregadas nem estão sendo buscadas por outra etapa
+            chaves_pedidas = list(pares.itertuples(index=False, name=None))
+            disponivel = [par not in registro['pares'] and par not in registro['em_andamento'] for par in chaves_pedidas]
+            faltantes = pares[np.array(disponivel, dtype=bool)].reset_index(drop=True)
+            aguardando = any(par in registro['em_andamento'] for par in chaves_pedidas)
+
+            if not faltantes.empty or (registro['dados'] is None and not registro['em_andamento']):
+                chaves = set(faltantes.itertuples(index=False, name=None))
+                registro['em_andamento'] |= chaves
+
+                # A busca é feita sem a trava, para não bloquear as buscas de outras chaves da tabela
+                trava.release()
+                try:
+                    novos = buscar(faltantes)
+                finally:
+                    trava.acquire()
+                    registro['em_andamento'] -= chaves
+                    trava.notify_all()
+
+                registro['dados'] = novos if registro['dados'] is None else pd.concat([registro['dados'], novos],
+                                                                                     ignore_index=True)
+                registro['pares'] |= chaves
+                buscou = True
+            elif aguardando or registro['dados'] is None:
+                # Espera as buscas em andamento das chaves pedidas (ou a primeira busca da tabela)
+                trava.wait()
+            else:
+                break
+
+        if not buscou:
+            log_info(f'Dados de {tabela} reaproveitados de etapas anteriores da execução.')
+
+        return select_pairs(registro['dados'], pares)
@@ -0,0 +1,182 @@
+### --- Checkpoints das etapas do fluxo de classificação --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+import pandas as pd
+from utils import *
+from cache_files import *
+from query_backends import *
+
+
+### --- 2. Configuração --- ###
+
+# A saída de cada etapa (ver tasks.py) é guardada em pickle, para que as colunas sejam lidas exatamente
+# como foram retornadas (por exemplo, as tuplas de serviços apurados)
+DIRETORIO_ETAPAS = os.path.join(DIRETORIO_CACHE, 'etapas')
+
+# Configuração dos checkpoints, alterada pelas flags de execução (ver run.py e classify.py)
+CONFIGURACAO_ETAPAS = {
+    'ativo': True,                # lê a saída guardada das etapas cujas entradas não mudaram
+    'atualizar': False,           # executa novamente todas as etapas (e regrava os checkpoints)
+    'cota_bytes': 5 * 1024 ** 3,  # espaço máximo em disco ocupado pelos checkpoints
+}
+
+# As partições da amostra (ver flows.py) gravam checkpoints ao mesmo tempo
+TRAVA_ETAPAS = threading.Lock()
+
+
+def configure_stage_checkpoints(ativo: bool = None, atualizar: bool = None, cota_gb: float = None) -> None:
+    """
+    Altera a configuração dos checkpoints das etapas.
+
+    Parâmetros:
+    ativo (bool): Se False, as etapas são sempre executadas e os checkpoints não são gravados.
+    atualizar (bool): Se True, as etapas são sempre executadas e os checkpoints são regravados.
+    cota_gb (float): Espaço máximo em disco, em GB, ocupado pelos checkpoints.
+
+    Exemplos:
+    >>> configure_stage_checkpoints(atualizar=True)
+    """
+    if ativo is not None:
+        CONFIGURACAO_ETAPAS['ativo'] = ativo
+    if atualizar is not None:
+        CONFIGURACAO_ETAPAS['atualizar'] = atualizar
+    if cota_gb is not None:
+        CONFIGURACAO_ETAPAS['cota_bytes'] = int(cota_gb * 1024 ** 3)
+
+
+### --- 3. Chave das etapas --- ###
+
+def fingerprint(valor):
+    """
+    Calcula uma identificação do valor de entrada de uma etapa: o hash do conteúdo, das colunas e dos
+    tipos dos dataframes, a identificação de cada item das listas e o próprio valor nos demais casos.
+
+    Exemplos:
+    >>> fingerprint([amostra_tratada, 4])
+    """
+    if isinstance(valor, pd.DataFrame):
+        # Colunas de objetos (tuplas, listas) são convertidas em texto, que pode ser usado no hash
+        objetos = valor.select_dtypes(include='object').columns
+        valor = valor.assign(**{coluna: valor[coluna].map(str) for coluna in objetos})
+
+        hash_dados = hashlib.sha256()
+        hash_dados.update(json.dumps([list(map(str, valor.columns)), list(map(str, valor.dtypes))]).encode('utf-8'))
+        hash_dados.update(pd.util.hash_pandas_object(valor, index=True).to_numpy().tobytes())
+        return hash_dados.hexdigest()
+
+    if isinstance(valor, (list, tuple)):
+        return [fingerprint(item) for item in valor]
+
+    return valor
+
+
+def stage_key(etapa: str, versao: str, argumentos: dict) -> str:
+    """
+    Calcula a chave do checkpoint de uma etapa a partir da versão do modelo, da origem dos dados das
+    consultas (ver backend_identifier) e da identificação de cada argumento (ver fingerprint).
+    """
+    texto = json.dumps({'etapa': etapa, 'versao': versao, 'backend': backend_identifier() or 'bigquery',
+                        'argumentos': {nome: fingerprint(valor) for nome, valor in argumentos.items()}},
+                       sort_keys=True, default=str)
+
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:32]
+
+
+def stage_path(etapa: str, chave: str) -> str:
+    return os.path.join(DIRETORIO_ETAPAS, f'{etapa}_{chave}.pkl')
+
+
+### --- 4. Gravar e ler os checkpoints --- ###
+
+def evict_stage_checkpoints(manter: str = None) -> None:
+    """
+    Remove os checkpoints usados há mais tempo até que o espaço ocupado caiba na cota configurada.
+
+    Parâmetros:
+    manter (str): Caminho do checkpoint que não deve ser removido (o que acabou de ser gravado).
+    """
+    caminhos = [os.path.join(DIRETORIO_ETAPAS, arquivo) for arquivo in os.listdir(DIRETORIO_ETAPAS)
+                if arquivo.endswith('.pkl')]
+    total = sum(os.path.getsize(caminho) for caminho in caminhos)
+
+    for caminho in sorted(caminhos, key=os.path.getmtime):
+        if total <= CONFIGURACAO_ETAPAS['cota_bytes']:
+            break
+        if caminho == manter:
+            continue
+
+        total -= os.path.getsize(caminho)
+        os.remove(caminho)
+        log_info(f'Checkpoint: {os.path.basename(caminho)} removido para liberar espaço.')
+
+
+def write_stage_checkpoint(saida, caminho: str) -> None:
+    """
+    Grava a saída da etapa. O arquivo é gravado com outro nome e renomeado no final, para que uma
+    execução interrompida não deixe um checkpoint incompleto.
+    """
+    with TRAVA_ETAPAS:
+        os.makedirs(DIRETORIO_ETAPAS, exist_ok=True)
+        temporario = f'{caminho}.{threading.get_ident()}.tmp'
+        pd.to_pickle(saida, temporario)
+        os.replace(temporario, caminho)
+        evict_stage_checkpoints(manter=caminho)
+
+
+def checkpointed_stage(etapa: str, versao: str, restaurar=None):
+    """
+    Decorador que guarda em disco a saída de uma etapa do fluxo, identificada pela versão do modelo e
+    pelas entradas da etapa. Quando a etapa é executada novamente com as mesmas entradas (por exemplo,
+    ao repetir uma execução interrompida), a saída guardada é lida e a etapa não é executada. Deve ser
+    aplicado abaixo do @task.
+
+    Parâmetros:
+    etapa (str): Nome da etapa, usado no nome dos arquivos.
+    versao (str): Versão do modelo (modelo_versao). Checkpoints de outras versões não são lidos.
+    restaurar (function): Refaz os efeitos da etapa que não estão na saída (por exemplo, os sinais de GPS
+    guardados para as etapas seguintes). Recebe a saída guardada e os argumentos da etapa, na ordem da
+    assinatura da etapa.
+
+    Retorna:
+    function: A etapa com checkpoint.
+
+    Exemplos:
+    >>> @task
+    ... @checkpointed_stage('run_complete_trips', modelo_versao)
+    ... def run_complete_trips(amostra_tratada):
+    """
+    def decorador(funcao):
+        assinatura = inspect.signature(funcao)
+
+        @functools.wraps(funcao)
+        def etapa_com_checkpoint(*args, **kwargs):
+            if not CONFIGURACAO_ETAPAS['ativo']:
+                return funcao(*args, **kwargs)
+
+            argumentos = assinatura.bind(*args, **kwargs).arguments
+            chave = stage_key(etapa, versao, argumentos)
+            caminho = stage_path(etapa, chave)
+
+            if not CONFIGURACAO_ETAPAS['atualizar'] and os.path.exists(caminho):
+                log_info(f'Checkpoint: etapa {etapa} encontrada ({chave}). Lendo a saída guardada.')
+                saida = pd.read_pickle(caminho)
+                os.utime(caminho, (time.time(), time.time()))
+                if restaurar is not None:
+                    restaurar(saida, *argumentos.values())
+                return saida
+
+            saida = funcao(*args, **kwargs)
+            write_stage_checkpoint(saida, caminho)
+
+            return saida
+
+        return etapa_com_checkpoint
+
+    return decorador
@@ -1,10 +1,60 @@
 ## --- Treatment functions --- ###
 
 ### --- 1. Importar bibliotecas --- ###
+import numpy as np
 import pandas as pd
 from utils import *
 
 
+### --- 1.1 Tipos das colunas --- ###
+
+# Tipos esperados pelo algoritmo para as colunas de cada tabela consultada
+TIPOS_VIAGENS = {'data': 'str', 'id_veiculo': 'str', 'servico_informado': 'str', 'sentido': 'str',
+                 'datetime_partida': 'datetime64[ns]', 'datetime_chegada': 'datetime64[ns]'}
+
+TIPOS_GPS = {'data': 'str', 'id_veiculo': 'str', 'servico': 'str', 'timestamp_gps': 'datetime64[ns]',
+             'longitude': 'float64', 'latitude': 'float64'}
+
+TIPOS_SHAPES = {'data': 'str', 'servico': 'str', 'sentido': 'str', 'shape_id': 'str', 'shape': 'str',
+                'longitude_ponto_inicial': 'float64', 'latitude_ponto_inicial': 'float64',
+                'longitude_ponto_final': 'float64', 'latitude_ponto_final': 'float64'}
+
+TIPOS_SERVICOS = {'data': 'str', 'servico': 'str', 'sentido': 'str', 'sentido_shape': 'str'}
+
+
+def cast_columns(dados: pd.DataFrame, tipos: dict) -> pd.DataFrame:
+    """
+    Converte as colunas para os tipos informados, apenas quando a coluna ainda não está no tipo.
+    Colunas ausentes no dataframe são ignoradas. Dados lidos do cache em parquet já estão nos tipos
+    corretos e não são convertidos novamente.
+
+    Parâmetros:
+    dados (dataframe): Dataframe a ser tratado.
+    tipos (dict): Tipo de cada coluna: 'str', 'datetime64[ns]' ou 'float64'.
+
+    Retorna:
+    dataframe: com as colunas nos tipos informados.
+
+    Exemplos:
+    >>> cast_columns(viagem_completa, TIPOS_VIAGENS)
+    """
+    for coluna, tipo in tipos.items():
+        if coluna not in dados.columns:
+            continue
+
+        if tipo == 'str':
+            # Colunas com valores nulos ou não textuais são convertidas, como no astype(str)
+            if pd.api.types.infer_dtype(dados[coluna], skipna=False) != 'string':
+                dados[coluna] = dados[coluna].astype(str)
+        elif tipo == 'datetime64[ns]':
+            if not pd.api.types.is_datetime64_dtype(dados[coluna]):
+                dados[coluna] = pd.to_datetime(dados[coluna])
+        elif dados[coluna].dtype != tipo:
+            dados[coluna] = dados[coluna].astype(tipo)
+
+    return dados
+
+
 
 ### --- 2. Tratamento da amostra --- ###
 
@@ -30,10 +80,57 @@ def treat_sample(dados: pd.DataFrame) -> pd.DataFrame:
     dados['datetime_chegada'] = pd.to_datetime(dados['data'] + ' ' + dados['hora_fim'])
     
     
-    log_info('Tratamento da amostra concluído com sucesso.')   
+    log_info('Tratamento da amostra concluído com sucesso.')
     return dados
 
 
+def split_by_date(dados: pd.DataFrame, particoes: int) -> list:
+    """
+    Divide a amostra em até `particoes` partes com datas consecutivas e quantidades de datas próximas.
+    Todas as viagens de uma data ficam na mesma parte, de modo que as partes podem ser classificadas
+    de forma independente.
+
+    Parâmetros:
+    dados (dataframe): Amostra tratada.
+    particoes (int): Quantidade máxima de partes.
+
+    Retorna:
+    list: Dataframes com as viagens de cada parte (ao menos um, mesmo que a amostra esteja vazia).
+
+    Exemplos:
+    >>> split_by_date(amostra_tratada, 4)
+    """
+    datas = np.sort(dados['data'].astype(str).unique())
+    grupos = [grupo for grupo in np.array_split(datas, max(min(particoes, len(datas)), 1)) if len(grupo)]
+
+    if len(grupos) <= 1:
+        return [dados]
+
+    return [dados[dados['data'].astype(str).isin(grupo)] for grupo in grupos]
+
+
+def split_like(dados: pd.DataFrame, particoes: list) -> list:
+    """
+    Divide as viagens nas mesmas partes de uma divisão anterior (ver split_by_date), pelas datas de cada
+    parte. É usada para dividir novamente as viagens das etapas feitas de uma só vez para toda a amostra.
+
+    Parâmetros:
+    dados (dataframe): Viagens de todas as partes.
+    particoes (list): Dataframes da divisão anterior.
+
+    Retorna:
+    list: Dataframes com as viagens de cada parte, na ordem de particoes.
+
+    Exemplos:
+    >>> split_like(reprocess_trips(pd.concat(particoes)), particoes)
+    """
+    if len(particoes) <= 1:
+        return [dados]
+
+    datas = pd.to_datetime(dados['data'])
+    return [dados[datas.isin(pd.to_datetime(particao['data']).unique())] for particao in particoes]
+
+
 ### --- 3. Tratamento das viagens completa e conformidade --- ###
 
 def treat_trips(dados: pd.DataFrame) -> pd.DataFrame:
@@ -52,11 +149,8 @@ def treat_trips(dados: pd.DataFrame) -> pd.DataFrame:
     >>> treat_trips(viagem_completa)
     """    
     
-    dados['servico_informado'] = dados['servico_informado'].astype(str)
-    dados['data'] = dados['data'].astype(str)
-    dados['id_veiculo'] = dados['id_veiculo'].astype(str)
-    dados['datetime_partida'] = pd.to_datetime(dados['datetime_partida'])
-    dados['datetime_chegada'] = pd.to_datetime(dados['datetime_chegada']) 
+    dados = cast_columns(dados, {coluna: TIPOS_VIAGENS[coluna] for coluna in
+                                 ['servico_informado', 'data', 'id_veiculo', 'datetime_partida', 'datetime_chegada']})
     dados = dados.sort_values(by = 'datetime_partida')
     
     return dados
@@ -79,9 +173,12 @@ def treat_gps(dados: pd.DataFrame) -> pd.DataFrame:
     >>> treat_gps(gps)
     """         
     # trata as tabelas gps_sppo e a tabela de status (colocar o nome aqui)
-    dados['servico'] = dados['servico'].astype(str)
-    dados['id_veiculo'] = dados['id_veiculo'].astype(str)
-    dados['timestamp_gps'] = pd.to_datetime(dados['timestamp_gps'])
+    # Caches antigos guardam a posição como texto WKT, na coluna posicao_veiculo_geo
+    if 'posicao_veiculo_geo' in dados.columns:
+        dados['longitude'], dados['latitude'] = wkt_points_to_arrays(dados['posicao_veiculo_geo'])
+        dados = dados.drop(columns='posicao_veiculo_geo')
+
+    dados = cast_columns(dados, TIPOS_GPS)
     
     return dados
 
@@ -108,4 +205,56 @@ def query_values(dados: pd.DataFrame, col_name: str) -> str:
 
     return formatted_values
 
-   
\ No newline at end of file
+   
+
+
+
+### --- 6. Tratamento dos dados do trajeto --- ###
+
+def treat_shapes(dados: pd.DataFrame) -> pd.DataFrame:
+    """
+    Trata os dados do trajeto (shape) das viagens planejadas. Deve ser usada após a query
+    query_planned_trips com geometry_data=True.
+
+    Parâmetros:
+    dados (dataframe): Dataframe contendo os shapes.
+
+    Retorna:
+    dataframe: com as colunas nos tipos corretos e as coordenadas dos pontos inicial e final em
+    longitude_ponto_inicial, latitude_ponto_inicial, longitude_ponto_final e latitude_ponto_final.
+
+    Exemplos:
+    >>> treat_shapes(dados_shape)
+    """
+    # Caches antigos guardam os pontos como texto WKT, nas colunas start_pt e end_pt
+    for coluna, ponto in [('start_pt', 'ponto_inicial'), ('end_pt', 'ponto_final')]:
+        if coluna in dados.columns:
+            dados[f'longitude_{ponto}'], dados[f'latitude_{ponto}'] = wkt_points_to_arrays(dados[coluna])
+            dados = dados.drop(columns=coluna)
+
+    dados = cast_columns(dados, {coluna: tipo for coluna, tipo in TIPOS_SHAPES.items() if coluna != 'shape'})
+
+    return dados
+
+
+
+### --- 7. Conversão de pontos WKT --- ###
+
+def wkt_points_to_arrays(pontos: pd.Series) -> tuple:
+    """
+    Converte, de uma só vez, uma coluna de pontos no formato WKT (por exemplo, 'POINT(-43.2 -22.9)')
+    em dois arrays de longitude e latitude.
+
+    Parâmetros:
+    pontos (series): Pontos no formato WKT.
+
+    Retorna:
+    tuple: Os arrays de longitude e latitude. Valores vazios ou fora do formato resultam em NaN.
+
+    Exemplos:
+    >>> dados['longitude'], dados['latitude'] = wkt_points_to_arrays(dados['posicao_veiculo_geo'])
+    """
+    coordenadas = pontos.astype(str).str.extract(r'POINT\s*\(\s*(\S+)\s+(\S+?)\s*\)', expand=True)
+    coordenadas = coordenadas.apply(pd.to_numeric, errors='coerce')
+
+    return coordenadas[0].to_numpy(dtype=np.float64), coordenadas[1].to_numpy(dtype=np.float64)
@@ -0,0 +1,162 @@
+### --- Execução sem operador (modo não interativo) --- ###
+
+### --- 1. Importar bibliotecas --- ###
+import os
+import subprocess
+import threading
+import time
+from utils import *
+
+
+### --- 2. Configuração --- ###
+
+# No modo interativo (padrão), a execução pergunta ao usuário antes da consulta dos dados de GPS e pausa
+# para que o modelo seja executado no DBT durante o reprocessamento. No modo não interativo, alterado
+# pelas flags de execução (ver run.py e classify.py), a consulta é liberada por um orçamento de bytes lidos
+# e o reprocessamento é feito por um comando (ou função) e/ou pela espera de um arquivo de sinal.
+CONFIGURACAO_NAO_INTERATIVO = {
+    'ativo': False,                     # substitui as perguntas ao usuário
+    'orcamento_gb': 10.0,               # máximo de GB lidos pelas consultas liberadas na execução
+    'reprocessamento': None,            # comando no terminal ou função, chamada com o caminho do reprocessar.csv
+    'arquivo_sinal': None,              # arquivo criado ou atualizado quando o reprocessamento termina
+    'intervalo_verificacao_s': 30,      # intervalo entre as verificações do arquivo de sinal
+    'tempo_maximo_espera_s': 4 * 3600,  # tempo máximo de espera pelo arquivo de sinal
+}
+
+# Bytes estimados das consultas já liberadas na execução. As partições da amostra (ver flows.py)
+# consultam ao mesmo tempo e dividem o mesmo orçamento.
+CONSUMO_ESTIMADO = {'bytes': 0}
+TRAVA_ORCAMENTO = threading.Lock()
+
+
+def configure_unattended_mode(ativo: bool = None, orcamento_gb: float = None, reprocessamento=None,
+                              arquivo_sinal: str = None) -> None:
+    """
+    Ativa ou desativa o modo não interativo e altera o orçamento e a forma do reprocessamento. O comando
+    e o arquivo de sinal do reprocessamento são sempre substituídos (None remove o valor configurado
+    anteriormente). O consumo estimado das consultas já liberadas volta a zero.
+
+    Parâmetros:
+    ativo (bool): Substitui as perguntas ao usuário.
+    orcamento_gb (float): Máximo de GB lidos pelas consultas liberadas na execução.
+    reprocessamento (str ou function): Comando executado no terminal (por exemplo, o dbt run do modelo
+    reprocessado) ou função chamada com o caminho do arquivo reprocessar.csv.
+    arquivo_sinal (str): Arquivo criado ou atualizado quando o reprocessamento termina.
+
+    Exemplos:
+    >>> configure_unattended_mode(ativo=True, orcamento_gb=20, reprocessamento='dbt run --select viagem_completa')
+    """
+    if ativo is not None:
+        CONFIGURACAO_NAO_INTERATIVO['ativo'] = ativo
+    if orcamento_gb is not None:
+        if orcamento_gb < 0:
+            raise ValueError('O orçamento de GB lidos deve ser maior ou igual a 0.')
+        CONFIGURACAO_NAO_INTERATIVO['orcamento_gb'] = orcamento_gb
+    CONFIGURACAO_NAO_INTERATIVO['reprocessamento'] = reprocessamento
+    CONFIGURACAO_NAO_INTERATIVO['arquivo_sinal'] = arquivo_sinal
+
+    with TRAVA_ORCAMENTO:
+        CONSUMO_ESTIMADO['bytes'] = 0
+
+
+### --- 3. Liberar consultas pelo custo estimado --- ###
+
+def confirm_query_cost(nome: str, bytes_estimados: int) -> bool:
+    """
+    Confirma se a consulta deve ser feita, a partir dos bytes lidos estimados (ver estimate_query_bytes).
+    No modo interativo, pergunta ao usuário. No modo não interativo, libera a consulta apenas se ela couber
+    no que resta do orçamento da execução.
+
+    Parâmetros:
+    nome (str): Nome dos dados consultados, mostrado na pergunta e no log.
+    bytes_estimados (int): Bytes lidos pela consulta.
+
+    Retorna:
+    bool: True se a consulta foi liberada.
+
+    Exemplos:
+    >>> confirm_query_cost('dados de GPS', estimate_gps_bytes(pares_faltantes))
+    """
+    estimativa_gb = bytes_estimados / 1024 ** 3
+
+    if not CONFIGURACAO_NAO_INTERATIVO['ativo']:
+        resposta = ""
+        with TRAVA_ENTRADA:
+            while resposta not in ['y', 'n']:
+                resposta = input(f"Estimativa de consumo de {estimativa_gb:.2f} GB para consulta de {nome}. "
+                                 f"Deseja continuar? (y/n): ").lower()
+        return resposta == 'y'
+
+    orcamento = CONFIGURACAO_NAO_INTERATIVO['orcamento_gb'] * 1024 ** 3
+    with TRAVA_ORCAMENTO:
+        liberada = CONSUMO_ESTIMADO['bytes'] + bytes_estimados <= orcamento
+        if liberada:
+            CONSUMO_ESTIMADO['bytes'] += bytes_estimados
+        consumo_gb = CONSUMO_ESTIMADO['bytes'] / 1024 ** 3
+
+    if liberada:
+        log_info(f'Consulta de {nome} liberada: estimativa de {estimativa_gb:.2f} GB '
+                 f'({consumo_gb:.2f} de {CONFIGURACAO_NAO_INTERATIVO["orcamento_gb"]:.2f} GB do orçamento).')
+    else:
+        log_info(f'Consulta de {nome} bloqueada: estimativa de {estimativa_gb:.2f} GB excede o orçamento '
+                 f'({consumo_gb:.2f} de {CONFIGURACAO_NAO_INTERATIVO["orcamento_gb"]:.2f} GB já usados).')
+
+    return liberada
+
+
+### --- 4. Aguardar o reprocessamento --- ###
+
+def wait_signal_file(arquivo: str, desde: float) -> None:
+    """
+    Aguarda até que o arquivo de sinal seja criado ou atualizado depois do instante informado.
+
+    Parâmetros:
+    arquivo (str): Caminho do arquivo de sinal.
+    desde (float): Instante (time.time()) a partir do qual o arquivo é considerado atualizado.
+    """
+    limite = time.time() + CONFIGURACAO_NAO_INTERATIVO['tempo_maximo_espera_s']
+
+    while not (os.path.exists(arquivo) and os.path.getmtime(arquivo) >= desde):
+        if time.time() > limite:
+            raise TimeoutError(f'O arquivo de sinal do reprocessamento {arquivo} não foi atualizado em '
+                               f'{CONFIGURACAO_NAO_INTERATIVO["tempo_maximo_espera_s"]} segundos.')
+        time.sleep(CONFIGURACAO_NAO_INTERATIVO['intervalo_verificacao_s'])
+
+
+def wait_reprocessing(caminho: str) -> None:
+    """
+    Aguarda a execução do modelo no DBT com o arquivo de reprocessamento. No modo interativo, pausa até
+    que o usuário pressione enter. No modo não interativo, executa o comando (ou a função) configurado e
+    aguarda o arquivo de sinal, quando configurado.
+
+    Parâmetros:
+    caminho (str): Caminho do arquivo reprocessar.csv.
+
+    Exemplos:
+    >>> wait_reprocessing('./../../queries-rj-smtr/data/reprocessar.csv')
+    """
+    if not CONFIGURACAO_NAO_INTERATIVO['ativo']:
+        with TRAVA_ENTRADA:
+            input("Execução pausada. Execute o modelo no DBT e pressione enter para continuar...")
+        return
+
+    reprocessamento = CONFIGURACAO_NAO_INTERATIVO['reprocessamento']
+    arquivo_sinal = CONFIGURACAO_NAO_INTERATIVO['arquivo_sinal']
+    if reprocessamento is None and arquivo_sinal is None:
+        raise RuntimeError('O modo não interativo precisa de um comando de reprocessamento ou de um arquivo '
+                           'de sinal para reprocessar as viagens.')
+
+    # Instante em segundos inteiros, para sistemas de arquivos que guardam a data de alteração sem frações
+    inicio = int(time.time())
+    if callable(reprocessamento):
+        log_info('Executando a função de reprocessamento.')
+        reprocessamento(caminho)
+    elif reprocessamento is not None:
+        log_info(f'Executando o comando de reprocessamento: {reprocessamento}')
+        subprocess.run(reprocessamento, shell=True, check=True)
+
+    if arquivo_sinal is not None:
+        log_info(f'Aguardando o arquivo de sinal do reprocessamento: {arquivo_sinal}')
+        wait_signal_file(arquivo_sinal, inicio)
+
+    log_info('Reprocessamento concluído.')
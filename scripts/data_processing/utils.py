@@ -1,129 +1,176 @@
+import json
 import logging
+import os
 import pandas as pd
 import prefect
+import threading
 from datetime import timedelta, datetime
 
 ### --- 1 - Config do arquivo de log ---###
-current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-log_filename = f"./log/log_{current_time}.txt"
-logging.basicConfig(
-    filename=log_filename, 
-    encoding='utf-8', 
-    level=logging.DEBUG, 
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'  # This format excludes milliseconds
-)
+
+# Arquivo de log da execução, criado por configure_log_file (e não na importação do módulo)
+CONFIGURACAO_LOG = {'arquivo': None}
+
+
+def configure_log_file(diretorio: str = './log') -> None:
+    """
+    Cria o arquivo de log da execução no diretório informado. Chamadas seguintes não criam outro
+    arquivo. Com diretorio=None, as mensagens são mostradas apenas no console.
+
+    Exemplos:
+    >>> configure_log_file('./log')
+    """
+    if CONFIGURACAO_LOG['arquivo'] is not None or diretorio is None:
+        return
+
+    os.makedirs(diretorio, exist_ok=True)
+    current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    log_filename = os.path.join(diretorio, f"log_{current_time}.txt")
+    logging.basicConfig(
+        filename=log_filename, 
+        encoding='utf-8', 
+        level=logging.DEBUG, 
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'  # This format excludes milliseconds
+    )
+    CONFIGURACAO_LOG['arquivo'] = log_filename
 
 ### --- Função de log --- ###
 def log_info(message) -> None:
     """
-    Mostra a mensagem do log no console e salva no arquivo de log.
+    Mostra a mensagem do log no console e salva no arquivo de log. O contexto do Prefect é de cada
+    thread: em threads criadas fora do fluxo (sem o logger no contexto), usa o logger "prefect".
     """
     # logging.debug(message)
     # print(message)  
-    prefect.context.logger.info(f"\n{message}")
+    logger = prefect.context.get('logger') or logging.getLogger('prefect')
+    logger.info(f"\n{message}")
+
+
+# As partições da amostra são classificadas ao mesmo tempo (ver flows.py): as perguntas ao usuário no
+# console são feitas uma de cada vez
+TRAVA_ENTRADA = threading.Lock()
        
     
+def format_services(servicos: pd.Series) -> pd.Series:
+    """
+    Converte as tuplas de serviços apurados em texto separado por vírgulas, para exportação.
+    Valores que não são tuplas são mantidos como texto e valores vazios viram "".
+
+    Exemplos:
+    >>> format_services(viagens_gps_classificadas['servico_apurado'])
+    """
+    posicao = pd.Series(servicos.to_numpy(), index=range(len(servicos))).explode().dropna()
+    texto = posicao.astype(str).groupby(level=0, sort=False).agg(', '.join)
+
+    return pd.Series(texto.reindex(range(len(servicos)), fill_value='').to_numpy(), index=servicos.index)
+
+
 def export_data(viagens_gps_classificadas: pd.DataFrame) -> pd.DataFrame:
     
     protocolo = viagens_gps_classificadas.pop('protocolo')
     viagens_gps_classificadas.insert(0, 'protocolo', protocolo)
+
+    if 'servico_apurado' in viagens_gps_classificadas.columns:
+        viagens_gps_classificadas['servico_apurado'] = format_services(viagens_gps_classificadas['servico_apurado'])
         
     viagens_gps_classificadas.to_excel('../data/output/amostra_classificada.xlsx', index=False)
     log_info('Arquivo com os status exportado com sucesso em xlsx no diretório data/output.')
     viagens_gps_classificadas.to_json('../data/output/amostra_classificada.json')
     log_info('Arquivo com os status exportado com sucesso em json no diretório data/output.')
     
-def generate_report(viagens_gps_classificadas: pd.DataFrame, amostra: pd.DataFrame) -> pd.DataFrame:
-    
-    log_info('Relatório da execução do algoritmo:')
+def count_table(contagens: pd.Series, total: int) -> dict:
+    """
+    Monta uma seção do relatório com a contagem e a porcentagem de cada categoria em relação ao total.
+    A porcentagem é None quando o total é zero.
+    """
+    return {str(categoria): {'Contagem': int(contagem),
+                             'Porcentagem': float(contagem / total * 100) if total > 0 else None}
+            for categoria, contagem in contagens.items()}
 
-    # Criar um dataframe para armazenar os resultados
-    tabela = pd.DataFrame(index=['Parecer definido','Parecer indefinido'], columns=['Contagem', 'Porcentagem'])
 
-    # 1 - Mostrar o total de recursos avaliados
-    total_rows = len(viagens_gps_classificadas)
-    
-    print('Total de recursos analisados pelo algoritmo:', total_rows)
-    
-       
-    # 2 - Contar o número de ocorrências em que o algoritmo foi capaz de gerar um parecer
-    condicao = (viagens_gps_classificadas['status'] == 'Viagem não classificada pelo algoritmo')
-    contagem_total = sum(condicao)
+def report_table(secao: dict) -> pd.DataFrame:
+    """
+    Converte uma seção do relatório em tabela, para exibição no log.
+    """
+    tabela = pd.DataFrame.from_dict(secao, orient='index', columns=['Contagem', 'Porcentagem'])
 
-    # Atualizar a contagem na linha "Parecer indefinido"
-    tabela.loc['Parecer indefinido', 'Contagem'] = contagem_total
+    return tabela.astype({'Contagem': int, 'Porcentagem': float})
 
-    # Calcular a contagem em "Parecer definido"
-    tabela.loc['Parecer definido', 'Contagem'] = total_rows - contagem_total
 
-    # Calcular as porcentagens
-    tabela['Porcentagem'] = (tabela['Contagem'] / total_rows) * 100
-    logging.debug(tabela)
-    print(tabela)  
-    
-    
-    # 3 - Verificar se o recurso foi deferido ou indeferido    
-    status_deferido = 'Viagem deferida após o reprocessamento'
-    status_indeferidos = ['Viagem identificada e já paga', 'Viagem indeferida']
+def build_report(viagens_gps_classificadas: pd.DataFrame, amostra: pd.DataFrame) -> dict:
+    """
+    Calcula o resumo das viagens processadas pelo algoritmo, com uma única contagem por coluna de status.
+
+    Parâmetros:
+    viagens_gps_classificadas (dataframe): Tabela final, com as colunas status (simplificado) e observacao.
+    amostra (dataframe): Amostra tratada, usada para conferir a quantidade de viagens.
+
+    Retorna:
+    dict: Relatório com o total de recursos e as seções parecer, recursos e observacao, cada uma com a
+    contagem e a porcentagem de cada categoria.
+
+    Exemplos:
+    >>> build_report(viagens_gps_classificadas, amostra)['parecer']['Parecer indefinido']
+    {'Contagem': 3, 'Porcentagem': 1.5}
+    """
+    total_recursos = len(viagens_gps_classificadas)
 
-    # Calculando a contagem para recursos deferidos
-    condicao_deferido = (viagens_gps_classificadas['status'] == status_deferido)
-    contagem_deferido = sum(condicao_deferido)
-    tabela.loc['Recursos deferidos', 'Contagem'] = contagem_deferido
+    contagem_status = viagens_gps_classificadas['status'].astype('category').value_counts()
 
-    # Calculando a contagem para recursos indeferidos
-    contagem_indeferido = 0
-    for status in status_indeferidos:
-        condicao = (viagens_gps_classificadas['status'] == status)
-        contagem = sum(condicao)
-        contagem_indeferido += contagem
-    tabela.loc['Recursos indeferidos', 'Contagem'] = contagem_indeferido
+    # As categorias de observacao são listadas na ordem em que aparecem na tabela
+    observacao = viagens_gps_classificadas['observacao'].dropna()
+    contagem_observacao = observacao.astype('category').value_counts().reindex(observacao.unique())
 
-    # Calculando a soma total das categorias de interesse
-    soma_categorias = contagem_deferido + contagem_indeferido
+    # Parecer definido ou indefinido
+    indefinidos = int(contagem_status.get('Viagem não classificada pelo algoritmo', 0))
+    parecer = pd.Series({'Parecer definido': total_recursos - indefinidos, 'Parecer indefinido': indefinidos})
 
-    # Calculando o percentual
-    tabela.loc['Recursos deferidos', 'Porcentagem'] = (contagem_deferido / soma_categorias) * 100
-    tabela.loc['Recursos indeferidos', 'Porcentagem'] = (contagem_indeferido / soma_categorias) * 100
+    # Recursos deferidos ou indeferidos
+    deferidos = int(contagem_status.get('Viagem deferida após o reprocessamento', 0))
+    indeferidos = int(sum(contagem_status.get(status, 0) for status in ['Viagem identificada e já paga', 'Viagem indeferida']))
+    recursos = pd.Series({'Recursos deferidos': deferidos, 'Recursos indeferidos': indeferidos})
 
-    # Exibindo o resultado
-    log_info(tabela.loc[['Recursos deferidos', 'Recursos indeferidos']])
+    return {
+        'total_recursos': total_recursos,
+        'parecer': count_table(parecer, total_recursos),
+        'recursos': count_table(recursos, deferidos + indeferidos),
+        'observacao': count_table(contagem_observacao, int(contagem_observacao.sum())),
+        'quantidade_igual_amostra': len(amostra) == total_recursos,
+    }
 
 
-    # 4 - Listar tipos de casos segundo a coluna "observacao"
+def generate_report(viagens_gps_classificadas: pd.DataFrame, amostra: pd.DataFrame) -> dict:
     
-    categorias_interesse = viagens_gps_classificadas['observacao'].dropna().unique().tolist()
+    log_info('Relatório da execução do algoritmo:')
+
+    relatorio = build_report(viagens_gps_classificadas, amostra)
 
-    for categoria in categorias_interesse:
-        tabela.loc[categoria, 'Contagem'] = 0
-        tabela.loc[categoria, 'Porcentagem'] = 0
+    # 1 - Mostrar o total de recursos avaliados
+    print('Total de recursos analisados pelo algoritmo:', relatorio['total_recursos'])
 
-    # Calculando a contagem para cada categoria de interesse
-    for categoria in categorias_interesse:
-        condicao = (viagens_gps_classificadas['observacao'] == categoria)
-        contagem = sum(condicao)
-        tabela.loc[categoria, 'Contagem'] = contagem
+    # 2 - Número de ocorrências em que o algoritmo foi capaz de gerar um parecer
+    tabela = report_table(relatorio['parecer'])
+    logging.debug(tabela)
+    print(tabela)
 
-    soma_categorias = tabela.loc[categorias_interesse, 'Contagem'].sum()
+    # 3 - Recursos deferidos ou indeferidos
+    log_info(report_table(relatorio['recursos']))
 
-    # Verificando se a soma das categorias de interesse é zero para evitar divisão por zero
-    if soma_categorias > 0:
-        # Calculando o percentual
-        for categoria in categorias_interesse:
-            tabela.loc[categoria, 'Porcentagem'] = (tabela.loc[categoria, 'Contagem'] / soma_categorias) * 100
-    else:
+    # 4 - Tipos de casos segundo a coluna "observacao"
+    if not relatorio['observacao']:
         log_info("A soma das categorias de interesse é zero, não é possível calcular a porcentagem.")
+    log_info(report_table(relatorio['observacao']))
 
-    # Exibindo o resultado
-    log_info(tabela.loc[categorias_interesse])
-    
-    
-    
     # 5 - Checar número de viagens do arquivo raw vs o número de viagens na tabela final do algoritmo:
-    if len(amostra) == len(viagens_gps_classificadas):
+    if relatorio['quantidade_igual_amostra']:
         log_info("Check: OK. Quantidade de viagens do input igual a quantidade de viagens no output.")
     else:
         log_info("Check: ATENÇÃO. Quantidade de viagens do input DIFERENTE da quantidade de viagens no output.")
-    
-        
\ No newline at end of file
+
+    # 6 - Exportar o relatório para ser consumido por outras ferramentas
+    with open('../data/output/relatorio.json', 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=4)
+    log_info('Relatório exportado com sucesso em json no diretório data/output.')
+
+    return relatorio
@@ -1,8 +1,14 @@
 from graphs import *
 from utils import *
 from treat_data import *
+from cache_files import *
+from slice_store import *
+from gps_store import *
+from queries_functions import *
+from run_metrics import *
 import pandas as pd
 
+@measured()
 def automate_map(viagens_gps_classificadas, status_list):
     """
     Esta função gera mapas no formato HTML para as viagens não identificadas, mas que existe sinal de GPS com o serviço correto.
@@ -13,14 +19,16 @@ def automate_map(viagens_gps_classificadas, status_list):
     log_info('Iniciando a etapa de geração dos mapas em HTML.')  
     
     log_info('Acessando dados de GPS e do trajeto.') 
-    dados_shape = pd.read_csv('../data/cache/dados_gps_shape.csv')
-    dados_shape['servico'] = dados_shape['servico'].astype(str)   
 
-    dados_gps = pd.read_csv('../data/cache/dados_gps.csv')
-    dados_gps = treat_gps(dados_gps)
-      
     # Filtrar as viagens pelo status desejado
     viagens_para_mapa = viagens_gps_classificadas[viagens_gps_classificadas['status'].isin(status_list)]
+
+    # Os shapes já foram carregados na verificação do início e fim das viagens (check_start_end_gps)
+    dados_shape = fetch_shapes(service_day_pairs(viagens_para_mapa))
+    dados_shape = treat_shapes(cast_columns(dados_shape, TIPOS_SHAPES))
+
+    # Ler os sinais de GPS apenas dos dias e veículos das viagens com mapa
+    dados_gps = read_gps_store(vehicle_day_pairs(viagens_para_mapa))
     
     if not viagens_para_mapa.empty:
         for _, row in viagens_para_mapa.iterrows():
@@ -5,9 +5,9 @@ from PIL import Image
 from shapely import wkt
 
 
-def create_point_element_map(map_point, color, tooltip):
+def create_point_element_map(location, color, tooltip):
     return folium.Circle(
-        location=[map_point.y, map_point.x],
+        location=location,
         radius=10,
         fill=True,
         fill_opacity=1,
@@ -16,19 +16,19 @@ def create_point_element_map(map_point, color, tooltip):
     )
 
 
-def create_marker_element_map(map_point, color, tooltip):
+def create_marker_element_map(location, color, tooltip):
     return folium.Marker(
-        location=[map_point.y, map_point.x],
+        location=location,
         icon=folium.Icon(color=color),
         tooltip=tooltip,
     )
 
 
 def create_radius_element_map(
-    map_point, color, tooltip, weight=0.3, fill=True, radius=500
+    location, color, tooltip, weight=0.3, fill=True, radius=500
 ):
     return folium.Circle(
-        location=[map_point.y, map_point.x],
+        location=location,
         radius=radius,
         weight=weight,
         fill=True,
@@ -48,10 +48,11 @@ def create_trip_map(posicoes, shapes_geom):
     num determinado período com o shape do serviço operado.
 
     posicoes (pd.DataFrame): Tabela de posições de GPS. Deve conter as colunas:
-    id_veiculo,servico,timestamp_gps,posicao_veiculo_geo,status_viagem(opcional);
+    id_veiculo,servico,timestamp_gps,longitude,latitude,status_viagem(opcional);
 
     shapes_geom (pd.DataFrame): Tabela do shape em linestring. Deve
-    conter as colunas: shape_id,shape,start_pt,end_pt;
+    conter as colunas: shape_id,shape,longitude_ponto_inicial,latitude_ponto_inicial,
+    longitude_ponto_final,latitude_ponto_final;
     """
     # Gera layout do mapa
     title = f"""
@@ -81,10 +82,6 @@ def create_trip_map(posicoes, shapes_geom):
     feature_gps_radius = folium.FeatureGroup(name="gps_radius")
     feature_gps_points = folium.FeatureGroup(name="gps_points")
 
-    posicoes["posicao_veiculo_geo"] = posicoes["posicao_veiculo_geo"].astype(str)
-    posicoes["posicao_veiculo_geo"] = posicoes["posicao_veiculo_geo"].apply(wkt.loads)
-
-
     for _, p in posicoes.iterrows():
         ## Define cor padrão de status "out" quando GPS não é classificado
         if "status_viagem" in posicoes.columns:
@@ -94,7 +91,7 @@ def create_trip_map(posicoes, shapes_geom):
 
         ## Adiciona raio da posição classificada pelo status
         create_radius_element_map(
-            map_point=p.posicao_veiculo_geo,
+            location=[p.latitude, p.longitude],
             color=status_colors[status],
             tooltip=f"{p['timestamp_gps']} - Status: ({status})",  # ({p['status']})
             #tooltip=f"{p.timestamp_gps} - Status: ({p.status_viagem})",
@@ -103,7 +100,7 @@ def create_trip_map(posicoes, shapes_geom):
 
         ## Adiciona a posição de GPS classificada pelo status (centro do raio)
         create_point_element_map(
-            map_point=p.posicao_veiculo_geo,
+            location=[p.latitude, p.longitude],
             color=status_colors[status],
             tooltip=f"{p['timestamp_gps']} - Status: ({status})",
             # tooltip=f"{p.timestamp_gps} - Status: ({p.status_viagem})",
@@ -117,8 +114,8 @@ def create_trip_map(posicoes, shapes_geom):
 
         df_shape = shapes_geom[shapes_geom.shape_id == shape_id]
         shape = wkt.loads(df_shape["shape"].values[0])
-        start_pt = wkt.loads(df_shape["start_pt"].values[0])
-        end_pt = wkt.loads(df_shape["end_pt"].values[0])
+        start_pt = [df_shape["latitude_ponto_inicial"].values[0], df_shape["longitude_ponto_inicial"].values[0]]
+        end_pt = [df_shape["latitude_ponto_final"].values[0], df_shape["longitude_ponto_final"].values[0]]
 
         if shape.geom_type == "LineString":
             line = [[y, x] for x, y in shape.coords]
@@ -133,13 +130,13 @@ def create_trip_map(posicoes, shapes_geom):
         ## Ponto inicial do shape:
 
         create_marker_element_map(
-            map_point=start_pt,
+            location=start_pt,
             color=shape_colors[idx],
             tooltip=f"Ponto inicial - Shape: {shape_id}",
         ).add_to(feature_shape)
 
         create_radius_element_map(
-            map_point=start_pt,
+            location=start_pt,
             color=shape_colors[idx],
             tooltip=f"Ponto inicial - Shape: {shape_id}",
             fill=True,
@@ -147,7 +144,7 @@ def create_trip_map(posicoes, shapes_geom):
         ).add_to(feature_shape)
 
         create_radius_element_map(
-            map_point=end_pt,
+            location=end_pt,
             color=shape_colors[idx],
             tooltip=f"Ponto inicial - Shape: {shape_id}",
             fill=True,
@@ -1,20 +1,34 @@
-from prefect import Flow, Parameter
+from prefect import Flow, Parameter, unmapped
 from tasks import *
 
+# A amostra é dividida em partições por data (partition_sample) e as etapas de classificação rodam
+# uma vez para cada partição (.map), ao mesmo tempo, com o executor definido em classify.py. O
+# reprocessamento e a consulta dos sinais de GPS, que pausam a execução ou perguntam ao usuário, são
+# feitos uma única vez para todas as partições.
 with Flow("Classificar recursos") as flow:
 
-    amostra = run_sample()
+    amostra_recebida = Parameter('amostra')
 
-    viagem_completa_classificada = run_complete_trips(amostra)
+    particoes_amostra = Parameter('particoes', default=1)
+
+    amostra = run_sample(amostra_recebida)
+
+    particoes = partition_sample(amostra, particoes_amostra)
+
+    viagem_completa_classificada = run_complete_trips.map(particoes)
 
     viagem_completa_reprocessada = run_reprocessed_trips(viagem_completa_classificada)
 
-    viagem_conformidade_classificada = run_conformity_trips(viagem_completa_reprocessada)
+    viagem_conformidade_classificada = run_conformity_trips.map(viagem_completa_reprocessada)
+
+    viagens_circulares_classificadas = run_circular_trips.map(viagem_conformidade_classificada)
+
+    consulta_gps = run_gps_query(viagens_circulares_classificadas)
 
-    viagens_circulares_classificadas = run_circular_trips(viagem_conformidade_classificada, amostra)
+    viagens_check_gps = run_gps_data.map(viagens_circulares_classificadas, upstream_tasks=[unmapped(consulta_gps)])
 
-    viagens_check_gps = run_gps_data(viagens_circulares_classificadas)
+    create_html_maps.map(viagens_check_gps)
 
-    create_html_maps(viagens_check_gps)
+    viagens_classificadas = merge_partitions(viagens_check_gps)
 
-    final_adjusts(viagens_check_gps, amostra)
\ No newline at end of file
+    tabela_final = final_adjusts(viagens_classificadas, amostra)
@@ -1,13 +1,32 @@
 
 ### --- 1. Carregar bibliotecas --- ###
-import basedosdados as bd
 import pandas as pd
 from utils import *
+from cache_files import *
+from slice_store import *
+from query_backends import *
+from query_builder import *
+from run_metrics import *
+
+
+### --- 1.1 Parâmetros usados como chave do cache das consultas --- ###
+
+def planned_trips_query_parameters(data_servico_df, include_shape_direction=False, geometry_data=False):
+    servicos = data_servico_df[['data']].assign(
+        servico=data_servico_df['servico'] if 'servico' in data_servico_df.columns else data_servico_df['servico_amostra'])
+    return {'data_servico': sorted(set(servicos.astype(str).itertuples(index=False, name=None))),
+            'include_shape_direction': include_shape_direction, 'geometry_data': geometry_data}
+
+
+# Expressão, nas tabelas do Big Query, de cada coluna das chaves (data, id_veiculo) e (data, servico)
+COLUNAS_PARES = {'data': 'data', 'id_veiculo': 'SUBSTRING(id_veiculo, 2)'}
+COLUNAS_SERVICOS = {'data': 'data', 'servico': 'servico'}
 
 
 ### --- 2. Consultar do Big Query as viagens completas --- ###
 
-def query_viagem_completa(data, id_veiculo, reprocessed=False):
+@measured(medir_bytes=True)
+def query_viagem_completa(pares, reprocessed=False):
     
     """
     Faz a consulta no Big Query na tabela de viagem_completa em produção ou na versão reprocessada em dev
@@ -15,27 +34,26 @@ def query_viagem_completa(data, id_veiculo, reprocessed=False):
         
     """     
     
-    table = f"""
-    `rj-smtr.projeto_subsidio_sppo.viagem_completa` 
-    WHERE 
-      data IN ({data})
-      AND SUBSTRING(id_veiculo, 2) IN ({id_veiculo})
-      """
-    if reprocessed:
-      table = "`rj-smtr-dev.projeto_subsidio_sppo_recursos_reprocessado.viagem_completa`"
-    
-    q = f"""
-    SELECT
+    select_clause = """
       data,
       SUBSTRING(id_veiculo, 2) as id_veiculo,
       servico_informado,
       sentido,
       datetime_partida,
-      datetime_chegada
+      datetime_chegada"""
+
+    # A versão reprocessada em dev contém apenas as viagens reprocessadas e é lida por inteiro
+    if reprocessed:
+        q = f"""
+    SELECT
+      {select_clause}
     FROM
-      {table}
-    """   
-    dados = bd.read_sql(q, from_file=True)        
+      `rj-smtr-dev.projeto_subsidio_sppo_recursos_reprocessado.viagem_completa`
+    """
+        dados = run_query(q)
+    else:
+        dados = read_keyed_query(select_clause, "`rj-smtr.projeto_subsidio_sppo.viagem_completa`", pares, COLUNAS_PARES)
+        
     
     if dados.empty:
         log_info("Não foram encontradas viagens na tabela de viagem completa.")
@@ -53,29 +71,29 @@ def query_viagem_completa(data, id_veiculo, reprocessed=False):
     com a alteração do serviço no sinal de GPS para casos antes de 16/11/2022.
         
     """   
-def query_viagem_conformidade(data, id_veiculo, reprocessed=False):
+@measured(medir_bytes=True)
+def query_viagem_conformidade(pares, reprocessed=False):
   
-    table = f"""
-    `rj-smtr.projeto_subsidio_sppo.viagem_conformidade` 
-    WHERE 
-      data IN ({data})
-      AND SUBSTRING(id_veiculo, 2) IN ({id_veiculo})
-      """
-    if reprocessed:
-      table = "`rj-smtr-dev.projeto_subsidio_sppo_recursos_reprocessado.viagem_conformidade`"
-      
-    q = f"""
-    SELECT
+    select_clause = """
       data,
-      SUBSTRING(id_veiculo, 2)  as id_veiculo,
+      SUBSTRING(id_veiculo, 2) as id_veiculo,
       servico_informado,
       sentido,
       datetime_partida,
-      datetime_chegada
+      datetime_chegada"""
+
+    # A versão reprocessada em dev contém apenas as viagens reprocessadas e é lida por inteiro
+    if reprocessed:
+        q = f"""
+    SELECT
+      {select_clause}
     FROM
-      {table}
-    """   
-    dados = bd.read_sql(q, from_file=True)      
+      `rj-smtr-dev.projeto_subsidio_sppo_recursos_reprocessado.viagem_conformidade`
+    """
+        dados = run_query(q)
+    else:
+        dados = read_keyed_query(select_clause, "`rj-smtr.projeto_subsidio_sppo.viagem_conformidade`", pares, COLUNAS_PARES)
+      
     
     if dados.empty:
         log_info("Não foram encontradas viagens na tabela de viagem conformidade.")
@@ -87,46 +105,33 @@ def query_viagem_conformidade(data, id_veiculo, reprocessed=False):
 
 ### --- 4. Consultar do Big Query os dados de GPS --- ###
 
+# Colunas e tabela dos sinais de GPS, usadas na consulta e na estimativa dos bytes lidos
+SELECT_GPS = """
+      data,
+      SUBSTRING(id_veiculo, 2) as id_veiculo,
+      servico,
+      timestamp_gps,
+      longitude,
+      latitude"""
+
+TABELA_GPS = "`rj-smtr.br_rj_riodejaneiro_veiculos.gps_sppo`"
 
 
-def query_gps(df_conditions):
+@measured(medir_bytes=True)
+def query_gps(pares):
     """
-    Realiza uma query SQL nos dados de GPS para cada viagem do dataframe inserido como parâmetro.
+    Realiza uma query SQL nos dados de GPS de cada par (data, id_veiculo) do dataframe inserido como
+    parâmetro. São retornados todos os sinais do veículo no dia, para que cada par possa ser guardado
+    localmente e reaproveitado por outras viagens do mesmo veículo e dia (ver slice_store.py).
 
     Parâmetros:
-        df_conditions (pd.DataFrame): DataFrame contendo as colunas necessárias para 
-                                      criar as condições SQL.
+        pares (pd.DataFrame): DataFrame com as colunas data ('AAAA-MM-DD') e id_veiculo.
 
     Retorna:
         pd.DataFrame: DataFrame contendo os resultados da query SQL.
     """
-    # Criando as condições SQL diretamente dentro da função.
-    conditions = []
-    for _, row in df_conditions.iterrows():
-        condition = (
-            f"(DATA = '{row['data']}' "
-            f"AND SUBSTRING(id_veiculo, 2) = '{row['id_veiculo_amostra']}' "
-            f"AND timestamp_gps BETWEEN '{row['datetime_partida_amostra']}' "
-            f"AND '{row['datetime_chegada_amostra']}')"
-        )
-        conditions.append(condition)
-    
-    sql_conditions = " OR ".join(conditions)
-
-    # Query SQL usando as condições geradas.
-    q = f"""
-    SELECT
-      SUBSTRING(id_veiculo, 2) as id_veiculo,
-      servico,
-      timestamp_gps,
-      ST_GEOGPOINT(longitude, latitude) as posicao_veiculo_geo
-    FROM
-      `rj-smtr.br_rj_riodejaneiro_veiculos.gps_sppo`
-    WHERE
-      {sql_conditions}
-    """   
-    # Suponho que `bd.read_sql` seja uma função definida em seu ambiente.
-    dados = bd.read_sql(q, from_file=True)
+    # Os pares são enviados como parâmetro da consulta, com uma consulta por grupo de datas
+    dados = read_keyed_query(SELECT_GPS, TABELA_GPS, pares, COLUNAS_PARES)
     dados = dados.sort_values(by='timestamp_gps')
     
     if dados.empty:
@@ -136,47 +141,84 @@ def query_gps(df_conditions):
         pass
     
     return dados
-  
-  
+
+
+def estimate_gps_bytes(pares):
+    """
+    Estima, sem executar, os bytes lidos pela consulta dos dados de GPS dos pares (data, id_veiculo)
+    (ver query_gps e estimate_query_bytes).
+
+    Exemplos:
+    >>> estimate_gps_bytes(missing_slices('dados_gps', vehicle_day_pairs(linhas_nan)))
+    """
+    return estimate_keyed_query_bytes(SELECT_GPS, TABELA_GPS, pares, COLUNAS_PARES)
+
+
+### --- 4.1 Consultar apenas os pares (data, id_veiculo) que não estão guardados --- ###
+
+def fetch_viagem_completa(pares):
+    """
+    Retorna as viagens completas dos pares (data, id_veiculo), consultando apenas os que não estão guardados.
+
+    Exemplos:
+    >>> fetch_viagem_completa(vehicle_day_pairs(amostra_tratada, 'id_veiculo'))
+    """
+    return registered_dataset('viagem_completa', pares,
+                              lambda faltantes: fetch_slices('viagem_completa', faltantes, query_viagem_completa))
+
+
+def fetch_viagem_conformidade(pares):
+    """
+    Retorna as viagens conformidade dos pares (data, id_veiculo), consultando apenas os que não estão guardados.
+
+    Exemplos:
+    >>> fetch_viagem_conformidade(vehicle_day_pairs(linhas_nan))
+    """
+    return registered_dataset('viagem_conformidade', pares,
+                              lambda faltantes: fetch_slices('viagem_conformidade', faltantes,
+                                                             query_viagem_conformidade))
+
+
+def fetch_gps(pares):
+    """
+    Retorna os sinais de GPS dos pares (data, id_veiculo), consultando apenas os que não estão guardados.
+    Os sinais do dia inteiro não ficam no registro da execução (ver registered_dataset): cada etapa lê
+    apenas as fatias dos seus pares, e os sinais recortados das viagens são passados às etapas seguintes
+    pelo armazenamento em Arrow (ver gps_store.py).
+
+    Exemplos:
+    >>> fetch_gps(vehicle_day_pairs(linhas_nan))
+    """
+    return fetch_slices('dados_gps', pares, query_gps)
 
 
 ### --- 5. Consultar dados de viagens planejadas --- ###
 # Verificar o tipo de servico (circular ou ida e volta) e dados do trajeto 
 
+@cached_query('viagem_planejada', planned_trips_query_parameters)
+@measured(medir_bytes=True)
 def query_planned_trips(data_servico_df, include_shape_direction=False, geometry_data=False):
     # Verificando se deve incluir a coluna 'sentido_shape' na query.
     select_clause = "data, servico, sentido"
     
+    # Os pontos inicial e final do shape são retornados como coordenadas numéricas
     if geometry_data:
-        select_clause = "data, servico, sentido, shape_id, shape, start_pt, end_pt"
+        select_clause = ("data, servico, sentido, shape_id, shape, "
+                         "ST_X(start_pt) as longitude_ponto_inicial, ST_Y(start_pt) as latitude_ponto_inicial, "
+                         "ST_X(end_pt) as longitude_ponto_final, ST_Y(end_pt) as latitude_ponto_final")
     
     if include_shape_direction:
         select_clause += ", sentido_shape"
     
-    conditions = []
-    
-    for index, row in data_servico_df.iterrows():
-        d = row['data']
-        s = row.get('servico', row.get('servico_amostra'))
-        condition = (
-            f"(DATA = '{d}' AND servico = '{s}')"
-        )
-        conditions.append(condition)
-    
-    sql_conditions = " OR ".join(conditions)
-    
-    # Construindo a query.
-    q = f"""
-    SELECT
-    {select_clause}
-    FROM
-      `rj-smtr.projeto_subsidio_sppo.viagem_planejada`
-    WHERE 
-      {sql_conditions}
-    """
+    # Pares (data, servico) consultados, enviados como parâmetro da consulta
+    servicos = pd.DataFrame({
+        'data': pd.to_datetime(data_servico_df['data']).dt.strftime('%Y-%m-%d'),
+        'servico': (data_servico_df['servico'] if 'servico' in data_servico_df.columns
+                    else data_servico_df['servico_amostra']).astype(str)})
     
     # Executando a query e retornando os dados.
-    dados = bd.read_sql(q, from_file=True)
+    dados = read_keyed_query(select_clause, "`rj-smtr.projeto_subsidio_sppo.viagem_planejada`", servicos,
+                             COLUNAS_SERVICOS)
     if dados.empty:
         log_info("Não foram encontradas viagens planejadas para as datas.")
     else:
@@ -184,3 +226,29 @@ def query_planned_trips(data_servico_df, include_shape_direction=False, geometry
         pass
     
     return dados
+
+
+### --- 5.1 Consultar apenas os pares (data, servico) que ainda não foram carregados --- ###
+
+def fetch_service_types(servicos):
+    """
+    Retorna o sentido e o sentido do shape dos pares (data, servico), reaproveitando os pares já
+    carregados na execução.
+
+    Exemplos:
+    >>> fetch_service_types(service_day_pairs(dados))
+    """
+    return registered_dataset('tipo_servico', servicos,
+                              lambda faltantes: query_planned_trips(faltantes, include_shape_direction=True))
+
+
+def fetch_shapes(servicos):
+    """
+    Retorna os shapes e os pontos inicial e final dos pares (data, servico), reaproveitando os pares já
+    carregados na execução.
+
+    Exemplos:
+    >>> fetch_shapes(service_day_pairs(viagens_com_gps))
+    """
+    return registered_dataset('dados_gps_shape', servicos,
+                              lambda faltantes: query_planned_trips(faltantes, geometry_data=True))
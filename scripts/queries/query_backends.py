@@ -0,0 +1,240 @@
+
+### --- 1. Carregar bibliotecas --- ###
+import hashlib
+import os
+import re
+import pandas as pd
+from utils import *
+
+
+### --- 1.1 Configuração --- ###
+
+# Backend usado pelas consultas, alterado pelas flags de execução (ver tasks.py)
+CONFIGURACAO_BACKEND = {
+    'backend': 'bigquery',                 # 'bigquery' (produção) ou 'duckdb' (arquivos parquet locais)
+    'diretorio_local': '../data/local',    # raiz das tabelas em parquet usadas pelo backend duckdb
+}
+
+
+def configure_query_backend(backend: str = None, diretorio_local: str = None) -> None:
+    """
+    Altera o backend usado pelas consultas.
+
+    Parâmetros:
+    backend (str): 'bigquery' ou 'duckdb'.
+    diretorio_local (str): Raiz das tabelas em parquet do backend duckdb. Cada tabela
+    `projeto.conjunto.tabela` fica em <diretorio_local>/projeto/conjunto/tabela/, em um ou mais
+    arquivos parquet (podendo estar particionados por data, como data=2022-11-20/).
+
+    Exemplos:
+    >>> configure_query_backend('duckdb', '../data/local')
+    """
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(f'Backend {backend} não existe. Opções: {", ".join(BACKENDS)}.')
+        CONFIGURACAO_BACKEND['backend'] = backend
+    if diretorio_local is not None:
+        CONFIGURACAO_BACKEND['diretorio_local'] = diretorio_local
+
+
+def backend_identifier() -> str:
+    """
+    Identifica a origem dos dados das consultas, usada para separar os dados guardados localmente (fatias,
+    consultas e checkpoints) de cada origem. Retorna None para o Big Query (produção) e, para um backend
+    local, o nome do backend e o hash do caminho absoluto do diretório local.
+
+    Exemplos:
+    >>> configure_query_backend('duckdb', '../data/local')
+    >>> backend_identifier()  # hash de 12 caracteres do caminho absoluto de ../data/local
+    'duckdb_...'
+    """
+    if CONFIGURACAO_BACKEND['backend'] == 'bigquery':
+        return None
+
+    diretorio = os.path.realpath(CONFIGURACAO_BACKEND['diretorio_local'])
+    return f"{CONFIGURACAO_BACKEND['backend']}_{hashlib.sha256(diretorio.encode('utf-8')).hexdigest()[:12]}"
+
+
+### --- 2. Backend Big Query --- ###
+
+def run_bigquery_query(q: str, parametros: list = None) -> pd.DataFrame:
+    """
+    Executa a consulta no Big Query. Consultas com parâmetros (queryParameters) são executadas pelo
+    pandas_gbq, com as mesmas credenciais e o mesmo projeto de cobrança do bd.read_sql (ver set_credentials.py).
+    """
+    import basedosdados as bd
+
+    if not parametros:
+        return bd.read_sql(q, from_file=True)
+
+    import pandas_gbq
+    from basedosdados.download.base import credentials
+
+    return pandas_gbq.read_gbq(q, project_id=bd.config.billing_project_id,
+                               credentials=credentials(from_file=True),
+                               configuration={'query': {'parameterMode': 'NAMED', 'queryParameters': parametros}})
+
+
+def estimate_bigquery_bytes(q: str, parametros: list = None) -> int:
+    """
+    Estima os bytes lidos pela consulta no Big Query com uma execução de teste (dry run), que não é
+    cobrada e não retorna dados. Usa as mesmas credenciais e o mesmo projeto de cobrança do run_bigquery_query.
+    """
+    import basedosdados as bd
+    from basedosdados.download.base import credentials
+    from google.cloud import bigquery
+
+    cliente = bigquery.Client(project=bd.config.billing_project_id, credentials=credentials(from_file=True))
+    configuracao = bigquery.QueryJobConfig.from_api_repr({
+        'dryRun': True,
+        'query': {'useQueryCache': False, 'parameterMode': 'NAMED', 'queryParameters': parametros or []}})
+
+    return cliente.query(q, job_config=configuracao).total_bytes_processed or 0
+
+
+### --- 3. Backend DuckDB sobre arquivos parquet --- ###
+
+# Funções de geografia usadas nas consultas. Nos arquivos parquet, as colunas de geografia são
+# guardadas como texto WKT (formato da exportação do Big Query).
+MACROS_DUCKDB = [
+    r"CREATE MACRO ST_X(ponto) AS CAST(regexp_extract(ponto, 'POINT\s*\(\s*(\S+)\s+(\S+?)\s*\)', 1) AS DOUBLE)",
+    r"CREATE MACRO ST_Y(ponto) AS CAST(regexp_extract(ponto, 'POINT\s*\(\s*(\S+)\s+(\S+?)\s*\)', 2) AS DOUBLE)",
+]
+
+
+def split_sql_arguments(texto: str) -> list:
+    """
+    Separa os argumentos de uma expressão SQL pelas vírgulas que não estão entre parênteses.
+
+    Exemplos:
+    >>> split_sql_arguments("data AS data, SUBSTRING(id_veiculo, 2) AS id_veiculo")
+    ['data AS data', 'SUBSTRING(id_veiculo, 2) AS id_veiculo']
+    """
+    argumentos, nivel, inicio = [], 0, 0
+    for posicao, caractere in enumerate(texto):
+        if caractere == '(':
+            nivel += 1
+        elif caractere == ')':
+            nivel -= 1
+        elif caractere == ',' and nivel == 0:
+            argumentos.append(texto[inicio:posicao].strip())
+            inicio = posicao + 1
+    argumentos.append(texto[inicio:].strip())
+
+    return argumentos
+
+
+def translate_to_duckdb(q: str, diretorio_local: str) -> str:
+    """
+    Converte uma consulta do Big Query (nos formatos usados em queries_functions.py e query_builder.py)
+    para o DuckDB: as tabelas são lidas dos arquivos parquet locais, STRUCT(... AS ...) vira struct_pack
+    e os parâmetros @nome em UNNEST viram $nome.
+
+    Exemplos:
+    >>> translate_to_duckdb("SELECT data FROM `rj-smtr.projeto_subsidio_sppo.viagem_completa`", '../data/local')
+    "SELECT data FROM read_parquet('../data/local/rj-smtr/projeto_subsidio_sppo/viagem_completa/**/*.parquet', hive_partitioning = true, union_by_name = true)"
+    """
+    def tabela_local(correspondencia):
+        caminho = '/'.join([diretorio_local.rstrip('/')] + correspondencia.group(1).split('.') + ['**', '*.parquet'])
+        return f"read_parquet('{caminho}', hive_partitioning = true, union_by_name = true)"
+
+    def struct_pack(correspondencia):
+        campos = [re.split(r'\s+AS\s+', argumento, flags=re.IGNORECASE) for argumento in
+                  split_sql_arguments(correspondencia.group(1))]
+        return 'struct_pack(' + ', '.join([f'{nome} := {expressao}' for expressao, nome in campos]) + ')'
+
+    q = re.sub(r'`([^`]+)`', tabela_local, q)
+    q = re.sub(r'STRUCT\(((?:[^()]|\([^()]*\))*)\)', struct_pack, q)
+    q = re.sub(r'IN\s+UNNEST\(@(\w+)\)', r'IN (SELECT UNNEST($\1))', q)
+
+    return q
+
+
+def duckdb_parameter_value(tipo: dict, valor: dict):
+    """
+    Converte o valor de um parâmetro no formato do Big Query (queryParameters) para o valor em Python.
+    """
+    if tipo['type'] == 'ARRAY':
+        return [duckdb_parameter_value(tipo['arrayType'], item) for item in valor['arrayValues']]
+    if tipo['type'] == 'STRUCT':
+        return {campo['name']: duckdb_parameter_value(campo['type'], valor['structValues'][campo['name']])
+                for campo in tipo['structTypes']}
+    if tipo['type'] == 'DATE':
+        return pd.Timestamp(valor['value']).date()
+
+    return valor['value']
+
+
+def run_duckdb_query(q: str, parametros: list = None) -> pd.DataFrame:
+    """
+    Executa a consulta no DuckDB, sobre as tabelas em parquet do diretório local configurado
+    (ver configure_query_backend). O resultado tem as mesmas colunas da consulta no Big Query.
+    """
+    import duckdb
+
+    conexao = duckdb.connect()
+    for macro in MACROS_DUCKDB:
+        conexao.execute(macro)
+
+    valores = {parametro['name']: duckdb_parameter_value(parametro['parameterType'], parametro['parameterValue'])
+               for parametro in parametros or []}
+
+    try:
+        return conexao.execute(translate_to_duckdb(q, CONFIGURACAO_BACKEND['diretorio_local']), valores).df()
+    finally:
+        conexao.close()
+
+
+def estimate_duckdb_bytes(q: str, parametros: list = None) -> int:
+    """
+    As consultas no DuckDB leem arquivos locais e não têm custo: a estimativa é sempre 0.
+    """
+    return 0
+
+
+### --- 4. Executar as consultas no backend configurado --- ###
+
+BACKENDS = {
+    'bigquery': run_bigquery_query,
+    'duckdb': run_duckdb_query,
+}
+
+# Estimativa dos bytes lidos pelas consultas em cada backend, sem executá-las
+ESTIMADORES = {
+    'bigquery': estimate_bigquery_bytes,
+    'duckdb': estimate_duckdb_bytes,
+}
+
+
+def run_query(q: str, parametros: list = None) -> pd.DataFrame:
+    """
+    Executa a consulta no backend configurado.
+
+    Parâmetros:
+    q (str): Texto da consulta, no SQL do Big Query.
+    parametros (list): Parâmetros nomeados da consulta, no formato queryParameters do Big Query.
+
+    Retorna:
+    dataframe: O resultado da consulta.
+
+    Exemplos:
+    >>> run_query(q, parametros)
+    """
+    return BACKENDS[CONFIGURACAO_BACKEND['backend']](q, parametros)
+
+
+def estimate_query_bytes(q: str, parametros: list = None) -> int:
+    """
+    Estima os bytes lidos pela consulta no backend configurado, sem executá-la.
+
+    Parâmetros:
+    q (str): Texto da consulta, no SQL do Big Query.
+    parametros (list): Parâmetros nomeados da consulta, no formato queryParameters do Big Query.
+
+    Retorna:
+    int: Bytes lidos pela consulta.
+
+    Exemplos:
+    >>> estimate_query_bytes(q, parametros)
+    """
+    return ESTIMADORES[CONFIGURACAO_BACKEND['backend']](q, parametros)
@@ -0,0 +1,163 @@
+
+### --- 1. Carregar bibliotecas --- ###
+import re
+import pandas as pd
+from utils import *
+from query_backends import *
+
+
+### --- 1.1 Parâmetros das consultas --- ###
+
+# Quantidade máxima de datas (partições) por consulta. Cada consulta filtra apenas as suas datas,
+# para que o Big Query leia somente as partições necessárias.
+DATAS_POR_CONSULTA = 31
+
+# Tipo, no Big Query, de cada campo das chaves enviadas como parâmetro
+TIPOS_PARAMETROS = {'data': 'DATE', 'id_veiculo': 'STRING', 'servico': 'STRING'}
+
+
+### --- 2. Montar as consultas por chave --- ###
+
+def date_chunks(chaves: pd.DataFrame, datas_por_consulta: int = DATAS_POR_CONSULTA) -> list:
+    """
+    Divide as chaves em grupos de no máximo datas_por_consulta datas, em ordem de data.
+
+    Parâmetros:
+    chaves (dataframe): Chaves da consulta, com a coluna data no formato 'AAAA-MM-DD'.
+    datas_por_consulta (int): Quantidade máxima de datas por grupo.
+
+    Retorna:
+    list: Dataframes com as chaves de cada grupo.
+
+    Exemplos:
+    >>> date_chunks(pares, datas_por_consulta=7)
+    """
+    datas = sorted(chaves['data'].unique())
+
+    return [chaves[chaves['data'].isin(datas[inicio:inicio + datas_por_consulta])]
+            for inicio in range(0, len(datas), datas_por_consulta)]
+
+
+def array_parameter(nome: str, chaves: pd.DataFrame) -> dict:
+    """
+    Monta um parâmetro do Big Query do tipo ARRAY<STRUCT<...>> com as linhas do dataframe, no formato
+    aceito na configuração da consulta (queryParameters).
+
+    Exemplos:
+    >>> array_parameter('chaves', pd.DataFrame({'data': ['2022-11-20'], 'id_veiculo': ['A1']}))['parameterType']['type']
+    'ARRAY'
+    """
+    campos = [{'name': coluna, 'type': {'type': TIPOS_PARAMETROS.get(coluna, 'STRING')}} for coluna in chaves.columns]
+    valores = [{'structValues': {coluna: {'value': str(valor)} for coluna, valor in zip(chaves.columns, linha)}}
+               for linha in chaves.itertuples(index=False, name=None)]
+
+    return {'name': nome,
+            'parameterType': {'type': 'ARRAY', 'arrayType': {'type': 'STRUCT', 'structTypes': campos}},
+            'parameterValue': {'arrayValues': valores}}
+
+
+def date_array_parameter(nome: str, datas) -> dict:
+    """
+    Monta um parâmetro do Big Query do tipo ARRAY<DATE>.
+    """
+    return {'name': nome,
+            'parameterType': {'type': 'ARRAY', 'arrayType': {'type': 'DATE'}},
+            'parameterValue': {'arrayValues': [{'value': str(data)} for data in sorted(set(datas))]}}
+
+
+def build_keyed_query(select_clause: str, tabela: str, chaves: pd.DataFrame, colunas_tabela: dict) -> tuple:
+    """
+    Monta uma consulta que retorna as linhas da tabela cujas chaves estão entre as chaves informadas.
+    As chaves são enviadas como um único parâmetro (@chaves, um array de structs) em vez de uma condição
+    por linha no texto da consulta, e as datas (@datas) filtram as partições lidas. A ordem das colunas
+    em colunas_tabela deve ser a mesma das colunas das chaves.
+
+    Parâmetros:
+    select_clause (str): Colunas retornadas pela consulta.
+    tabela (str): Nome completo da tabela, particionada pela coluna data.
+    chaves (dataframe): Chaves da consulta, uma coluna por campo (a coluna data é obrigatória).
+    colunas_tabela (dict): Expressão SQL, na tabela, correspondente a cada coluna das chaves.
+
+    Retorna:
+    tuple: O texto da consulta e a lista de parâmetros (queryParameters).
+
+    Exemplos:
+    >>> q, parametros = build_keyed_query('data, servico', '`rj-smtr.projeto_subsidio_sppo.viagem_planejada`',
+    ...                                   chaves, {'data': 'data', 'servico': 'servico'})
+    """
+    chave_tabela = ', '.join([f'{expressao} AS {coluna}' for coluna, expressao in colunas_tabela.items()])
+
+    q = f"""
+    SELECT
+      {select_clause}
+    FROM
+      {tabela}
+    WHERE
+      data IN UNNEST(@datas)
+      AND STRUCT({chave_tabela}) IN UNNEST(@chaves)
+    """
+    parametros = [date_array_parameter('datas', chaves['data']),
+                  array_parameter('chaves', chaves[list(colunas_tabela)])]
+
+    return q, parametros
+
+
+def selected_columns(select_clause: str) -> list:
+    """
+    Retorna os nomes das colunas retornadas pela consulta: o apelido (AS) de cada expressão ou, sem
+    apelido, o próprio nome da coluna.
+
+    Exemplos:
+    >>> selected_columns('data, SUBSTRING(id_veiculo, 2) as id_veiculo, t.servico')
+    ['data', 'id_veiculo', 'servico']
+    """
+    return [re.split(r'\s+AS\s+', expressao, flags=re.IGNORECASE)[-1].split('.')[-1].strip()
+            for expressao in split_sql_arguments(select_clause.strip())]
+
+
+### --- 3. Executar as consultas --- ###
+
+def read_keyed_query(select_clause: str, tabela: str, chaves: pd.DataFrame, colunas_tabela: dict,
+                     executar=None) -> pd.DataFrame:
+    """
+    Consulta as linhas da tabela para as chaves informadas, com uma consulta por grupo de datas
+    (ver date_chunks e build_keyed_query).
+
+    Parâmetros:
+    select_clause (str): Colunas retornadas pela consulta.
+    tabela (str): Nome completo da tabela, particionada pela coluna data.
+    chaves (dataframe): Chaves da consulta, com a coluna data no formato 'AAAA-MM-DD'.
+    colunas_tabela (dict): Expressão SQL, na tabela, correspondente a cada coluna das chaves.
+    executar (function): Recebe o texto da consulta e os parâmetros e retorna o resultado. Por padrão
+    (None) executa no backend configurado, com run_query (ver query_backends.py).
+
+    Retorna:
+    dataframe: O resultado das consultas de todos os grupos de datas. Sem chaves, um dataframe vazio
+    com as colunas da consulta.
+
+    Exemplos:
+    >>> read_keyed_query('data, SUBSTRING(id_veiculo, 2) as id_veiculo', '`rj-smtr.projeto_subsidio_sppo.viagem_completa`',
+    ...                  pares, {'data': 'data', 'id_veiculo': 'SUBSTRING(id_veiculo, 2)'})
+    """
+    executar = executar or run_query
+    chaves = chaves.drop_duplicates()
+    resultados = [executar(*build_keyed_query(select_clause, tabela, grupo, colunas_tabela))
+                  for grupo in date_chunks(chaves)]
+
+    if not resultados:
+        return pd.DataFrame(columns=selected_columns(select_clause))
+
+    return pd.concat(resultados, ignore_index=True)
+
+
+def estimate_keyed_query_bytes(select_clause: str, tabela: str, chaves: pd.DataFrame, colunas_tabela: dict) -> int:
+    """
+    Estima, sem executar, os bytes lidos pelas consultas de read_keyed_query com os mesmos argumentos
+    (uma consulta por grupo de datas, ver estimate_query_bytes).
+
+    Exemplos:
+    >>> estimate_keyed_query_bytes('data, servico', '`rj-smtr.projeto_subsidio_sppo.viagem_planejada`',
+    ...                            chaves, {'data': 'data', 'servico': 'servico'})
+    """
+    return sum(estimate_query_bytes(*build_keyed_query(select_clause, tabela, grupo, colunas_tabela))
+               for grupo in date_chunks(chaves.drop_duplicates()))
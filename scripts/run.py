@@ -1,3 +1,82 @@
-from flows import flow
+import argparse
+from classify import classify
 
-flow.run()
\ No newline at end of file
+### --- 1. Flags ---###
+parser = argparse.ArgumentParser(description="Execute o script run.py com opções.")
+
+# As consultas ao big query ficam guardadas em data/cache/consultas e são reutilizadas sempre que os
+# parâmetros da consulta (datas, veículos, janelas) forem os mesmos
+parser.add_argument('--refresh-cache', action='store_true',
+                    help="Ignora as consultas guardadas no cache e consulta novamente o Big Query.")
+parser.add_argument('--cache-quota-gb', type=float, default=None,
+                    help="Espaço máximo em disco, em GB, ocupado pelas consultas guardadas no cache (padrão: 5).")
+# mantida por compatibilidade: o cache agora é sempre usado quando os parâmetros da consulta são os mesmos
+parser.add_argument('--cache', action='store_true', help=argparse.SUPPRESS)
+# As consultas podem ser feitas em tabelas locais em parquet, com o DuckDB, para rodar o algoritmo sem
+# acesso ao Big Query (por exemplo, para testes de carga ou reprocessar lotes antigos)
+parser.add_argument('--backend', choices=['bigquery', 'duckdb'], default='bigquery',
+                    help="Backend das consultas: bigquery (padrão) ou duckdb (tabelas em parquet locais).")
+parser.add_argument('--local-data-dir', default=None,
+                    help="Diretório das tabelas em parquet usadas pelo backend duckdb (padrão: data/local).")
+# As consultas independentes entre si (viagens completas, conformidade e viagens planejadas) são iniciadas
+# logo após o tratamento da amostra e rodam ao mesmo tempo
+parser.add_argument('--max-concurrent-queries', type=int, default=None,
+                    help="Quantidade máxima de consultas executadas ao mesmo tempo (padrão: 4).")
+# A amostra é dividida em partições por data, classificadas ao mesmo tempo (ver flows.py)
+parser.add_argument('--partitions', type=int, default=None,
+                    help="Quantidade máxima de partições da amostra, por data, classificadas ao mesmo tempo "
+                         "(padrão: quantidade de núcleos do processador).")
+# As tabelas intermediárias de cada etapa são gravadas em data/treated apenas para depuração, em segundo plano
+parser.add_argument('--debug-artifacts', action='store_true',
+                    help="Grava as tabelas intermediárias de cada etapa em data/treated.")
+parser.add_argument('--debug-artifacts-format', choices=['parquet', 'csv', 'xlsx'], default=None,
+                    help="Formato das tabelas intermediárias (padrão: parquet).")
+# No modo não interativo, a execução não pergunta ao usuário: a consulta dos dados de GPS é liberada por um
+# orçamento de GB lidos, estimado antes da consulta, e o reprocessamento executa o DBT por um comando
+# e/ou aguarda um arquivo de sinal (ver unattended_mode.py)
+parser.add_argument('--unattended', action='store_true',
+                    help="Executa sem perguntas ao usuário, para execuções agendadas ou em lotes.")
+parser.add_argument('--scan-budget-gb', type=float, default=None,
+                    help="GB lidos liberados para as consultas no modo não interativo (padrão: 10).")
+parser.add_argument('--reprocess-command', default=None,
+                    help="Comando que executa o modelo reprocessado no DBT, no modo não interativo.")
+parser.add_argument('--reprocess-signal-file', default=None,
+                    help="Arquivo criado ou atualizado quando o reprocessamento termina, no modo não interativo.")
+# A saída das etapas de classificação fica guardada em data/cache/etapas: uma execução repetida (por exemplo,
+# após uma falha na geração dos mapas) retoma a partir da primeira etapa cujas entradas mudaram
+parser.add_argument('--refresh-stages', action='store_true',
+                    help="Executa novamente todas as etapas, ignorando as saídas guardadas.")
+parser.add_argument('--no-stage-checkpoints', action='store_true',
+                    help="Não lê nem grava as saídas das etapas.")
+args = parser.parse_args()
+
+if args.partitions is not None and args.partitions < 1:
+    parser.error('A quantidade de partições deve ser maior ou igual a 1.')
+if args.scan_budget_gb is not None and args.scan_budget_gb < 0:
+    parser.error('O orçamento de GB lidos deve ser maior ou igual a 0.')
+
+# As flags não informadas (None) usam o valor padrão da classificação (ver CONFIGURACAO_PADRAO em classify.py)
+configuracao = {
+    'backend': args.backend,
+    'diretorio_local': args.local_data_dir,
+    'cota_cache_gb': args.cache_quota_gb,
+    'atualizar_cache': args.refresh_cache,
+    'max_consultas_simultaneas': args.max_concurrent_queries,
+    'particoes': args.partitions,
+    'tabelas_intermediarias': args.debug_artifacts,
+    'formato_tabelas_intermediarias': args.debug_artifacts_format,
+    'nao_interativo': args.unattended,
+    'orcamento_gb': args.scan_budget_gb,
+    'reprocessamento': args.reprocess_command,
+    'arquivo_sinal_reprocessamento': args.reprocess_signal_file,
+    'checkpoints_etapas': not args.no_stage_checkpoints,
+    'atualizar_etapas': args.refresh_stages,
+}
+configuracao = {opcao: valor for opcao, valor in configuracao.items() if valor is not None}
+
+### --- 2. Importar a amostra de data/raw e classificar --- ###
+from utils import configure_log_file
+from import_files import import_sample
+
+configure_log_file()
+classify(import_sample(), configuracao)
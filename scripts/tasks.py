@@ -1,11 +1,9 @@
-### --- 1. Configurar bibliotecas, diretórios, flags e arquivo de log --- ###
+### --- 1. Configurar bibliotecas e diretórios --- ###
 modelo_versao = 'v0.1'
 
 ### --- 1.1 Bibliotecas ---###
-import argparse
 import os
 import pandas as pd
-import plotly.graph_objects as go
 import sys
 from pathlib import Path 
 from prefect import task
@@ -23,48 +21,68 @@ paths["queries"] = current_path / 'scripts' / 'queries'
 paths["data_processing"] = current_path / 'scripts' / 'data_processing'
 paths["dataviz"] = current_path / 'scripts' / 'dataviz'
 
-for path in paths.values():
-    if not os.path.exists(path):
-        os.makedirs(path)      
+
+def create_directories():
+    # Cria os diretórios de dados que ainda não existem (chamada no início da classificação, ver classify.py)
+    for path in paths.values():
+        if not os.path.exists(path):
+            os.makedirs(path)      
         
 directories = [paths["scripts"], paths["queries"], paths["data_processing"], paths["dataviz"]]
 
 for directory in directories:
-    if directory not in sys.path:
+    if str(directory) not in sys.path:
         sys.path.append(str(directory))
 
-from set_credentials import *
-from graphs import *
+# As credenciais do Big Query (set_credentials.py) e as bibliotecas dos mapas (graphs.py) são
+# importadas apenas quando usadas (ver classify.py e create_html_maps)
 from categorize_trips import *
 from queries_functions import *
 from treat_data import *
-from graphs import *
-from automate_map import *
-from import_files import *
+from cache_files import *
 from reprocess_trips import *
 from circular_trips import *
 from gps_data import *
+from fetch_scheduler import *
+from debug_artifacts import *
+from stage_checkpoints import *
+from run_metrics import *
 from utils import *
 
 
-### --- 1.3 Flags ---###
-parser = argparse.ArgumentParser(description="Execute o script run.py com opções.")
+### --- 2. Amostra --- ###
+
+# As etapas de classificação (2 a 7) guardam a sua saída (ver stage_checkpoints.py): uma execução repetida
+# com a mesma amostra e a mesma versão do modelo retoma a partir da primeira etapa cujas entradas mudaram.
+# A divisão e a junção das partições são rápidas e não são guardadas, e as etapas 8 e 9, que gravam os
+# mapas e a tabela final, são sempre executadas.
+# Todas as etapas registram o tempo, a memória e as linhas de cada chamada (ver run_metrics.py).
 
-# permite usar o cache para não baixar novamente os dados da última consulta no big query
-parser.add_argument('--cache', action='store_true', help="Ative o cache para evitar baixar novamente os dados.")
-args = parser.parse_args()
-cache = "on" if args.cache else "off"
+def start_sample_fetches(amostra_tratada, *args):
+    # Os sinais de GPS da execução anterior são removidos (ver gps_store.py)
+    clear_gps_store()
 
-log_info('Dependências carregadas com sucesso.')
+    ### --- 2.4 Iniciar as consultas que dependem apenas da amostra --- ###
+    # As etapas seguintes reaproveitam os dados dessas consultas (ou esperam por eles, caso ainda
+    # estejam em andamento)
+    pares_amostra = vehicle_day_pairs(amostra_tratada[amostra_tratada['status'].isna()], 'id_veiculo')
+    servicos_amostra = service_day_pairs(amostra_tratada, 'servico')
+
+    schedule_fetch('viagem_completa', fetch_viagem_completa, pares_amostra)
+    schedule_fetch('viagem_conformidade', fetch_viagem_conformidade, pares_amostra)
+    schedule_fetch('tipo_servico', fetch_service_types, servicos_amostra)
+    schedule_fetch('dados_gps_shape', fetch_shapes, servicos_amostra)
 
-### --- 2. Amostra --- ###
 @task
-def run_sample():
-    # Esta etapa importa, faz o tratamento e remove viagens inconsistentes dos recursos recebidos.
+@measured()
+@checkpointed_stage('run_sample', modelo_versao, restaurar=start_sample_fetches)
+def run_sample(amostra):
+    # Esta etapa faz o tratamento e remove viagens inconsistentes dos recursos recebidos (importados
+    # por import_sample ou informados em classify).
     log_info('Iniciando execução do Algoritmo de Classificação de Recursos (ACRe) versão: ' + modelo_versao)
 
-    ### --- 2.1 Importar amostra --- ###
-    amostra = import_sample()    
+    ### --- 2.1 Copiar amostra --- ###
+    amostra = amostra.copy()
 
     ### --- 2.2 Tratar amostra --- ###
     # Tratar amostra
@@ -72,26 +90,36 @@ def run_sample():
 
     ### --- 2.3 Classificar dados inválidos / duplicados da amostra --- ###
     amostra_tratada = remove_overlapping_trips(amostra)
+
+    # Remover os sinais de GPS da execução anterior e iniciar as consultas (também quando a saída desta
+    # etapa é lida do checkpoint)
+    start_sample_fetches(amostra_tratada)
     
     return amostra_tratada
 
+@task
+@measured()
+def partition_sample(amostra_tratada, particoes_amostra):
+    # As viagens de datas diferentes são classificadas de forma independente: as etapas 3 a 8 rodam uma
+    # vez para cada partição da amostra, ao mesmo tempo (ver flows.py)
+    particoes = split_by_date(amostra_tratada, particoes_amostra)
+    log_info(f'Amostra dividida em {len(particoes)} partição(ões) por data.')
+
+    return particoes
+
 ### --- 3. VIAGENS COMPLETAS --- ###
 
 # Compara os recursos com a tabela de viagem_completa.
 @task
+@measured()
+@checkpointed_stage('run_complete_trips', modelo_versao)
 def run_complete_trips(amostra_tratada):
     ### --- 3.1 Acessar dados das viagens completas --- ###
-    if args.cache:
-        viagem_completa = pd.read_csv('../data/cache/viagem_completa.csv')   
-        
-    else:
-        # Datas e veículos presentes na amostra
-        id_veiculo_query = query_values(amostra_tratada, 'id_veiculo')
-        data_query = query_values(amostra_tratada, 'data')
-        
-        viagem_completa = query_viagem_completa(data_query, id_veiculo_query, reprocessed=False)
-        
-        viagem_completa.to_csv('../data/cache/viagem_completa.csv', index = False)
+    # Pares (data, veículo) das viagens da amostra ainda sem status (as viagens duplicadas já foram
+    # classificadas). Apenas os pares ainda não guardados localmente são consultados
+    pares_amostra = vehicle_day_pairs(amostra_tratada[amostra_tratada['status'].isna()], 'id_veiculo')
+    
+    viagem_completa = fetch_viagem_completa(pares_amostra)
 
     log_info('Acesso aos dados de viagens completas concluído com sucesso.')
 
@@ -104,7 +132,7 @@ def run_complete_trips(amostra_tratada):
     viagem_completa_classificada = check_trips(amostra_tratada, viagem_completa,
                                         "Viagem identificada e já paga")
 
-    viagem_completa_classificada.to_excel('../data/treated/viagem_completa_classificada.xlsx', index = False)
+    write_debug_artifact('viagem_completa_classificada', viagem_completa_classificada)
 
     log_info('Classificação das viagens completas concluída com sucesso.')
 
@@ -114,33 +142,34 @@ def run_complete_trips(amostra_tratada):
 
 ### --- 4. REPROCESSAMENTO ---###
 @task
-def run_reprocessed_trips(viagem_completa_classificada):
-    
+@measured()
+@checkpointed_stage('run_reprocessed_trips', modelo_versao)
+def run_reprocessed_trips(particoes_classificadas):
+    # O reprocessamento (arquivo reprocessar.csv, execução do modelo no DBT e consulta das viagens
+    # reprocessadas) é feito uma única vez para todas as partições, que são divididas novamente em seguida
+    viagem_completa_classificada = pd.concat(particoes_classificadas, ignore_index=True)
+
     viagem_completa_reprocessada = reprocess_trips(viagem_completa_classificada)
     
-    return viagem_completa_reprocessada
+    return split_like(viagem_completa_reprocessada, particoes_classificadas)
 
 
 
 ### --- 5. VIAGENS CONFORMIDADE --- ###
 @task
+@measured()
+@checkpointed_stage('run_conformity_trips', modelo_versao)
 def run_conformity_trips(viagem_completa_reprocessada):
 
     # Compara os recursos com a tabela de viagem_conformidade.
 
     ### --- 5.1 Acessar dados das viagens conformidade --- ###
 
-    # Acessar os dados
-    if args.cache:
-        viagem_conformidade = pd.read_csv('../data/cache/viagem_conformidade.csv')  
-    else:
-        # Verificar os dias e veiculos ainda não classificados
-        linhas_nan = viagem_completa_reprocessada[pd.isna(viagem_completa_reprocessada['status'])]
-        data_query = query_values(linhas_nan, 'data')
-        id_veiculo_query = query_values(linhas_nan, 'id_veiculo_amostra')
-        
-        viagem_conformidade = query_viagem_conformidade(data_query, id_veiculo_query, reprocessed=False)
-        viagem_conformidade.to_csv('../data/cache/viagem_conformidade.csv', index = False)
+    # Verificar os dias e veiculos ainda não classificados
+    linhas_nan = viagem_completa_reprocessada[pd.isna(viagem_completa_reprocessada['status'])]
+    pares_nan = vehicle_day_pairs(linhas_nan)
+    
+    viagem_conformidade = fetch_viagem_conformidade(pares_nan)
 
     ### --- 5.2 Tratar dados das viagens conformidade --- ###
     viagem_conformidade = treat_trips(viagem_conformidade)
@@ -152,7 +181,7 @@ def run_conformity_trips(viagem_completa_reprocessada):
     viagens_conformidade_classificadas = check_trips(viagem_completa_reprocessada, viagem_conformidade,
                                         "Viagem indeferida - Não atingiu % de GPS ou trajeto correto")
 
-    viagens_conformidade_classificadas.to_excel('../data/treated/viagem_conformidade_classificada.xlsx', index = False)
+    write_debug_artifact('viagem_conformidade_classificada', viagens_conformidade_classificadas)
 
     log_info('Classificação das viagens conformidade concluída com sucesso.')
     print(viagens_conformidade_classificadas)
@@ -162,28 +191,20 @@ def run_conformity_trips(viagem_completa_reprocessada):
 
 ### --- 6. VIAGENS CIRCULARES --- ### 
 @task
-def run_circular_trips(viagens_conformidade_classificadas, amostra_tratada):
+@measured()
+@checkpointed_stage('run_circular_trips', modelo_versao)
+def run_circular_trips(viagens_conformidade_classificadas):
     # Esta etapa verifica se a viagem do recurso é, na verdade, uma meia viagem pertencente
     # a uma viagem circular. Em seguida, esta meia viagem recebe um status, igual ao da outra meia
     # viagem que, junto com ela, forma uma viagem completa.
 
-    if args.cache:
-        viagem_completa = pd.read_csv('../data/cache/viagem_completa.csv')   
-        
-    else:
-        # Datas e veículos presentes na amostra
-        id_veiculo_query = query_values(amostra_tratada, 'id_veiculo')
-        data_query = query_values(amostra_tratada, 'data')
-        
-        viagem_completa = query_viagem_completa(data_query, id_veiculo_query, reprocessed=False)
-        
+    # Pares (data, veículo) das viagens ainda sem status. As viagens completas e conformidade desses
+    # pares já foram carregadas nas etapas 3 e 5 e são reaproveitadas, sem nova consulta
+    linhas_nan = viagens_conformidade_classificadas[viagens_conformidade_classificadas['status'].isna()]
+    pares_nan = vehicle_day_pairs(linhas_nan)
     
-    if args.cache:
-        viagem_conformidade = pd.read_csv('../data/cache/viagem_conformidade.csv')  
-    else:
-        id_veiculo_query = query_values(amostra_tratada, 'id_veiculo')
-        data_query = query_values(amostra_tratada, 'data')
-        viagem_conformidade = query_viagem_conformidade(data_query, id_veiculo_query, reprocessed=False)
+    viagem_completa = fetch_viagem_completa(pares_nan)
+    viagem_conformidade = fetch_viagem_conformidade(pares_nan)
    
     
     viagens_circulares_classificadas = circular_trips(viagens_conformidade_classificadas, 
@@ -193,7 +214,25 @@ def run_circular_trips(viagens_conformidade_classificadas, amostra_tratada):
 
 
 ### --- 7. SINAIS DE GPS --- ###
+
 @task
+@measured()
+def run_gps_query(particoes_circulares_classificadas):
+    # A consulta dos sinais de GPS que faltam no cache é confirmada e feita uma única vez para todas as
+    # partições. As etapas de GPS de cada partição leem os sinais guardados, sem nova pergunta.
+    viagens_circulares_classificadas = pd.concat(particoes_circulares_classificadas, ignore_index=True)
+
+    if not prefetch_trip_gps(viagens_circulares_classificadas):
+        stop_refused_gps_query()
+
+def restore_gps_store(viagens_gps_classificadas, viagens_circulares_classificadas):
+    # Os sinais de GPS usados nos mapas (etapa 8) não fazem parte da saída da etapa e são guardados
+    # novamente quando ela é lida do checkpoint (sem nova consulta, caso já estejam no cache)
+    load_trip_gps(viagens_circulares_classificadas)
+
+@task
+@measured()
+@checkpointed_stage('run_gps_data', modelo_versao, restaurar=restore_gps_store)
 def run_gps_data(viagens_circulares_classificadas):
     
     # Esta etapa busca os sinais de GPS para as viagens que ainda não foram classificadas nas etapas anteriores.
@@ -209,6 +248,7 @@ def run_gps_data(viagens_circulares_classificadas):
 
 ### --- 8. Criar mapas em HTML  --- ###
 @task
+@measured()
 def create_html_maps(viagens_gps_classificadas):
     # Esta etapa cria mapas em HTML para as viagens que tiveram sinais de GPS encontrados, mas não foram
     # classificadas nas etapas anteriores.
@@ -220,12 +260,20 @@ def create_html_maps(viagens_gps_classificadas):
         "Pós-reprocessamento: Sinal de GPS encontrado para o veículo operando no mesmo serviço da amostra"
     ]
 
-    # Chamar a função com a lista de status
+    # Chamar a função com a lista de status (as bibliotecas dos mapas são importadas apenas nesta etapa)
+    from automate_map import automate_map
     automate_map(viagens_gps_classificadas, status_desejados)
 
 
 ### --- 9. Ajustes finais  --- ###
 @task
+@measured()
+def merge_partitions(particoes_classificadas):
+    # Junta as partições da amostra classificadas nas etapas 3 a 8
+    return pd.concat(particoes_classificadas, ignore_index=True)
+
+@task
+@measured()
 def final_adjusts(viagens_gps_classificadas, amostra):
 
     ### --- 9.1 Alterações na tabela final --- ###
@@ -246,9 +294,14 @@ def final_adjusts(viagens_gps_classificadas, amostra):
 
     ### --- 9.3 Gerar um resumo das viagens processadas pelo algoritmo --- ###  
     generate_report(viagens_gps_classificadas, amostra)
+
+    ### --- 9.4 Esperar a gravação das tabelas intermediárias --- ###
+    wait_debug_artifacts()
         
     log_info('Execução do algoritmo finalizada com sucesso.')
 
+    return viagens_gps_classificadas
+
 
 
 
@@ -0,0 +1,12 @@
+### --- Configuração dos testes --- ###
+
+# Os módulos do projeto importam uns aos outros pelo nome (ver run.py), a partir das pastas de scripts
+import os
+import sys
+
+DIRETORIO_SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+
+for pasta in ['', 'data_processing', 'queries', 'dataviz']:
+    caminho = os.path.join(DIRETORIO_SCRIPTS, pasta)
+    if caminho not in sys.path:
+        sys.path.insert(0, caminho)
@@ -0,0 +1,27 @@
+### --- Testes da separação dos dados guardados por origem --- ###
+
+from query_backends import CONFIGURACAO_BACKEND, backend_identifier
+from slice_store import slice_directory
+from stage_checkpoints import stage_key
+
+
+def test_local_directories_are_kept_apart(tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'backend', 'duckdb')
+
+    chaves = []
+    for diretorio in [tmp_path / 'lote_1', tmp_path / 'lote_2']:
+        monkeypatch.setitem(CONFIGURACAO_BACKEND, 'diretorio_local', str(diretorio))
+        chaves.append((backend_identifier(), slice_directory('dados_gps'), stage_key('run_gps_data', 'v0.1', {})))
+
+    assert all(chaves[0][posicao] != chaves[1][posicao] for posicao in range(3))
+
+    # Caminhos diferentes para o mesmo diretório têm a mesma origem
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'diretorio_local', str(tmp_path / 'lote_1' / '..' / 'lote_1'))
+    assert backend_identifier() == chaves[0][0]
+
+
+def test_bigquery_keeps_production_paths(monkeypatch):
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'backend', 'bigquery')
+
+    assert backend_identifier() is None
+    assert slice_directory('dados_gps').replace('\\', '/') == '../data/cache/fatias/dados_gps'
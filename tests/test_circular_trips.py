@@ -0,0 +1,68 @@
+### --- Testes da classificação das meias viagens circulares --- ###
+
+import pandas as pd
+import pytest
+import circular_trips as modulo_circular
+from treat_data import split_by_date
+
+# Serviços planejados por data: o serviço 302 tem shape circular dividido em ida e volta em 20/11 e não
+# é planejado em 21/11
+TIPO_SERVICO = pd.DataFrame({
+    'data': ['2022-11-20', '2022-11-20', '2022-11-21'],
+    'servico': ['302', '100', '100'],
+    'sentido': ['C', 'I', 'I'],
+    'sentido_shape': ['I', 'I', 'I'],
+})
+
+
+@pytest.fixture
+def servicos_planejados(monkeypatch):
+    def consultar(pares):
+        chaves = pares['data'].astype(str) + '|' + pares['servico'].astype(str)
+        return TIPO_SERVICO[(TIPO_SERVICO['data'] + '|' + TIPO_SERVICO['servico']).isin(chaves)].copy()
+
+    monkeypatch.setattr(modulo_circular, 'fetch_service_types', consultar)
+
+
+def sample() -> pd.DataFrame:
+    partida = pd.to_datetime(['2022-11-20 08:00', '2022-11-20 09:00', '2022-11-21 08:00', '2022-11-21 09:00'])
+    return pd.DataFrame({
+        'protocolo': ['P1', 'P2', 'P3', 'P4'],
+        'data': pd.to_datetime(['2022-11-20', '2022-11-20', '2022-11-21', '2022-11-21']),
+        'id_veiculo_amostra': ['10001', '10002', '10001', '10002'],
+        'servico_amostra': ['302', '100', '302', '100'],
+        'datetime_partida_amostra': partida,
+        'datetime_chegada_amostra': partida + pd.Timedelta(minutes=40),
+        'status': [None, None, None, 'Viagem identificada e já paga'],
+        'data_apurado': None, 'id_veiculo_apurado': None, 'servico_apurado': None, 'sentido_apurado': None,
+        'datetime_partida_apurado': None, 'datetime_chegada_apurado': None,
+    })
+
+
+def circular_trip_table() -> pd.DataFrame:
+    # Viagem circular completa que contém a meia viagem P1
+    return pd.DataFrame({
+        'data': ['2022-11-20'], 'id_veiculo': ['10001'], 'servico_informado': ['302'], 'sentido': ['C'],
+        'datetime_partida': pd.to_datetime(['2022-11-20 07:50']),
+        'datetime_chegada': pd.to_datetime(['2022-11-20 09:30']),
+    })
+
+
+def classify_partitions(amostra: pd.DataFrame, particoes: int) -> pd.DataFrame:
+    classificadas = [modulo_circular.circular_trips(particao.copy(), circular_trip_table(),
+                                                    circular_trip_table().iloc[:0])
+                     for particao in split_by_date(amostra, particoes)]
+
+    return pd.concat(classificadas, ignore_index=True).sort_values('protocolo').reset_index(drop=True)
+
+
+def test_result_does_not_depend_on_partitions(servicos_planejados):
+    amostra = sample()
+
+    uma_particao = classify_partitions(amostra, 1)
+    duas_particoes = classify_partitions(amostra, 2)
+
+    pd.testing.assert_frame_equal(uma_particao, duas_particoes)
+    # A data sem viagens circulares também recebe o status de serviço não planejado
+    assert uma_particao['status'].tolist() == ['Viagem identificada e já paga', None,
+                                               'Serviço não planejado para o dia', 'Viagem identificada e já paga']
@@ -0,0 +1,73 @@
+### --- Testes da configuração da classificação --- ###
+
+import threading
+import pandas as pd
+import pytest
+from classify import CONFIGURACAO_PADRAO, apply_configuration, classification_config, classify
+from cache_files import CONFIGURACAO_CACHE
+from query_backends import CONFIGURACAO_BACKEND
+from fetch_scheduler import CONFIGURACAO_BUSCAS, schedule_fetch
+from debug_artifacts import CONFIGURACAO_DEPURACAO
+from unattended_mode import CONFIGURACAO_NAO_INTERATIVO
+from slice_store import REGISTRO_DADOS, registered_dataset
+
+
+def test_unknown_option_is_rejected():
+    with pytest.raises(ValueError, match='orcamento'):
+        classification_config({'orcamento': 1})
+
+
+def test_each_classification_starts_from_the_defaults():
+    configuracao = {'diretorio_log': None, 'backend': 'duckdb', 'diretorio_local': '/tmp/tabelas', 'cota_cache_gb': 1,
+                    'max_consultas_simultaneas': 2, 'formato_tabelas_intermediarias': 'csv', 'nao_interativo': True,
+                    'orcamento_gb': 1, 'reprocessamento': 'dbt run', 'arquivo_sinal_reprocessamento': 'fim.txt'}
+    apply_configuration(classification_config(configuracao))
+
+    registered_dataset('tipo_servico', pd.DataFrame({'data': ['2022-11-20'], 'servico': ['100']}),
+                       lambda faltantes: faltantes.assign(sentido='I'))
+    assert 'tipo_servico' in REGISTRO_DADOS
+
+    # Uma segunda classificação, sem as mesmas opções, volta aos valores padrão e não vê os dados carregados
+    apply_configuration(classification_config({'diretorio_log': None}))
+
+    assert CONFIGURACAO_BACKEND == {'backend': CONFIGURACAO_PADRAO['backend'],
+                                    'diretorio_local': CONFIGURACAO_PADRAO['diretorio_local']}
+    assert CONFIGURACAO_CACHE['cota_bytes'] == CONFIGURACAO_PADRAO['cota_cache_gb'] * 1024 ** 3
+    assert CONFIGURACAO_BUSCAS['max_concorrencia'] == CONFIGURACAO_PADRAO['max_consultas_simultaneas']
+    assert CONFIGURACAO_DEPURACAO['formato'] == CONFIGURACAO_PADRAO['formato_tabelas_intermediarias']
+    assert not CONFIGURACAO_NAO_INTERATIVO['ativo']
+    assert CONFIGURACAO_NAO_INTERATIVO['orcamento_gb'] == CONFIGURACAO_PADRAO['orcamento_gb']
+    assert CONFIGURACAO_NAO_INTERATIVO['reprocessamento'] is None
+    assert CONFIGURACAO_NAO_INTERATIVO['arquivo_sinal'] is None
+    assert REGISTRO_DADOS == {}
+
+
+def test_failed_classification_releases_loaded_data(tmp_path, monkeypatch):
+    import flows
+
+    scripts = tmp_path / 'scripts'
+    scripts.mkdir()
+    monkeypatch.chdir(scripts)
+    liberar = threading.Event()
+    buscas = []
+
+    def buscar(pares):
+        # A busca antecipada ainda está em andamento quando a execução falha
+        liberar.wait(timeout=10)
+        return registered_dataset('tipo_servico', pares, lambda faltantes: faltantes.assign(sentido='I'))
+
+    def executar(*args, **kwargs):
+        buscas.append(schedule_fetch('tipo_servico', buscar, pd.DataFrame({'data': ['2022-11-20'],
+                                                                             'servico': ['100']})))
+        threading.Timer(0.2, liberar.set).start()
+        raise RuntimeError('falha na etapa')
+
+    monkeypatch.setattr(flows.flow, 'run', executar)
+
+    with pytest.raises(RuntimeError, match='falha na etapa'):
+        classify(pd.DataFrame(), {'backend': 'duckdb', 'diretorio_log': None, 'diretorio_metricas': None,
+                                  'particoes': 1, 'checkpoints_etapas': False})
+
+    # A classificação espera a busca terminar antes de remover os dados carregados
+    assert buscas[0].done()
+    assert REGISTRO_DADOS == {}
@@ -0,0 +1,55 @@
+### --- Testes da gravação das tabelas intermediárias --- ###
+
+import logging
+import queue
+import threading
+import pandas as pd
+import pytest
+import debug_artifacts
+from debug_artifacts import (CONFIGURACAO_DEPURACAO, ESCRITOR_DEPURACAO, ESCRITORES_DEPURACAO,
+                             wait_debug_artifacts, write_debug_artifact)
+
+
+@pytest.fixture
+def depuracao(tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIGURACAO_DEPURACAO, 'ativo', True)
+    monkeypatch.setitem(CONFIGURACAO_DEPURACAO, 'formato', 'csv')
+    monkeypatch.setitem(CONFIGURACAO_DEPURACAO, 'diretorio', str(tmp_path))
+    return tmp_path
+
+
+def test_writer_keeps_running_after_a_failure(depuracao, monkeypatch, caplog):
+    escrever_csv = ESCRITORES_DEPURACAO['csv']
+
+    def escrever(dados, caminho):
+        if 'falha' in caminho:
+            raise OSError('disco cheio')
+        escrever_csv(dados, caminho)
+
+    monkeypatch.setitem(ESCRITORES_DEPURACAO, 'csv', escrever)
+
+    with caplog.at_level(logging.WARNING):
+        write_debug_artifact('falha', pd.DataFrame({'a': [1]}))
+        write_debug_artifact('viagens', pd.DataFrame({'a': [1, 2]}))
+        wait_debug_artifacts()
+
+    assert 'Não foi possível gravar a tabela intermediária falha (disco cheio)' in caplog.text
+    assert ESCRITOR_DEPURACAO['thread'].is_alive()
+    assert len(pd.read_csv(depuracao / 'viagens.csv')) == 2
+
+
+def test_wait_returns_when_writer_stopped(monkeypatch):
+    parada = threading.Thread(target=lambda: None)
+    parada.start()
+    parada.join()
+    monkeypatch.setitem(ESCRITOR_DEPURACAO, 'thread', parada)
+
+    # Uma tabela enviada que a thread parada não vai gravar. A fila é própria do teste: a thread de
+    # gravação criada no teste anterior continua esperando na fila do módulo e consumiria a tabela
+    fila = queue.Queue()
+    fila.put(('viagens', 'csv', pd.DataFrame()))
+    monkeypatch.setattr(debug_artifacts, 'FILA_DEPURACAO', fila)
+
+    wait_debug_artifacts()
+
+    assert fila.unfinished_tasks == 1
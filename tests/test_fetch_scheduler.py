@@ -0,0 +1,56 @@
+### --- Testes das buscas antecipadas --- ###
+
+import logging
+import threading
+import time
+import prefect
+from fetch_scheduler import schedule_fetch
+from utils import log_info
+
+
+def test_fetch_runs_in_worker_thread_with_context(caplog):
+    def buscar(pares):
+        log_info(f'Buscando {len(pares)} pares.')
+        return threading.current_thread().name, prefect.context.get('map_index'), len(pares)
+
+    with caplog.at_level(logging.INFO), prefect.context(map_index=2):
+        busca = schedule_fetch('viagem_completa', buscar, [1, 2, 3])
+        thread, particao, linhas = busca.result(timeout=10)
+
+    assert thread.startswith('busca')
+    assert (particao, linhas) == (2, 3)
+    assert 'Buscando 3 pares.' in caplog.text
+
+
+def test_failed_fetch_is_logged(caplog):
+    def buscar():
+        raise ValueError('sem conexão')
+
+    with caplog.at_level(logging.INFO):
+        busca = schedule_fetch('dados_gps', buscar)
+        assert isinstance(busca.exception(timeout=10), ValueError)
+
+        # O registro da falha é feito logo depois do fim da busca, na thread da busca
+        limite = time.time() + 10
+        while 'falhou' not in caplog.text and time.time() < limite:
+            time.sleep(0.05)
+
+    assert 'A busca antecipada de dados_gps falhou (sem conexão)' in caplog.text
+
+
+def test_log_info_outside_prefect_threads(caplog):
+    erros = []
+
+    def registrar():
+        try:
+            log_info('Mensagem de uma thread sem o contexto do Prefect.')
+        except Exception as erro:
+            erros.append(erro)
+
+    with caplog.at_level(logging.INFO):
+        thread = threading.Thread(target=registrar)
+        thread.start()
+        thread.join()
+
+    assert not erros
+    assert 'Mensagem de uma thread sem o contexto do Prefect.' in caplog.text
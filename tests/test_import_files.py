@@ -0,0 +1,35 @@
+### --- Testes da importação da amostra --- ###
+
+import pandas as pd
+import pytest
+from import_files import import_sample, parse_sample_dates
+
+CABECALHO = 'data;hora_inicio;hora_fim;servico;sentido;id_veiculo;flag_reprocessamento;protocolo\n'
+
+
+def test_semicolon_csv_from_excel_uses_day_first(tmp_path):
+    # Exportação do Excel em português: ponto e vírgula, DD/MM/AAAA e cp1252
+    linhas = ['10/11/2022;08:00:00;09:00:00;022;Ida;12345;0;São Cristóvão 1\n',
+              '13/11/2022;10:00:00;11:00:00;302;Volta;12346;;SMTR2\n']
+    (tmp_path / 'amostra.csv').write_bytes((CABECALHO + ''.join(linhas)).encode('cp1252'))
+
+    amostra = import_sample(str(tmp_path))
+
+    assert amostra['data'].dt.strftime('%Y-%m-%d').tolist() == ['2022-11-10', '2022-11-13']
+    assert amostra['protocolo'].tolist() == ['São Cristóvão 1', 'SMTR2']
+    assert amostra['servico'].tolist() == ['022', '302']
+    assert str(amostra['flag_reprocessamento'].dtype) == 'Int64'
+
+
+def test_iso_and_existing_dates_are_kept():
+    datas = parse_sample_dates(pd.Series(['2022-10-10', '2022-11-13 00:00:00', None, '',
+                                          pd.Timestamp('2022-12-01')], dtype=object))
+
+    assert datas.dt.strftime('%Y-%m-%d').tolist()[:2] == ['2022-10-10', '2022-11-13']
+    assert datas.iloc[2:4].isna().all()
+    assert datas.iloc[4] == pd.Timestamp('2022-12-01')
+
+
+def test_unrecognized_dates_raise():
+    with pytest.raises(ValueError, match='11-13-2022'):
+        parse_sample_dates(pd.Series(['10/11/2022', '11-13-2022', '31/02/2022']))
@@ -0,0 +1,89 @@
+### --- Testes das consultas por chave --- ###
+
+import numpy as np
+import pandas as pd
+import pytest
+from query_backends import CONFIGURACAO_BACKEND, run_duckdb_query
+from query_builder import DATAS_POR_CONSULTA, build_keyed_query, read_keyed_query, selected_columns
+from queries_functions import COLUNAS_PARES, SELECT_GPS, TABELA_GPS, query_gps
+
+duckdb = pytest.importorskip('duckdb')
+
+
+@pytest.fixture
+def tabela_gps(tmp_path, monkeypatch):
+    """
+    Tabela de GPS local, no formato lido pelo backend duckdb, com 60 datas e 50 veículos.
+    """
+    gerador = np.random.default_rng(0)
+    datas = pd.date_range('2022-11-01', periods=60).date
+    n = 20000
+    gps = pd.DataFrame({
+        'data': gerador.choice(datas, n),
+        'id_veiculo': 'A' + pd.Series(gerador.integers(10000, 10050, n)).astype(str),
+        'servico': gerador.choice(['100', '232', 'SP805'], n),
+        'longitude': gerador.uniform(-43.8, -43.1, n),
+        'latitude': gerador.uniform(-23.0, -22.7, n),
+    })
+    gps['timestamp_gps'] = pd.to_datetime(gps['data']) + pd.to_timedelta(gerador.integers(0, 86400, n), unit='s')
+
+    diretorio = tmp_path / 'rj-smtr' / 'br_rj_riodejaneiro_veiculos' / 'gps_sppo'
+    diretorio.mkdir(parents=True)
+    gps.to_parquet(diretorio / 'gps.parquet', index=False)
+
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'diretorio_local', str(tmp_path))
+
+    return gps
+
+
+def test_read_keyed_query_matches_merge(tabela_gps):
+    pares = (tabela_gps.assign(data=tabela_gps['data'].astype(str), id_veiculo=tabela_gps['id_veiculo'].str[1:])
+             [['data', 'id_veiculo']].drop_duplicates().sample(1500, random_state=1))
+    # Pares sem sinais na tabela não retornam linhas
+    pares = pd.concat([pares, pd.DataFrame({'data': ['2022-11-05'], 'id_veiculo': ['99999']})], ignore_index=True)
+    assert pares['data'].nunique() > DATAS_POR_CONSULTA
+
+    consultas = []
+
+    def executar(q, parametros):
+        consultas.append(parametros)
+        return run_duckdb_query(q, parametros)
+
+    resultado = read_keyed_query(SELECT_GPS, TABELA_GPS, pares, COLUNAS_PARES, executar=executar)
+
+    # Uma consulta por grupo de até DATAS_POR_CONSULTA datas
+    assert len(consultas) == -(-pares['data'].nunique() // DATAS_POR_CONSULTA)
+
+    esperado = (tabela_gps.assign(data=tabela_gps['data'].astype(str), id_veiculo=tabela_gps['id_veiculo'].str[1:])
+                .merge(pares, on=['data', 'id_veiculo']))
+
+    colunas = selected_columns(SELECT_GPS)
+    assert list(resultado.columns) == colunas
+
+    resultado = resultado.assign(data=resultado['data'].astype(str)).sort_values(colunas).reset_index(drop=True)
+    esperado = esperado[colunas].sort_values(colunas).reset_index(drop=True)
+    pd.testing.assert_frame_equal(resultado, esperado, check_dtype=False)
+
+
+def test_build_keyed_query_parameters():
+    chaves = pd.DataFrame({'data': ['2022-11-02', '2022-11-01', '2022-11-02'], 'servico': ['100', '232', '100']})
+
+    q, parametros = build_keyed_query('data, servico', '`rj-smtr.projeto_subsidio_sppo.viagem_planejada`',
+                                      chaves, {'data': 'data', 'servico': 'servico'})
+
+    assert '@datas' in q and '@chaves' in q
+    datas, parametro_chaves = parametros
+    assert [valor['value'] for valor in datas['parameterValue']['arrayValues']] == ['2022-11-01', '2022-11-02']
+    assert len(parametro_chaves['parameterValue']['arrayValues']) == 3
+
+
+def test_read_keyed_query_without_keys_keeps_columns(tabela_gps):
+    pares = pd.DataFrame({'data': pd.Series(dtype=str), 'id_veiculo': pd.Series(dtype=str)})
+
+    resultado = read_keyed_query(SELECT_GPS, TABELA_GPS, pares, COLUNAS_PARES, executar=run_duckdb_query)
+
+    assert resultado.empty
+    assert list(resultado.columns) == ['data', 'id_veiculo', 'servico', 'timestamp_gps', 'longitude', 'latitude']
+
+    # A consulta de GPS sem pares retorna um dataframe vazio, sem erro na ordenação pelo timestamp
+    assert query_gps(pares).empty
@@ -0,0 +1,62 @@
+### --- Testes da verificação de viagens sobrepostas --- ###
+
+import numpy as np
+import pandas as pd
+import pytest
+from categorize_trips import remove_overlapping_trips
+
+
+def pairwise_duplicates(amostra: pd.DataFrame) -> set:
+    """
+    Regra de sobreposição comparando cada par de viagens do mesmo veículo: mesma partida, ou uma viagem
+    parte antes da chegada da outra e chega depois da partida da outra. A viagem que aparece depois na
+    amostra é a duplicada.
+    """
+    duplicadas = set()
+    for i, viagem in amostra.iterrows():
+        for j, outra in amostra.iterrows():
+            if j <= i or viagem['id_veiculo'] != outra['id_veiculo']:
+                continue
+            if (outra['datetime_partida'] == viagem['datetime_partida'] or
+                    (outra['datetime_partida'] < viagem['datetime_chegada'] and
+                     outra['datetime_chegada'] > viagem['datetime_partida'])):
+                duplicadas.add(j)
+
+    return duplicadas
+
+
+@pytest.mark.parametrize('semente', range(5))
+def test_matches_pairwise_rule(semente):
+    gerador = np.random.default_rng(semente)
+    n = 120
+    partida = pd.Timestamp('2023-01-01 20:00') + pd.to_timedelta(gerador.integers(0, 6 * 60, n), unit='m')
+    duracao = pd.to_timedelta(gerador.integers(0, 90, n), unit='m')
+    amostra = pd.DataFrame({
+        'id_veiculo': gerador.choice(['A1', 'B2', 'C3'], n),
+        'servico': '100',
+        'datetime_partida': partida,
+        'datetime_chegada': partida + duracao,
+    })
+
+    # Viagens que terminam após a meia-noite, registradas com a chegada no mesmo dia (chegada anterior à partida)
+    invertidas = gerador.random(n) < 0.1
+    amostra.loc[invertidas, 'datetime_chegada'] -= pd.Timedelta(days=1)
+
+    resultado = remove_overlapping_trips(amostra)
+
+    esperado = pairwise_duplicates(amostra)
+    assert set(resultado.index[resultado['status'] == 'Viagem duplicada na amostra']) == esperado
+
+
+def test_overnight_trip_is_not_rolled_over():
+    # A viagem que chega "antes" de partir não é comparada com a chegada no dia seguinte
+    amostra = pd.DataFrame({
+        'id_veiculo': ['A1', 'A1'],
+        'servico': ['100', '100'],
+        'datetime_partida': pd.to_datetime(['2023-01-01 23:30', '2023-01-01 23:50']),
+        'datetime_chegada': pd.to_datetime(['2023-01-01 00:20', '2023-01-02 00:30']),
+    })
+
+    resultado = remove_overlapping_trips(amostra)
+
+    assert resultado['status'].isna().all()
@@ -0,0 +1,36 @@
+### --- Testes das métricas das etapas --- ###
+
+import time
+import numpy as np
+from run_metrics import REGISTROS_METRICAS, configure_run_metrics, measured, metrics_summary
+
+
+@measured('alocar')
+def allocate(megabytes):
+    # Aloca e preenche o array (para que as páginas sejam usadas), mantém por um tempo e o libera
+    dados = np.ones(megabytes * 1024 ** 2 // 8)
+    time.sleep(0.3)
+    del dados
+
+
+@measured('somar')
+def add(a, b):
+    return a + b
+
+
+def test_memory_is_measured_per_call():
+    configure_run_metrics(None)
+
+    allocate(200)
+    add(1, 2)
+
+    alocar, somar = REGISTROS_METRICAS
+    # O pico da alocação é observado durante a chamada, e a memória é liberada no fim
+    assert alocar['pico_rss_mb'] - alocar['rss_inicio_mb'] > 150
+    assert alocar['pico_rss_mb'] - alocar['rss_fim_mb'] > 150
+    # O pico da chamada seguinte não inclui o pico da anterior
+    assert somar['pico_rss_mb'] < alocar['pico_rss_mb'] - 150
+
+    resumo = metrics_summary()
+    assert list(resumo.index) == ['alocar', 'somar']
+    assert 'aumento_rss_max_mb' in resumo.columns
@@ -0,0 +1,58 @@
+### --- Testes do armazenamento local das consultas por dia e veículo --- ###
+
+import pandas as pd
+import pytest
+from cache_files import CONFIGURACAO_CACHE
+from query_backends import CONFIGURACAO_BACKEND
+from slice_store import REGISTRO_DADOS, reset_registry, update_slices
+import queries_functions
+
+
+@pytest.fixture
+def diretorio_scripts(tmp_path, monkeypatch):
+    # As fatias são gravadas em ../data/cache, relativo ao diretório scripts
+    scripts = tmp_path / 'scripts'
+    scripts.mkdir()
+    monkeypatch.chdir(scripts)
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'backend', 'duckdb')
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'diretorio_local', str(tmp_path / 'local'))
+    reset_registry()
+    yield scripts
+    reset_registry()
+
+
+def gps_query(consultas):
+    def consultar(pares):
+        consultas.append(len(pares))
+        return pd.DataFrame({'data': pares['data'], 'id_veiculo': pares['id_veiculo'], 'servico': '100',
+                             'timestamp_gps': pd.to_datetime(pares['data']) + pd.Timedelta(hours=8),
+                             'longitude': -43.2, 'latitude': -22.9})
+    return consultar
+
+
+def test_gps_is_not_kept_in_the_registry(diretorio_scripts, monkeypatch):
+    consultas = []
+    monkeypatch.setattr(queries_functions, 'query_gps', gps_query(consultas))
+    pares = pd.DataFrame({'data': ['2022-11-20', '2022-11-21'], 'id_veiculo': ['10001', '10002']})
+
+    dados = queries_functions.fetch_gps(pares)
+    dados_novamente = queries_functions.fetch_gps(pares)
+
+    assert len(dados) == len(dados_novamente) == 2
+    assert consultas == [2]
+    assert 'dados_gps' not in REGISTRO_DADOS
+
+
+def test_refreshed_slices_are_queried_once_per_run(diretorio_scripts, monkeypatch):
+    consultas = []
+    monkeypatch.setitem(CONFIGURACAO_CACHE, 'atualizar', True)
+    pares = pd.DataFrame({'data': ['2022-11-20'], 'id_veiculo': ['10001']})
+
+    update_slices('dados_gps', pares, gps_query(consultas))
+    update_slices('dados_gps', pares, gps_query(consultas))
+    assert consultas == [1]
+
+    # Em uma nova execução, a opção de atualizar o cache consulta novamente os pares
+    reset_registry()
+    update_slices('dados_gps', pares, gps_query(consultas))
+    assert consultas == [1, 1]
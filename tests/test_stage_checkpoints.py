@@ -0,0 +1,85 @@
+### --- Testes dos checkpoints das etapas --- ###
+
+import os
+import pandas as pd
+import pytest
+from query_backends import CONFIGURACAO_BACKEND
+from stage_checkpoints import CONFIGURACAO_ETAPAS, DIRETORIO_ETAPAS, checkpointed_stage
+
+
+@pytest.fixture
+def diretorio_scripts(tmp_path, monkeypatch):
+    # Os checkpoints são gravados em ../data/cache/etapas, relativo ao diretório scripts
+    scripts = tmp_path / 'scripts'
+    scripts.mkdir()
+    monkeypatch.chdir(scripts)
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'backend', 'duckdb')
+    monkeypatch.setitem(CONFIGURACAO_BACKEND, 'diretorio_local', str(tmp_path / 'local'))
+    monkeypatch.setitem(CONFIGURACAO_ETAPAS, 'ativo', True)
+    monkeypatch.setitem(CONFIGURACAO_ETAPAS, 'atualizar', False)
+    return scripts
+
+
+def counted_stage(execucoes, versao='1.0', restaurar=None):
+    @checkpointed_stage('etapa_teste', versao, restaurar=restaurar)
+    def etapa(viagens, particao):
+        execucoes.append(particao)
+        return viagens.assign(status='Viagem identificada e já paga', servico_apurado=[('100',)] * len(viagens))
+
+    return etapa
+
+
+def sample(veiculos=('10001', '10002')) -> pd.DataFrame:
+    return pd.DataFrame({'id_veiculo_amostra': list(veiculos), 'data': '2022-11-20'})
+
+
+def test_hit_returns_the_stored_output_and_restores(diretorio_scripts):
+    execucoes, restauradas = [], []
+    saida = counted_stage(execucoes)(sample(), 0)
+
+    etapa = counted_stage(execucoes, restaurar=lambda guardada, *argumentos: restauradas.append((guardada, argumentos)))
+    guardada = etapa(sample(), particao=0)
+
+    assert execucoes == [0]
+    pd.testing.assert_frame_equal(guardada, saida)
+    assert guardada['servico_apurado'].tolist() == [('100',), ('100',)]
+
+    # restaurar recebe a saída guardada e os argumentos, na ordem da assinatura da etapa
+    assert len(restauradas) == 1
+    pd.testing.assert_frame_equal(restauradas[0][0], saida)
+    pd.testing.assert_frame_equal(restauradas[0][1][0], sample())
+    assert restauradas[0][1][1] == 0
+
+
+def test_changed_input_or_version_runs_the_stage(diretorio_scripts):
+    execucoes = []
+    counted_stage(execucoes)(sample(), 0)
+
+    counted_stage(execucoes)(sample(['10001', '10003']), 0)
+    counted_stage(execucoes)(sample(), 1)
+    counted_stage(execucoes, versao='1.1')(sample(), 0)
+
+    assert execucoes == [0, 0, 1, 0]
+    assert len(os.listdir(DIRETORIO_ETAPAS)) == 4
+
+
+def test_quota_evicts_the_least_recently_used(diretorio_scripts, monkeypatch):
+    execucoes = []
+    etapa = counted_stage(execucoes)
+    etapa(sample(), 0)
+    antigo, = os.listdir(DIRETORIO_ETAPAS)
+    etapa(sample(), 1)
+    recente, = set(os.listdir(DIRETORIO_ETAPAS)) - {antigo}
+
+    # O checkpoint da partição 0 foi usado há mais tempo
+    os.utime(os.path.join(DIRETORIO_ETAPAS, antigo), (1, 1))
+    os.utime(os.path.join(DIRETORIO_ETAPAS, recente), (2, 2))
+
+    # A cota comporta dois checkpoints: o novo é mantido e o usado há mais tempo é removido
+    tamanho = os.path.getsize(os.path.join(DIRETORIO_ETAPAS, recente))
+    monkeypatch.setitem(CONFIGURACAO_ETAPAS, 'cota_bytes', 2 * tamanho)
+    etapa(sample(), 2)
+
+    assert antigo not in os.listdir(DIRETORIO_ETAPAS)
+    assert recente in os.listdir(DIRETORIO_ETAPAS)
+    assert len(os.listdir(DIRETORIO_ETAPAS)) == 2